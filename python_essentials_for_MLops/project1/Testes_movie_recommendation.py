@@ -1,11 +1,38 @@
+import io
+import json
 import pytest
+import numpy as np
 import pandas as pd
-from movie_recommendation import load_data, clean_title, preprocess_data, calculate_tfidf, search, find_similar_movies
+import instrumentation
+from sklearn.metrics.pairwise import cosine_similarity
+from movie_recommendation import load_data, clean_title, preprocess_data, calculate_tfidf, load_tfidf, search, find_similar_movies, RecommenderEngine
+from ratings_store import load_ratings
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from recommendation_server import LRUCache, MicroBatcher, RecommendationService, handle_connection
+from title_search import TitleSearchIndex, clean_titles, top_k
+import movie_recommendation
+from synthetic_data import generate_movies, write_dataset
+from content_index import ContentIndex
+from similarity_index import (LikedRatingsIndex, iter_similar_movies_batch,
+                              similar_movie_scores_pandas, write_batch_parquet)
 
 def test_load_data():
     data = load_data("test_data.csv")
     assert data is None
 
+def test_load_ratings_cache(tmp_path):
+    csv_path = tmp_path / "ratings.csv"
+    csv_path.write_text("userId,movieId,rating,timestamp\n1,1,4.5,0\n2,1,3.0,0\n")
+    cache_dir = tmp_path / "cache"
+    first = load_ratings(csv_path, cache_dir=cache_dir)
+    second = load_ratings(csv_path, cache_dir=cache_dir)
+    assert list(first.columns) == ["userId", "movieId", "rating"]
+    assert str(second["userId"].dtype) == "int32"
+    assert str(second["rating"].dtype) == "float32"
+    assert second["rating"].tolist() == [4.5, 3.0]
+
 def test_clean_title():
     title = "Avatar (2009)"
     cleaned_title = clean_title(title)
@@ -23,15 +50,330 @@ def test_calculate_tfidf():
     assert tfidf is not None
     assert vectorizer is not None
 
+def test_load_tfidf_artifact(tmp_path):
+    movies_path = tmp_path / "movies.csv"
+    movies_path.write_text("movieId,title,genres\n1,Toy Story (1995),Animation\n2,Avatar (2009),Action\n")
+    artifact_dir = tmp_path / "artifact"
+    data = preprocess_data(load_data(movies_path))
+    fitted, fitted_vectorizer = load_tfidf(data, movies_path, artifact_dir)
+    loaded, loaded_vectorizer = load_tfidf(data, movies_path, artifact_dir)
+    assert (loaded != fitted).nnz == 0
+    assert loaded_vectorizer.vocabulary_ == fitted_vectorizer.vocabulary_
+    assert (loaded_vectorizer.transform(["toy story"]) != fitted_vectorizer.transform(["toy story"])).nnz == 0
+    # Um catálogo diferente invalida o artefato e força um novo ajuste.
+    movies_path.write_text("movieId,title,genres\n1,Jumanji (1995),Adventure\n")
+    data = preprocess_data(load_data(movies_path))
+    refitted, refitted_vectorizer = load_tfidf(data, movies_path, artifact_dir)
+    assert refitted.shape[0] == 1
+    assert "jumanji" in refitted_vectorizer.vocabulary_
+
 def test_search():
     data = pd.DataFrame({"title": ["Avatar (2009)"]})
     data = preprocess_data(data)  
     tfidf, vectorizer = calculate_tfidf(data)
     movies = data  
     results = search("Avatar (2009)", vectorizer, tfidf, movies)
-    assert not results
+    assert results["title"].tolist() == ["Avatar (2009)"]
+
+def test_instrumentation_records_stages():
+    data = preprocess_data(pd.DataFrame({"title": ["Avatar (2009)", "Toy Story (1995)"]}))
+    output = io.StringIO()
+    instrumentation.enable(output)
+    try:
+        tfidf, vectorizer = calculate_tfidf(data)
+        search("Avatar", vectorizer, tfidf, data, k=1)
+        with instrumentation.stage("custom") as measured:
+            measured.items = 7
+        with pytest.raises(ZeroDivisionError), instrumentation.stage("failing"):
+            1 / 0
+    finally:
+        instrumentation.disable()
+    search("Avatar", vectorizer, tfidf, data, k=1)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [record["stage"] for record in records] == [
+        "movie_recommendation.calculate_tfidf", "movie_recommendation.search",
+        "custom", "failing"]
+    assert [record["items"] for record in records] == [2, 1, 7, None]
+    assert [record["status"] for record in records] == ["ok", "ok", "ok", "error"]
+    assert all(record["wall_seconds"] >= 0 and record["peak_rss_kib"] > 0
+               for record in records)
+
+def test_search_returns_sorted_top_k():
+    titles = ["Toy Story (1995)", "Toy Story 2 (1999)", "Toy Story 3 (2010)",
+              "Story of Us (1999)", "Avatar (2009)", "Jumanji (1995)"]
+    data = preprocess_data(pd.DataFrame({"title": titles}))
+    tfidf, vectorizer = calculate_tfidf(data)
+    query = vectorizer.transform([clean_title("Toy Story 2")])
+    expected = np.argsort(-cosine_similarity(query, tfidf).ravel(), kind="stable")[:3]
+    results = search("Toy Story 2", vectorizer, tfidf, data, k=3)
+    assert results["title"].tolist() == data["title"].iloc[expected].tolist()
+
+def test_search_reuses_title_index():
+    data = preprocess_data(pd.DataFrame({"title": ["Toy Story (1995)", "Avatar (2009)"]}))
+    tfidf, vectorizer = calculate_tfidf(data)
+    search("Toy Story", vectorizer, tfidf, data, k=1)
+    engine = movie_recommendation.get_engine()
+    index = engine.title_index
+    assert search("Avatar", vectorizer, tfidf, data, k=1)["title"].tolist() == ["Avatar (2009)"]
+    assert engine.title_index is index
+    other_tfidf, other_vectorizer = calculate_tfidf(data)
+    search("Avatar", other_vectorizer, other_tfidf, data, k=1)
+    assert engine.title_index is not index
+    assert engine.title_index.vectorizer is other_vectorizer and engine.movies is data
+
+def test_top_k_breaks_boundary_ties_by_row():
+    candidates = np.array([7, 5, 3, 9, 1])
+    scores = np.array([0.5, 0.9, 0.5, 0.5, 0.5])
+    assert top_k(candidates, scores, 3).tolist() == [5, 1, 3]
+    assert top_k(candidates, scores, 10).tolist() == [5, 1, 3, 7, 9]
+
+def test_search_many_matches_search():
+    titles = ["Toy Story (1995)", "Toy Story 2 (1999)", "Avatar (2009)", "Jumanji (1995)"]
+    data = preprocess_data(pd.DataFrame({"title": titles}))
+    tfidf, vectorizer = calculate_tfidf(data)
+    index = TitleSearchIndex(vectorizer, tfidf, data)
+    queries = ["Toy Story", "Jumanji", "Zzzz"]
+    for query, result in zip(queries, index.search_many(queries, k=2)):
+        assert result["title"].tolist() == index.search(query, k=2)["title"].tolist()
+
+def test_clean_titles_matches_clean_title():
+    titles = pd.Series(["Avatar (2009)", "Amélie (2001)", "Se7en: Seven!"])
+    assert clean_titles(titles).tolist() == [clean_title(title) for title in titles]
+
+def test_add_movies_without_refit():
+    data = preprocess_data(pd.DataFrame({"movieId": [1, 2, 3], "title": [
+        "Toy Story (1995)", "Star Wars (1977)", "Avatar (2009)"]}))
+    tfidf, vectorizer = calculate_tfidf(data)
+    index = TitleSearchIndex(vectorizer, tfidf, data, drift_threshold=0.5)
+    refitted = index.add_movies(pd.DataFrame({"movieId": [4], "title": ["Toy Story (2009)"]}))
+    assert not refitted
+    assert index.vectorizer is vectorizer
+    assert index.postings.shape[0] == 4
+    assert 4 in index.search("Toy Story 2009", k=2)["movieId"].tolist()
+
+def test_add_movies_refits_on_drift():
+    data = preprocess_data(pd.DataFrame({"movieId": [1, 2], "title": [
+        "Toy Story (1995)", "Avatar (2009)"]}))
+    tfidf, vectorizer = calculate_tfidf(data)
+    index = TitleSearchIndex(vectorizer, tfidf, data, drift_threshold=0.1)
+    assert index.add_movies(pd.DataFrame({"movieId": [3], "title": ["Jumanji (1995)"]}))
+    assert "jumanji" in index.vectorizer.vocabulary_
+    assert index.drift == 0
+    assert index.search("Jumanji", k=1)["movieId"].tolist() == [3]
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+def test_micro_batcher_releases_and_fails_cancelled_batches():
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def slow(items):
+        time.sleep(0.1)
+        return items
+
+    async def run():
+        batcher = MicroBatcher(slow, executor, max_batch=1)
+        assert await batcher.submit(1) == 1
+        await asyncio.sleep(0)
+        assert not batcher._tasks  # pylint: disable=protected-access
+        submitted = asyncio.ensure_future(batcher.submit(2))
+        await asyncio.sleep(0)
+        (task,) = batcher._tasks  # pylint: disable=protected-access
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await submitted
+        assert not batcher._tasks  # pylint: disable=protected-access
+
+    asyncio.run(run())
+    executor.shutdown()
+
+def test_server_rejects_malformed_content_length():
+    async def run():
+        server = await asyncio.start_server(
+            lambda reader, writer: handle_connection(None, reader, writer), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /stats HTTP/1.1\r\nContent-Length: abc\r\n\r\n")
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+
+    response = asyncio.run(run())
+    assert response.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+    assert b"Connection: close" in response
+
+def test_search_without_matching_terms():
+    data = preprocess_data(pd.DataFrame({"title": ["Avatar (2009)", "Jumanji (1995)"]}))
+    tfidf, vectorizer = calculate_tfidf(data)
+    assert search("Zzzz", vectorizer, tfidf, data).empty
 
 def test_find_similar_movies():
     movie_id = 1
     similar_movies = find_similar_movies(movie_id)
     assert not similar_movies.empty
+
+def sample_ratings(seed, size=20000):
+    rng = np.random.default_rng(seed)
+    # Popularidade enviesada para que existam filmes acima do limiar de 10%.
+    return pd.DataFrame({
+        "userId": rng.integers(1, 800, size).astype(np.int32),
+        "movieId": (rng.zipf(1.5, size) % 300 + 1).astype(np.int32),
+        "rating": (rng.integers(1, 11, size) / 2).astype(np.float32),
+    }).drop_duplicates(["userId", "movieId"])
+
+def test_similar_movie_scores_match_pandas():
+    ratings = sample_ratings(42)
+    index = LikedRatingsIndex.from_ratings(ratings)
+    liked = ratings[ratings["rating"] > 4]["movieId"]
+    for movie_id in liked.value_counts().index[[0, 1, 2, 10, 50]]:
+        expected = similar_movie_scores_pandas(ratings, movie_id).sort_index()
+        result = index.similar_movie_scores(movie_id).sort_index()
+        assert len(result) > 0
+        assert result.index.tolist() == expected.index.tolist()
+        np.testing.assert_allclose(result[["similar", "all", "score"]].to_numpy(),
+                                   expected[["similar", "all", "score"]].to_numpy())
+
+def test_similar_movies_batch_matches_single():
+    ratings = sample_ratings(7)
+    index = LikedRatingsIndex.from_ratings(ratings)
+    seeds = index.movie_ids[:40]
+    # Orçamento mínimo força vários blocos de uma semente.
+    batch = pd.concat(iter_similar_movies_batch(index, seeds, top_k=5, memory_mb=0))
+    assert batch["seed_id"].unique().tolist() == seeds.tolist()
+    for seed_id, recs in batch.groupby("seed_id"):
+        expected = index.similar_movie_scores(seed_id)
+        expected = expected.sort_values("score", ascending=False).head(5)
+        assert len(recs) == len(expected)
+        np.testing.assert_allclose(recs["score"].to_numpy(), expected["score"].to_numpy())
+
+def test_similar_movies_batch_process_pool():
+    ratings = sample_ratings(11)
+    index = LikedRatingsIndex.from_ratings(ratings)
+    seeds = index.movie_ids[:30]
+    serial = pd.concat(iter_similar_movies_batch(index, seeds, top_k=5, memory_mb=0),
+                       ignore_index=True)
+    pooled = pd.concat(iter_similar_movies_batch(index, seeds, top_k=5, memory_mb=0, n_jobs=2),
+                       ignore_index=True)
+    pd.testing.assert_frame_equal(pooled, serial)
+
+def test_write_batch_parquet_without_seeds(tmp_path):
+    pytest.importorskip("pyarrow")
+    index = LikedRatingsIndex.from_ratings(sample_ratings(3))
+    output = write_batch_parquet(iter_similar_movies_batch(index, [], top_k=5),
+                                 tmp_path / "empty.parquet")
+    written = pd.read_parquet(output)
+    assert written.empty
+    assert list(written.columns) == ["seed_id", "rec_id", "score", "similar", "all"]
+
+def test_similar_movie_scores_unknown_movie():
+    ratings = pd.DataFrame({"userId": [1], "movieId": [1], "rating": [5.0]})
+    index = LikedRatingsIndex.from_ratings(ratings)
+    assert index.similar_movie_scores(99).empty
+
+def test_recommender_engine_loads_lazily(tmp_path):
+    movies_path = tmp_path / "movies.csv"
+    movies_path.write_text("movieId,title,genres\n1,Toy Story (1995),Animation\n"
+                           "2,Toy Story 2 (1999),Animation\n3,Avatar (2009),Action\n")
+    ratings_path = tmp_path / "ratings.csv"
+    ratings_path.write_text("userId,movieId,rating,timestamp\n1,1,5.0,0\n1,2,5.0,0\n"
+                            "2,1,4.5,0\n2,2,5.0,0\n3,3,5.0,0\n")
+    engine = RecommenderEngine(movies_path, ratings_path, tmp_path / "ratings_cache",
+                               tmp_path / "tfidf_artifact")
+    assert "movies" not in vars(engine)
+    assert "ratings_index" not in vars(engine)
+    assert engine.search("Toy Story", k=2)["movieId"].tolist() == [1, 2]
+    assert "ratings_index" not in vars(engine)
+    similar = engine.find_similar_movies(1)
+    assert similar["title"].tolist() == ["Toy Story (1995)", "Toy Story 2 (1999)"]
+    assert engine.warm_up()
+
+def _similar_engine(tmp_path):
+    movies_path = tmp_path / "movies.csv"
+    movies_path.write_text("movieId,title,genres\n1,Toy Story (1995),Animation\n"
+                           "2,Toy Story 2 (1999),Animation\n3,Avatar (2009),Action\n")
+    ratings_path = tmp_path / "ratings.csv"
+    ratings_path.write_text("userId,movieId,rating,timestamp\n1,1,5.0,0\n1,2,5.0,0\n"
+                            "2,1,4.5,0\n2,2,5.0,0\n3,3,5.0,0\n3,1,5.0,0\n")
+    return RecommenderEngine(movies_path, ratings_path, tmp_path / "ratings_cache",
+                             tmp_path / "tfidf_artifact")
+
+def test_find_similar_movies_many_duplicate_ids(tmp_path):
+    engine = _similar_engine(tmp_path)
+    results = engine.find_similar_movies_many([1, 1, 3, 99])
+    assert list(results) == [1, 3, 99]
+    for movie_id in (1, 3):
+        expected = engine.find_similar_movies(movie_id)
+        assert results[movie_id]["title"].tolist() == expected["title"].tolist()
+    assert results[99].empty
+
+def test_similar_service_duplicate_requests(tmp_path):
+    engine = _similar_engine(tmp_path)
+    batches = []
+    many = engine.find_similar_movies_many
+    engine.find_similar_movies_many = lambda movie_ids: batches.append(movie_ids) or many(movie_ids)
+    service = RecommendationService(engine, max_delay=0.01)
+
+    async def requests():
+        return await asyncio.gather(service.similar(1), service.similar(1), service.similar(3))
+
+    first, second, third = asyncio.run(requests())
+    assert batches == [[1, 3]]
+    expected = engine.find_similar_movies(1)["title"].tolist()
+    assert [record["title"] for record in first] == expected
+    assert second == first
+    assert [record["movieId"] for record in third] == [3, 1]
+    assert service.similar_cache.get(1) == first
+
+def test_content_index_matches_exact():
+    movies = preprocess_data(generate_movies(2000))
+    tfidf, vectorizer = calculate_tfidf(movies)
+    index = ContentIndex(movies, vectorizer, tfidf, dim=32)
+    recalls = []
+    for row in range(0, 2000, 50):
+        query = index.vector(row)
+        exact_rows, exact_scores = index.search_exact(query, k=10, exclude=row)
+        assert row not in exact_rows
+        assert np.all(np.diff(exact_scores) <= 0)
+        rows, _ = index.search_vector(query, k=10, n_probe=len(index.centroids), exclude=row)
+        assert rows.tolist() == exact_rows.tolist()
+        rows, _ = index.search_vector(query, k=10, exclude=row)
+        recalls.append(len(set(rows) & set(exact_rows)) / 10)
+    assert np.mean(recalls) >= 0.9
+
+def test_find_similar_by_content_cold_movies(tmp_path):
+    movies_path = tmp_path / "movies.csv"
+    generate_movies(300).to_csv(movies_path, index=False)
+    engine = RecommenderEngine(movies_path, tmp_path / "missing.csv", tmp_path / "ratings_cache",
+                               tmp_path / "tfidf_artifact")
+    similar = engine.find_similar_by_content(1, top_k=5)
+    assert list(similar.columns) == ["score", "title", "genres"]
+    assert len(similar) == 5 and engine.movies["title"].iloc[0] not in similar["title"].tolist()
+    assert "ratings_index" not in vars(engine)
+    first = engine.movies.iloc[0]
+    refitted = engine.add_movies(pd.DataFrame({"movieId": [1001], "genres": [first["genres"]],
+                                               "title": [first["clean_title"] + " (2030)"]}))
+    assert refitted is False
+    assert len(engine.content_index.movies) == 301
+    assert engine.find_similar_by_content(1001, top_k=1)["title"].tolist() == [first["title"]]
+    assert engine.find_similar_by_content(99999) is None
+
+def test_synthetic_dataset_shape(tmp_path):
+    movies_path, ratings_path = write_dataset(tmp_path, n_users=50, n_movies=40,
+                                              n_ratings=5000, chunk_size=2000)
+    movies = load_data(movies_path)
+    ratings = load_data(ratings_path)
+    assert list(movies.columns) == ["movieId", "title", "genres"]
+    assert list(ratings.columns) == ["userId", "movieId", "rating", "timestamp"]
+    assert len(ratings) == 5000
+    assert ratings["movieId"].between(1, 40).all()
+    # Popularidade de Zipf: o filme mais avaliado concentra bem mais que a média.
+    assert ratings["movieId"].value_counts().iloc[0] > 3 * len(ratings) / 40
@@ -0,0 +1,512 @@
+"""
+benchmark_movie_recommendation.py - Benchmarks do sistema de recomendação de filmes.
+
+Uso:
+    python benchmark_movie_recommendation.py --ratings ml-25m/ratings.csv --movies ml-25m/movies.csv
+    python benchmark_movie_recommendation.py --suite small,medium --output results.json
+    python benchmark_movie_recommendation.py --content --movies ml-25m/movies.csv
+
+Cada estratégia de carregamento, e cada escala da suíte, roda em um processo
+separado para que o pico de memória (RSS) de uma não contamine a medição da outra.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import cProfile
+import pstats
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from io import StringIO
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, urlsplit
+
+from ratings_store import CACHE_MANIFEST, load_ratings
+from synthetic_data import SCALES, write_dataset
+
+RATINGS_USE = 'items = int((ratings["rating"] > 4).sum())\n'
+TFIDF_USE = 'items = (tfidf @ vectorizer.transform(["toy story"]).T).nnz\n'
+
+# Código de carregamento e de uso (que toca os dados carregados) de cada estratégia.
+LOADERS = {
+    "pandas": (
+        "import pandas as pd\n"
+        "ratings = pd.read_csv(PATH)\n",
+        RATINGS_USE,
+    ),
+    "compact": (
+        "from ratings_store import load_ratings\n"
+        "ratings = load_ratings(PATH)\n",
+        RATINGS_USE,
+    ),
+    "cache": (
+        "from ratings_store import load_ratings\n"
+        "ratings = load_ratings(PATH, cache_dir=CACHE_DIR)\n",
+        RATINGS_USE,
+    ),
+    "tfidf fit": (
+        "import pandas as pd\n"
+        "from sklearn.feature_extraction.text import TfidfVectorizer\n"
+        "from title_search import clean_title\n"
+        "movies = pd.read_csv(PATH)\n"
+        "movies['clean_title'] = movies['title'].apply(clean_title)\n"
+        "vectorizer = TfidfVectorizer(ngram_range=(1, 2))\n"
+        "tfidf = vectorizer.fit_transform(movies['clean_title'])\n",
+        TFIDF_USE,
+    ),
+    "tfidf artifact": (
+        "from title_search import file_sha256, load_tfidf_artifact\n"
+        "tfidf, vectorizer = load_tfidf_artifact(CACHE_DIR, file_sha256(PATH))\n",
+        TFIDF_USE,
+    ),
+}
+
+CHILD_TEMPLATE = """
+import json, resource, time
+PATH = {path!r}
+CACHE_DIR = {cache_dir!r}
+start = time.perf_counter()
+{loader}
+load_seconds = time.perf_counter() - start
+load_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+{use}
+print(json.dumps({{"load_seconds": load_seconds,
+                  "load_peak_rss_kb": load_rss,
+                  "use_peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  "items": items}}))
+"""
+
+
+def run_loader(name, path, cache_dir):
+    """
+    Executa um carregador em um subprocesso e retorna suas medições.
+    """
+    loader, use = LOADERS[name]
+    code = CHILD_TEMPLATE.format(path=os.path.abspath(path),
+                                 cache_dir=os.path.abspath(cache_dir),
+                                 loader=loader, use=use)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+                            capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result["startup_seconds"] = time.perf_counter() - start
+    result["loader"] = name
+    return result
+
+
+def benchmark_load_ratings(path, cache_dir):
+    """
+    Compara o carregamento atual (pd.read_csv) com o compacto e o cache mapeado.
+    """
+    results = [run_loader("pandas", path, cache_dir),
+               run_loader("compact", path, cache_dir)]
+    # Primeira execução com cache: converte o CSV; a segunda mede o início a quente.
+    manifest_path = os.path.join(cache_dir, CACHE_MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    cold = run_loader("cache", path, cache_dir)
+    cold["loader"] = "cache (conversão)"
+    results.append(cold)
+    results.append(run_loader("cache", path, cache_dir))
+    return results
+
+
+def benchmark_load_tfidf(movies_path, artifact_dir):
+    """
+    Compara o início a frio ajustando o TF-IDF com o carregamento do artefato salvo.
+    """
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+    from title_search import file_sha256, save_tfidf_artifact
+    from movie_recommendation import calculate_tfidf, preprocess_data
+
+    tfidf, vectorizer = calculate_tfidf(preprocess_data(pd.read_csv(movies_path)))
+    save_tfidf_artifact(vectorizer, tfidf, artifact_dir, file_sha256(movies_path))
+    return [run_loader("tfidf fit", movies_path, artifact_dir),
+            run_loader("tfidf artifact", movies_path, artifact_dir)]
+
+
+DEFAULT_QUERIES = ["Toy Story", "Jumanji", "Heat", "Casino", "Star Wars",
+                   "The Matrix", "Pulp Fiction", "Forrest Gump", "Fargo", "Alien"]
+
+
+async def _http_get(reader, writer, host, path):
+    """
+    Envia um GET com keep-alive e retorna o status da resposta.
+    """
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def _load_worker(url, paths, latencies, errors):
+    """
+    Consome caminhos da fila em uma conexão persistente, registrando as latências.
+    """
+    reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+    try:
+        while paths:
+            path = paths.pop()
+            start = time.perf_counter()
+            status = await _http_get(reader, writer, url.netloc, path)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def _run_load(base_url, paths, concurrency):
+    """
+    Dispara as requisições com `concurrency` conexões simultâneas.
+    """
+    url = urlsplit(base_url)
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[_load_worker(url, paths, latencies, errors)
+                           for _ in range(concurrency)])
+    return latencies, errors, time.perf_counter() - start
+
+
+def benchmark_server(base_url, requests=2000, concurrency=32, queries=None,
+                     movie_ids=None, seed=42):
+    """
+    Gera carga contra o servidor de recomendação e mede latência e vazão.
+    """
+    rng = random.Random(seed)
+    queries = queries or DEFAULT_QUERIES
+    movie_ids = movie_ids or list(range(1, 1000))
+    paths = [f"/search?q={quote(rng.choice(queries))}" if rng.random() < 0.5
+             else f"/similar/{rng.choice(movie_ids)}" for _ in range(requests)]
+    latencies, errors, elapsed = asyncio.run(_run_load(base_url, paths, concurrency))
+    percentiles = statistics.quantiles(latencies, n=100)
+    return [{"loader": f"server x{concurrency}", "requests": len(latencies),
+             "errors": len(errors), "throughput_rps": len(latencies) / elapsed,
+             "p50_ms": percentiles[49] * 1000, "p99_ms": percentiles[98] * 1000}]
+
+
+def print_server_results(results):
+    """
+    Exibe os resultados do teste de carga em forma de tabela.
+    """
+    print(f"{'loader':<20}{'requests':>10}{'errors':>8}{'req/s':>10}"
+          f"{'p50 (ms)':>10}{'p99 (ms)':>10}")
+    for result in results:
+        print(f"{result['loader']:<20}{result['requests']:>10}{result['errors']:>8}"
+              f"{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.2f}"
+              f"{result['p99_ms']:>10.2f}")
+
+
+def _rss_mb():
+    """
+    Pico de RSS do processo até agora, em MB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_stage(name, func, items=None, profile=None):
+    """
+    Executa uma etapa medindo tempo de parede, tempo de CPU e pico de RSS.
+
+    Com `profile="cprofile"` guarda as funções mais custosas da etapa; com
+    `profile="tracemalloc"` guarda o pico de alocações e as linhas que mais alocaram.
+    Retorna (resultado da etapa, medições).
+    """
+    rss_before = _rss_mb()
+    profiler = cProfile.Profile() if profile == "cprofile" else None
+    if profile == "tracemalloc":
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    result = func()
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    record = {"stage": name, "seconds": wall, "cpu_seconds": cpu,
+              "peak_rss_mb": _rss_mb(), "rss_growth_mb": _rss_mb() - rss_before}
+    if items is not None:
+        record["items"] = items
+        record["ms_per_item"] = wall * 1000 / max(items, 1)
+    if profiler is not None:
+        profiler.disable()
+        output = StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(15)
+        record["profile"] = output.getvalue().splitlines()
+    if profile == "tracemalloc":
+        snapshot = tracemalloc.take_snapshot()
+        record["tracemalloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        record["top_allocations"] = [str(stat) for stat in
+                                     snapshot.statistics("lineno")[:10]]
+        tracemalloc.stop()
+    return result, record
+
+
+def run_suite_scale(name, params, movies_path, ratings_path, queries=200, seeds=50,
+                    profile=None):
+    """
+    Mede cada etapa do recomendador sobre os dados sintéticos de uma escala.
+    """
+    # pylint: disable=import-outside-toplevel,unused-import
+    # O sklearn é importado antes para que a importação não conte no calculate_tfidf.
+    import sklearn.feature_extraction.text
+    from movie_recommendation import (RecommenderEngine, calculate_tfidf,
+                                      load_data, preprocess_data)
+    from similarity_index import LikedRatingsIndex
+    from title_search import TitleSearchIndex
+
+    stages = []
+
+    def stage(stage_name, func, items=None):
+        result, record = measure_stage(stage_name, func, items, profile)
+        stages.append(record)
+        return result
+
+    movies = stage("load_data", lambda: load_data(movies_path))
+    ratings = stage("load_ratings", lambda: load_ratings(ratings_path))
+    movies = stage("preprocess_data", lambda: preprocess_data(movies))
+    tfidf, vectorizer = stage("calculate_tfidf", lambda: calculate_tfidf(movies))
+    engine = RecommenderEngine(movies_path, ratings_path)
+    engine.movies = movies
+    engine.title_index = stage("title_index",
+                               lambda: TitleSearchIndex(vectorizer, tfidf, movies))
+    engine.ratings_index = stage("ratings_index",
+                                 lambda: LikedRatingsIndex.from_ratings(ratings))
+    titles = movies["title"].sample(queries, replace=True, random_state=42).tolist()
+    stage("search", lambda: [engine.search(title) for title in titles], len(titles))
+    seed_ids = engine.ratings_index.movie_ids[:seeds]
+    stage("find_similar_movies",
+          lambda: [engine.find_similar_movies(seed) for seed in seed_ids], len(seed_ids))
+    return {"scale": name, **params, "stages": stages}
+
+
+def benchmark_suite(scales, work_dir=None, queries=200, seeds=50, profile=None):
+    """
+    Roda a suíte para cada escala em um processo novo e retorna o relatório.
+    """
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        results = []
+        for name, params in scales.items():
+            paths = write_dataset(os.path.join(tmp_dir, name), **params)
+            with ProcessPoolExecutor(max_workers=1,
+                                     mp_context=get_context("spawn")) as executor:
+                results.append(executor.submit(run_suite_scale, name, params, *paths,
+                                               queries, seeds, profile).result())
+    return {"python": platform.python_version(), "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "profile": profile,
+            "scales": results}
+
+
+def compare_reports(report, baseline, tolerance=0.2):
+    """
+    Lista as etapas que ficaram mais lentas que o relatório de referência.
+
+    Só compara relatórios gerados com o mesmo modo de perfilamento.
+    """
+    if report.get("profile") != baseline.get("profile"):
+        return []
+    reference = {(scale["scale"], stage["stage"]): stage["seconds"]
+                 for scale in baseline["scales"] for stage in scale["stages"]}
+    regressions = []
+    for scale in report["scales"]:
+        for stage in scale["stages"]:
+            before = reference.get((scale["scale"], stage["stage"]))
+            if before and stage["seconds"] > before * (1 + tolerance):
+                regressions.append({"scale": scale["scale"], "stage": stage["stage"],
+                                    "before": before, "after": stage["seconds"]})
+    return regressions
+
+
+def _recall(found, expected):
+    """
+    Fração dos vizinhos exatos que a busca aproximada encontrou.
+    """
+    return len(set(found.tolist()) & set(expected.tolist())) / max(len(expected), 1)
+
+
+def benchmark_content_index(movies, queries=500, k=10, probes=(1, 2, 4, 8, 16), dim=None):
+    """
+    Mede a construção, a latência e o recall@k do índice de conteúdo.
+
+    Para cada `n_probe`, o recall é medido contra a força bruta sobre os
+    mesmos vetores (erro do IVF) e contra o cosseno exato nos atributos
+    esparsos de título e gêneros (erro do IVF somado ao do SVD); `dim` é a
+    dimensão dos vetores (padrão: `content_index.EMBEDDING_DIM`).
+    """
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+    from movie_recommendation import calculate_tfidf, preprocess_data
+    from content_index import EMBEDDING_DIM, ContentIndex
+
+    movies = preprocess_data(movies)
+    tfidf, vectorizer = calculate_tfidf(movies)
+    index, build = measure_stage("content_index", lambda: ContentIndex(
+        movies, vectorizer, tfidf, dim=dim or EMBEDDING_DIM))
+    features = index.features(tfidf.tocsr(), movies["genres"])
+    norms = np.sqrt(np.asarray(features.multiply(features).sum(axis=1)).ravel())
+    rows = np.random.default_rng(42).choice(len(movies), min(queries, len(movies)), replace=False)
+
+    def timed(search):
+        start = time.perf_counter()
+        found = [search(row) for row in rows]
+        return found, (time.perf_counter() - start) * 1000 / len(rows)
+
+    exact, exact_ms = timed(lambda row: index.search_exact(index.vector(row), k, exclude=row)[0])
+    sparse_exact = []
+    for row in rows:
+        scores = (features @ features[row].T).toarray().ravel() / np.maximum(norms * norms[row], 1e-12)
+        scores[row] = -np.inf
+        sparse_exact.append(np.argsort(-scores, kind="stable")[:k])
+    results = [{"search": "exact", "n_probe": None, "ms_per_query": exact_ms,
+                "recall": 1.0, "recall_sparse": statistics.mean(map(_recall, exact, sparse_exact))}]
+    for n_probe in probes:
+        found, ms_per_query = timed(lambda row, n_probe=n_probe: index.search_vector(
+            index.vector(row), k, n_probe, exclude=row)[0])
+        results.append({"search": "ivf", "n_probe": n_probe, "ms_per_query": ms_per_query,
+                        "recall": statistics.mean(map(_recall, found, exact)),
+                        "recall_sparse": statistics.mean(map(_recall, found, sparse_exact))})
+    return {"movies": len(movies), "k": k, "dim": index.vectors.shape[1],
+            "n_lists": len(index.centroids),
+            "build_seconds": build["seconds"], "results": results}
+
+
+def print_content_results(report):
+    """
+    Exibe o recall@k e a latência do índice de conteúdo.
+    """
+    print(f"{report['movies']} filmes, {report['dim']} dimensões, {report['n_lists']} listas, "
+          f"construção em {report['build_seconds']:.2f}s")
+    print(f"{'search':<8}{'n_probe':>8}{'ms/query':>10}"
+          f"{'recall@' + str(report['k']):>12}{'vs sparse':>12}")
+    for result in report["results"]:
+        n_probe = "-" if result["n_probe"] is None else result["n_probe"]
+        print(f"{result['search']:<8}{n_probe:>8}{result['ms_per_query']:>10.3f}"
+              f"{result['recall']:>12.3f}{result['recall_sparse']:>12.3f}")
+
+
+def print_suite_results(report):
+    """
+    Exibe os resultados da suíte em forma de tabela.
+    """
+    print(f"{'scale':<8}{'stage':<22}{'wall (s)':>10}{'cpu (s)':>10}"
+          f"{'ms/item':>10}{'peak RSS (MB)':>16}")
+    for scale in report["scales"]:
+        for stage in scale["stages"]:
+            per_item = f"{stage['ms_per_item']:.2f}" if "ms_per_item" in stage else "-"
+            print(f"{scale['scale']:<8}{stage['stage']:<22}{stage['seconds']:>10.3f}"
+                  f"{stage['cpu_seconds']:>10.3f}{per_item:>10}"
+                  f"{stage['peak_rss_mb']:>16.1f}")
+
+
+def print_results(results):
+    """
+    Exibe os resultados em forma de tabela.
+    """
+    print(f"{'loader':<20}{'startup (s)':>14}{'load (s)':>12}"
+          f"{'peak RSS (MB)':>16}{'use RSS (MB)':>16}")
+    for result in results:
+        print(f"{result['loader']:<20}{result['startup_seconds']:>14.2f}"
+              f"{result['load_seconds']:>12.2f}"
+              f"{result['load_peak_rss_kb'] / 1024:>16.1f}"
+              f"{result['use_peak_rss_kb'] / 1024:>16.1f}")
+
+
+def main():
+    """
+    Função principal dos benchmarks.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ratings", help="caminho do ratings.csv")
+    parser.add_argument("--movies", help="caminho do movies.csv")
+    parser.add_argument("--cache-dir", default=None,
+                        help="diretório dos caches (padrão: ao lado dos CSVs)")
+    parser.add_argument("--server", help="URL do recommendation_server para o teste de carga")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--suite",
+                        help="escalas sintéticas separadas por vírgula: "
+                             + ", ".join(SCALES) + " ou 'custom'")
+    parser.add_argument("--users", type=int, help="usuários da escala 'custom'")
+    parser.add_argument("--movie-count", type=int, help="filmes da escala 'custom'")
+    parser.add_argument("--rating-count", type=int, help="avaliações da escala 'custom'")
+    parser.add_argument("--profile", choices=["cprofile", "tracemalloc"],
+                        help="perfila cada etapa da suíte")
+    parser.add_argument("--output", help="grava o relatório da suíte em JSON")
+    parser.add_argument("--baseline", help="relatório JSON anterior para comparar")
+    parser.add_argument("--content", action="store_true",
+                        help="recall@k e latência do índice de conteúdo (usa --movies ou "
+                             "um catálogo sintético de --movie-count filmes)")
+    parser.add_argument("--content-dim", type=int, help="dimensão dos vetores de conteúdo")
+    args = parser.parse_args()
+    if args.content:
+        # pylint: disable=import-outside-toplevel
+        import pandas as pd
+        from synthetic_data import generate_movies
+        movies = (pd.read_csv(args.movies) if args.movies
+                  else generate_movies(args.movie_count or SCALES["large"]["n_movies"]))
+        print_content_results(benchmark_content_index(movies, dim=args.content_dim))
+        return
+    if args.suite:
+        scales = {}
+        for name in args.suite.split(","):
+            if name == "custom":
+                if None in (args.users, args.movie_count, args.rating_count):
+                    parser.error("a escala 'custom' exige --users, --movie-count e --rating-count")
+                scales[name] = {"n_users": args.users, "n_movies": args.movie_count,
+                                "n_ratings": args.rating_count}
+            else:
+                scales[name] = SCALES[name]
+        report = benchmark_suite(scales, work_dir=args.cache_dir, profile=args.profile)
+        print_suite_results(report)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as output_file:
+                json.dump(report, output_file, indent=2)
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as baseline_file:
+                for regression in compare_reports(report, json.load(baseline_file)):
+                    print(f"REGRESSÃO {regression['scale']}/{regression['stage']}: "
+                          f"{regression['before']:.3f}s -> {regression['after']:.3f}s")
+        return
+    if args.server:
+        queries = None
+        if args.movies:
+            import pandas as pd  # pylint: disable=import-outside-toplevel
+            queries = pd.read_csv(args.movies)["title"].sample(
+                1000, replace=True, random_state=42).tolist()
+        print_server_results(benchmark_server(args.server, args.requests,
+                                              args.concurrency, queries))
+        return
+    results = []
+    if args.ratings:
+        cache_dir = args.cache_dir or os.path.dirname(os.path.abspath(args.ratings))
+        results += benchmark_load_ratings(args.ratings,
+                                          os.path.join(cache_dir, "ratings_cache"))
+    if args.movies:
+        cache_dir = args.cache_dir or os.path.dirname(os.path.abspath(args.movies))
+        results += benchmark_load_tfidf(args.movies,
+                                        os.path.join(cache_dir, "tfidf_artifact"))
+    if not results:
+        parser.error("informe --ratings, --movies, --server, --suite ou --content")
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+content_index.py - Filmes similares por conteúdo (título e gêneros).
+
+Não depende das avaliações, então filmes novos ou sem avaliações também têm
+vizinhos. Cada filme é representado pelo TF-IDF do título (o mesmo do índice
+de busca) junto com os seus gêneros, reduzido com TruncatedSVD a um vetor
+denso normalizado; a similaridade é o cosseno (produto escalar).
+
+A busca é aproximada, com um índice IVF: os vetores são agrupados pelo
+K-Means em listas, guardadas contíguas na memória, e cada consulta só pontua
+as `n_probe` listas de centróide mais próximo.
+"""
+
+import numpy as np
+from scipy import sparse
+
+from title_search import clean_titles, top_k
+
+EMBEDDING_DIM = 64
+N_PROBE = 8
+# Peso do vetor de gêneros em relação ao do título (ambos normalizados).
+GENRE_WEIGHT = 1.0
+NO_GENRES = "(no genres listed)"
+RANDOM_STATE = 42
+
+
+def genre_lists(genres):
+    """
+    Separa a coluna `genres` ("Action|Comedy") em listas de gêneros.
+    """
+    return [[] if not isinstance(value, str) or value == NO_GENRES else value.split("|")
+            for value in genres]
+
+
+def _normalize_rows(matrix):
+    """
+    Normaliza as linhas de uma matriz densa (L2); linhas nulas ficam nulas.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class ContentIndex:
+    """
+    Índice IVF dos vetores de conteúdo dos filmes.
+    """
+
+    def __init__(self, movies, vectorizer, title_tfidf, dim=EMBEDDING_DIM, n_lists=None,
+                 n_probe=N_PROBE, genre_weight=GENRE_WEIGHT, random_state=RANDOM_STATE):
+        # Importados sob demanda: o sklearn só é necessário ao construir o índice.
+        from sklearn.cluster import KMeans  # pylint: disable=import-outside-toplevel
+        from sklearn.decomposition import TruncatedSVD  # pylint: disable=import-outside-toplevel
+
+        self.movies = movies.reset_index(drop=True)
+        self.vectorizer = vectorizer
+        self.genre_weight = genre_weight
+        self.n_probe = n_probe
+        self.genres = sorted({genre for genres in genre_lists(self.movies["genres"])
+                              for genre in genres})
+        features = self.features(sparse.csr_matrix(title_tfidf), self.movies["genres"])
+        self.svd = TruncatedSVD(n_components=max(1, min(dim, features.shape[1] - 1)),
+                                random_state=random_state)
+        vectors = _normalize_rows(self.svd.fit_transform(features)).astype(np.float32)
+        n_lists = n_lists or int(np.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(vectors)))
+        kmeans = KMeans(n_clusters=n_lists, n_init=1, max_iter=20,
+                        random_state=random_state).fit(vectors)
+        self.centroids = _normalize_rows(kmeans.cluster_centers_).astype(np.float32)
+        self._build_lists(vectors)
+
+    def features(self, title_tfidf, genres):
+        """
+        Junta o TF-IDF do título e os gêneros (normalizados) em uma matriz esparsa.
+        """
+        positions = {genre: column for column, genre in enumerate(self.genres)}
+        rows, columns = [], []
+        for row, movie_genres in enumerate(genre_lists(genres)):
+            for genre in movie_genres:
+                if genre in positions:
+                    rows.append(row)
+                    columns.append(positions[genre])
+        genre_matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)),
+                                         shape=(len(genres), len(self.genres)))
+        counts = np.maximum(np.asarray(genre_matrix.sum(axis=1)).ravel(), 1)
+        genre_matrix = sparse.diags(self.genre_weight / np.sqrt(counts)) @ genre_matrix
+        return sparse.hstack([title_tfidf, genre_matrix], format="csr")
+
+    def _build_lists(self, vectors):
+        """
+        Agrupa os vetores por lista, contíguos, e guarda os limites de cada lista.
+        """
+        assignments = (vectors @ self.centroids.T).argmax(axis=1)
+        self.order = np.argsort(assignments, kind="stable")
+        self.vectors = np.ascontiguousarray(vectors[self.order])
+        self.offsets = np.searchsorted(assignments[self.order],
+                                       np.arange(len(self.centroids) + 1))
+        self.positions = np.empty(len(self.order), dtype=np.int64)
+        self.positions[self.order] = np.arange(len(self.order))
+
+    def embed(self, movies_data):
+        """
+        Vetores de conteúdo de filmes quaisquer, com o vocabulário e o SVD atuais.
+        """
+        title_tfidf = self.vectorizer.transform(clean_titles(movies_data["title"]))
+        features = self.features(title_tfidf, movies_data["genres"])
+        return _normalize_rows(self.svd.transform(features)).astype(np.float32)
+
+    def add_movies(self, movies_data):
+        """
+        Acrescenta filmes ao índice sem reajustar o SVD nem os centróides.
+        """
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+
+        vectors = np.empty((len(self.order) + len(movies_data), self.vectors.shape[1]),
+                           dtype=np.float32)
+        vectors[self.order] = self.vectors
+        vectors[len(self.order):] = self.embed(movies_data)
+        self.movies = pd.concat([self.movies, movies_data[["movieId", "title", "genres"]]],
+                                ignore_index=True)
+        self._build_lists(vectors)
+
+    def vector(self, row):
+        """
+        Vetor de conteúdo de uma linha do catálogo.
+        """
+        return self.vectors[self.positions[row]]
+
+    def search_vector(self, query, k=10, n_probe=None, exclude=None):
+        """
+        Retorna (linhas do catálogo, similaridades) dos `k` vizinhos aproximados.
+
+        Só as `n_probe` listas de centróide mais próximo da consulta são
+        pontuadas; `exclude` é uma linha do catálogo a ignorar (o próprio filme).
+        """
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        if n_probe < len(centroid_scores):
+            lists = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        else:
+            lists = np.arange(len(centroid_scores))
+        starts, ends = self.offsets[lists], self.offsets[lists + 1]
+        candidates = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        scores = self.vectors[candidates] @ query
+        rows = self.order[candidates]
+        if exclude is not None:
+            keep = rows != exclude
+            rows, scores = rows[keep], scores[keep]
+        top = top_k(np.arange(len(rows)), scores, k)
+        return rows[top], scores[top]
+
+    def search_exact(self, query, k=10, exclude=None):
+        """
+        Busca exata (força bruta) sobre todos os vetores, para comparação.
+        """
+        scores = self.vectors @ query
+        rows = self.order
+        if exclude is not None:
+            keep = rows != exclude
+            rows, scores = rows[keep], scores[keep]
+        top = top_k(np.arange(len(rows)), scores, k)
+        return rows[top], scores[top]
+
+    def similar(self, movie_id, k=10, n_probe=None):
+        """
+        Os `k` filmes mais parecidos em título e gêneros, com score, title e genres.
+        """
+        matches = np.flatnonzero(self.movies["movieId"].to_numpy() == movie_id)
+        if not len(matches):
+            raise KeyError(movie_id)
+        row = matches[0]
+        rows, scores = self.search_vector(self.vector(row), k, n_probe, exclude=row)
+        result = self.movies.iloc[rows][["title", "genres"]].copy()
+        result.insert(0, "score", scores)
+        return result
@@ -0,0 +1,171 @@
+"""
+instrumentation.py - Medição de tempo e memória das etapas dos pipelines.
+
+Cada projeto tem uma cópia idêntica deste arquivo, para que a pasta funcione
+sozinha (copiada para a pasta dags/ do Airflow, por exemplo); ao alterá-lo,
+altere as três cópias. Cada etapa medida gera uma linha JSON no logger `instrumentation`
+com o tempo de parede, o tempo de CPU do processo, o pico de memória (RSS) e
+o número de itens processados:
+
+    {"stage": "movie_recommendation.search", "wall_seconds": 0.0021,
+     "cpu_seconds": 0.0019, "peak_rss_kib": 181232, "peak_rss_growth_kib": 0,
+     "items": 5, "status": "ok"}
+
+O pico de RSS é o do processo até o fim da etapa; `peak_rss_growth_kib`
+mostra quanto a etapa o elevou. A medição fica desligada por padrão e, assim,
+custa só uma verificação por chamada. Para ligá-la, defina a variável de
+ambiente MLOPS_INSTRUMENTATION com o caminho de um arquivo (ou "stderr") ou
+chame `enable()`.
+
+Uso:
+    @instrument("podcast.load_episodes", items=len)
+    def load_episodes(...): ...
+
+    with stage("segmentation.fit") as measured:
+        ...
+        measured.items = len(data)
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import resource
+from functools import wraps
+
+ENV_VAR = "MLOPS_INSTRUMENTATION"
+LOGGER = "instrumentation"
+
+_state = {"enabled": False, "handler": None}
+
+
+def enable(destination=None):
+    """
+    Liga a medição e envia as linhas JSON para `destination`.
+
+    `destination` pode ser None ou "stderr", o caminho de um arquivo (as
+    linhas são acrescentadas) ou um objeto com `write`.
+    """
+    disable()
+    if destination is None or destination == "stderr":
+        handler = logging.StreamHandler(sys.stderr)
+    elif isinstance(destination, (str, os.PathLike)):
+        handler = logging.FileHandler(destination)
+    else:
+        handler = logging.StreamHandler(destination)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger = logging.getLogger(LOGGER)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    # Os projetos configuram o logger raiz em ERROR; as medições não passam por ele.
+    logger.propagate = False
+    _state.update(enabled=True, handler=handler)
+
+
+def disable():
+    """
+    Desliga a medição e fecha o destino das linhas.
+    """
+    handler = _state["handler"]
+    if handler is not None:
+        logging.getLogger(LOGGER).removeHandler(handler)
+        handler.close()
+    _state.update(enabled=False, handler=None)
+
+
+def is_enabled():
+    return _state["enabled"]
+
+
+def _peak_rss_kib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Stage:
+    """
+    Mede uma etapa do início ao fim do bloco `with`.
+
+    O número de itens pode ser informado na criação ou atribuído a `items`
+    dentro do bloco. Exceções são registradas com status "error" e propagadas.
+    """
+
+    def __init__(self, name, items=None):
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        self._peak = _peak_rss_kib()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        wall_seconds = time.perf_counter() - self._wall
+        cpu_seconds = time.process_time() - self._cpu
+        peak = _peak_rss_kib()
+        logging.getLogger(LOGGER).info(json.dumps({
+            "stage": self.name, "wall_seconds": wall_seconds, "cpu_seconds": cpu_seconds,
+            "peak_rss_kib": peak, "peak_rss_growth_kib": peak - self._peak,
+            "items": self.items, "status": "ok" if exc_type is None else "error"}))
+        return False
+
+
+class _NullStage:
+    """
+    Etapa usada com a medição desligada: não mede nem registra nada.
+    """
+
+    items = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, items=None):
+    """
+    Contexto que mede uma etapa, ou um contexto vazio com a medição desligada.
+    """
+    if not _state["enabled"]:
+        return _NULL_STAGE
+    return Stage(name, items)
+
+
+def instrument(name=None, items=None):
+    """
+    Decorador que mede cada chamada da função como uma etapa.
+
+    `name` é o nome da etapa (padrão: módulo.função) e `items`, se informado,
+    é uma função que recebe o retorno e devolve o número de itens
+    processados; retornos para os quais ela falha ficam sem contagem.
+    """
+    def decorator(function):
+        stage_name = name or f"{function.__module__}.{function.__qualname__}"
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state["enabled"]:
+                return function(*args, **kwargs)
+            with Stage(stage_name) as measured:
+                result = function(*args, **kwargs)
+                if items is not None:
+                    try:
+                        measured.items = items(result)
+                    except Exception:  # pylint: disable=broad-except
+                        measured.items = None
+                return result
+        return wrapper
+    return decorator
+
+
+if os.environ.get(ENV_VAR):
+    enable(os.environ[ENV_VAR])
@@ -2,17 +2,30 @@
 movie_recommendation.py - Um sistema de recomendação de filmes com base em títulos.
 """
 
-import re
 import logging
+from functools import cached_property, partial
 import numpy as np
-import ipywidgets as widgets
-from IPython.display import display
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from instrumentation import instrument
+from content_index import ContentIndex
+from ratings_store import load_ratings
+from title_search import (TitleSearchIndex, clean_title, clean_titles,
+                          file_sha256, load_tfidf_artifact, save_tfidf_artifact)
+from similarity_index import (LikedRatingsIndex, iter_similar_movies_batch,
+                              write_batch_parquet)
 
 logging.basicConfig(filename='movie_recommendation.log', level=logging.ERROR)
 
+SEARCH_RESULTS = 5
+DATA_DIR = "/workspaces/MLops2023/python_essentials_for_MLops/project1/ml-25m"
+MOVIES_PATH = f"{DATA_DIR}/movies.csv"
+RATINGS_PATH = f"{DATA_DIR}/ratings.csv"
+RATINGS_CACHE_DIR = f"{DATA_DIR}/ratings_cache"
+TFIDF_ARTIFACT_DIR = f"{DATA_DIR}/tfidf_artifact"
+
+_default_engine = None
+
+@instrument("movie_recommendation.load_data", items=len)
 def load_data(file_path):
     """
     Carrega os dados do arquivo CSV.
@@ -23,28 +36,26 @@ def load_data(file_path):
         logging.error("Erro no carregamento de dados: %s", str(exc))
         return None
 
-def clean_title(title):
-    """
-    Limpa um título removendo caracteres não alfanuméricos.
-    """
-    return re.sub(r"[^a-zA-Z0-9 ]", "", title)
-
 def preprocess_data(movies_data):
     """
     Adiciona uma coluna 'clean_title' aos dados de filmes com títulos limpos.
     """
     try:
-        movies_data["clean_title"] = movies_data["title"].apply(clean_title)
+        movies_data["clean_title"] = clean_titles(movies_data["title"])
         return movies_data
     except Exception as exc:
         logging.error("Erro no pré-processamento de dados: %s", str(exc))
         return None
 
 
+@instrument("movie_recommendation.calculate_tfidf", items=lambda result: result[0].shape[0])
 def calculate_tfidf(movies_data):
     """
     Calcula o TF-IDF dos títulos de filmes.
     """
+    # Importado sob demanda: o sklearn só é necessário ao ajustar o modelo.
+    from sklearn.feature_extraction.text import TfidfVectorizer  # pylint: disable=import-outside-toplevel
+
     try:
         local_vectorizer = TfidfVectorizer(ngram_range=(1, 2))
         tfidf_data = local_vectorizer .fit_transform(
@@ -55,26 +66,310 @@ def calculate_tfidf(movies_data):
         return None, None
 
 
-def search(title, vectorizer, tfidf, movies):
+def load_tfidf(movies_data, movies_path, artifact_dir):
+    """
+    Carrega o TF-IDF salvo para o catálogo atual ou o recalcula e salva.
+
+    O artefato é identificado pelo hash do conteúdo de `movies_path`, então é
+    reconstruído automaticamente quando o catálogo muda.
+    """
+    try:
+        catalog_hash = file_sha256(movies_path)
+        tfidf_data, local_vectorizer = load_tfidf_artifact(artifact_dir, catalog_hash)
+        if tfidf_data is not None:
+            return tfidf_data, local_vectorizer
+        tfidf_data, local_vectorizer = calculate_tfidf(movies_data)
+        if tfidf_data is not None:
+            save_tfidf_artifact(local_vectorizer, tfidf_data, artifact_dir, catalog_hash)
+        return tfidf_data, local_vectorizer
+    except Exception as exc:
+        logging.error("Erro no carregamento do artefato TF-IDF: %s", str(exc))
+        return calculate_tfidf(movies_data)
+
+
+@instrument("movie_recommendation.search", items=len)
+def search(title, vectorizer, tfidf, movies, k=SEARCH_RESULTS):
     """
     Realiza uma pesquisa de filmes similares com base no título.
+
+    Usa o índice de títulos do recomendador padrão (`get_engine`), que passa
+    a ser construído a partir do vetorizador, da matriz TF-IDF e do catálogo
+    dados e é reaproveitado nas chamadas seguintes com os mesmos objetos.
     """
     try:
-        title = clean_title(title)
-        query_vec = vectorizer.transform([title])
-        similarity = cosine_similarity(query_vec, tfidf).flatten()
-        indices = np.argpartition(similarity, -5)[-5:]
-        results = movies.iloc[indices].iloc[::-1]
-        return results
+        engine = get_engine()
+        engine.use_tfidf(vectorizer, tfidf, movies)
+        return engine.title_index.search(title, k=k)
     except Exception as exc:
         logging.error("Erro na busca de filmes similares: %s", str(exc))
         return None
 
 
+class RecommenderEngine:
+    """
+    Reúne os dados e índices do recomendador, construídos sob demanda.
+
+    Nada é carregado na criação do objeto: filmes, avaliações, TF-IDF e
+    índices são carregados no primeiro uso e reaproveitados nas chamadas
+    seguintes. `warm_up` força o carregamento de tudo de uma vez.
+    """
+
+    def __init__(self, movies_path=MOVIES_PATH, ratings_path=RATINGS_PATH,
+                 ratings_cache_dir=RATINGS_CACHE_DIR,
+                 tfidf_artifact_dir=TFIDF_ARTIFACT_DIR):
+        self.movies_path = movies_path
+        self.ratings_path = ratings_path
+        self.ratings_cache_dir = ratings_cache_dir
+        self.tfidf_artifact_dir = tfidf_artifact_dir
+
+    @cached_property
+    def movies(self):
+        """
+        Catálogo de filmes com a coluna 'clean_title'.
+        """
+        movies_data = load_data(self.movies_path)
+        if movies_data is None:
+            return None
+        return preprocess_data(movies_data)
+
+    @cached_property
+    def movies_by_id(self):
+        """
+        Título e gêneros indexados pelo ID do filme.
+        """
+        if self.movies is None:
+            return None
+        return self.movies.set_index("movieId")[["title", "genres"]]
+
+    @cached_property
+    def ratings(self):
+        """
+        Avaliações com tipos compactos, a partir do cache colunar.
+        """
+        return load_ratings(self.ratings_path, cache_dir=self.ratings_cache_dir)
+
+    @cached_property
+    def ratings_index(self):
+        """
+        Índice esparso das avaliações positivas.
+        """
+        if self.ratings is None:
+            return None
+        return LikedRatingsIndex.from_ratings(self.ratings)
+
+    @cached_property
+    def title_index(self):
+        """
+        Índice invertido dos títulos, a partir do artefato TF-IDF.
+        """
+        if self.movies is None:
+            return None
+        tfidf, vectorizer = load_tfidf(self.movies, self.movies_path,
+                                       self.tfidf_artifact_dir)
+        if tfidf is None or vectorizer is None:
+            return None
+        return TitleSearchIndex(vectorizer, tfidf, self.movies)
+
+    @cached_property
+    def content_index(self):
+        """
+        Índice aproximado de filmes similares por título e gêneros.
+
+        Usa o TF-IDF do índice de títulos e não depende das avaliações.
+        """
+        if self.title_index is None:
+            return None
+        return ContentIndex(self.title_index.movies, self.title_index.vectorizer,
+                            self.title_index.postings)
+
+    def use_tfidf(self, vectorizer, tfidf, movies):
+        """
+        Passa a buscar com o vetorizador, a matriz TF-IDF e o catálogo dados.
+
+        O índice de títulos atual é mantido se já foi construído com esses
+        objetos e com as mesmas dimensões; caso contrário é reconstruído e os
+        dados derivados do catálogo anterior são descartados.
+        """
+        index = self.__dict__.get("title_index")
+        if (index is not None and index.vectorizer is vectorizer and index.movies is movies
+                and index.postings.shape == tfidf.shape == (len(movies), tfidf.shape[1])):
+            return
+        self.title_index = TitleSearchIndex(vectorizer, tfidf, movies)
+        self.movies = movies
+        self.__dict__.pop("movies_by_id", None)
+        self.__dict__.pop("content_index", None)
+
+    def add_movies(self, movies_data):
+        """
+        Acrescenta filmes novos ao catálogo e aos índices de títulos e de conteúdo.
+
+        Retorna True se a deriva do vocabulário forçou um reajuste do TF-IDF;
+        nesse caso o índice de conteúdo é reconstruído no próximo uso.
+        """
+        try:
+            refitted = self.title_index.add_movies(movies_data)
+            self.movies = self.title_index.movies
+            self.__dict__.pop("movies_by_id", None)
+            if refitted:
+                self.__dict__.pop("content_index", None)
+            elif self.__dict__.get("content_index") is not None:
+                self.content_index.add_movies(movies_data)
+            return refitted
+        except Exception as exc:
+            logging.error("Erro ao acrescentar filmes ao catálogo: %s", str(exc))
+            return None
+
+    def warm_up(self):
+        """
+        Carrega todos os dados e índices; retorna True se tudo foi carregado.
+        """
+        return self.title_index is not None and self.ratings_index is not None
+
+    @instrument("movie_recommendation.engine.search", items=len)
+    def search(self, title, k=SEARCH_RESULTS):
+        """
+        Realiza uma pesquisa de filmes similares com base no título.
+        """
+        try:
+            return self.title_index.search(title, k=k)
+        except Exception as exc:
+            logging.error("Erro na busca de filmes similares: %s", str(exc))
+            return None
+
+    def search_batch(self, titles, k=SEARCH_RESULTS):
+        """
+        Realiza várias pesquisas por título em uma única chamada vetorizada.
+        """
+        try:
+            return self.title_index.search_many(titles, k=k)
+        except Exception as exc:
+            logging.error("Erro na busca de filmes similares em lote: %s", str(exc))
+            return None
+
+    @instrument("movie_recommendation.find_similar_movies", items=len)
+    def find_similar_movies(self, movie_id, top_k=10):
+        """
+        Encontra filmes similares com base no ID do filme.
+        """
+        try:
+            rec_percentages = self.ratings_index.similar_movie_scores(movie_id)
+            rec_percentages = rec_percentages.sort_values("score", ascending=False)
+            return rec_percentages.head(top_k).merge(
+                self.movies, left_index=True, right_on="movieId")[["score", "title", "genres"]]
+        except KeyError as ke:
+            logging.error(
+                "Erro ao encontrar filmes similares - KeyError: %s", str(ke))
+        except Exception as exc:
+            logging.error(
+                "Erro desconhecido ao encontrar filmes similares: %s", str(exc))
+        return None
+
+    @instrument("movie_recommendation.find_similar_by_content", items=len)
+    def find_similar_by_content(self, movie_id, top_k=10, n_probe=None):
+        """
+        Encontra filmes parecidos em título e gêneros, inclusive filmes sem
+        avaliações. A busca é aproximada; `n_probe` troca velocidade por recall.
+        """
+        try:
+            return self.content_index.similar(movie_id, k=top_k, n_probe=n_probe)
+        except KeyError as ke:
+            logging.error(
+                "Erro ao encontrar filmes similares por conteúdo - KeyError: %s", str(ke))
+        except Exception as exc:
+            logging.error(
+                "Erro desconhecido ao encontrar filmes similares por conteúdo: %s", str(exc))
+        return None
+
+    def find_similar_movies_many(self, movie_ids, top_k=10):
+        """
+        Encontra filmes similares para um pequeno lote de filmes em memória.
+
+        Retorna um dicionário do ID de cada filme para um DataFrame com as
+        colunas movieId, score, title e genres. IDs repetidos são calculados
+        uma única vez.
+        """
+        try:
+            seed_ids = list(dict.fromkeys(movie_ids))
+            recs = self.ratings_index.similar_movie_scores_block(seed_ids, top_k=top_k)
+            info = self.movies_by_id.reindex(recs["rec_id"].to_numpy())
+            # As recomendações de cada semente vêm contíguas, na ordem das sementes.
+            positions = pd.Index(seed_ids).get_indexer(recs["seed_id"].to_numpy())
+            starts = np.searchsorted(positions, np.arange(len(seed_ids)), side="left")
+            ends = np.searchsorted(positions, np.arange(len(seed_ids)), side="right")
+            recs = pd.DataFrame({"movieId": recs["rec_id"].to_numpy(),
+                                 "score": recs["score"].to_numpy(),
+                                 "title": info["title"].to_numpy(),
+                                 "genres": info["genres"].to_numpy()})
+            return {movie_id: recs.iloc[start:end].reset_index(drop=True)
+                    for movie_id, start, end in zip(seed_ids, starts, ends)}
+        except Exception as exc:
+            logging.error(
+                "Erro desconhecido ao encontrar filmes similares em lote: %s", str(exc))
+            return None
+
+    def find_similar_movies_batch(self, movie_ids, top_k=10, output_path=None,
+                                  memory_mb=256, n_jobs=None):
+        """
+        Encontra filmes similares para vários filmes-semente de uma só vez.
+
+        Retorna um DataFrame longo (seed_id, rec_id, score, similar, all) ou, se
+        `output_path` for informado, grava os blocos em Parquet e retorna o caminho.
+        """
+        try:
+            frames = iter_similar_movies_batch(self.ratings_index, movie_ids,
+                                               top_k=top_k, memory_mb=memory_mb,
+                                               n_jobs=n_jobs)
+            if output_path is not None:
+                return write_batch_parquet(frames, output_path)
+            return pd.concat(list(frames), ignore_index=True)
+        except ImportError as ie:
+            logging.error("Dependência ausente para gravar Parquet: %s", str(ie))
+        except Exception as exc:
+            logging.error(
+                "Erro desconhecido ao encontrar filmes similares em lote: %s", str(exc))
+        return None
+
+
+def get_engine():
+    """
+    Retorna o motor padrão do módulo, criado no primeiro uso.
+    """
+    global _default_engine  # pylint: disable=global-statement
+    if _default_engine is None:
+        _default_engine = RecommenderEngine()
+    return _default_engine
+
+
+def find_similar_movies(movie_id):
+    """
+    Encontra filmes similares com base no ID do filme usando o motor padrão.
+    """
+    return get_engine().find_similar_movies(movie_id)
+
+
+def find_similar_by_content(movie_id, top_k=10):
+    """
+    Encontra filmes parecidos em título e gêneros usando o motor padrão.
+    """
+    return get_engine().find_similar_by_content(movie_id, top_k=top_k)
+
+
+def find_similar_movies_batch(movie_ids, top_k=10, output_path=None,
+                              memory_mb=256, n_jobs=None):
+    """
+    Encontra filmes similares para vários filmes-semente usando o motor padrão.
+    """
+    return get_engine().find_similar_movies_batch(
+        movie_ids, top_k=top_k, output_path=output_path,
+        memory_mb=memory_mb, n_jobs=n_jobs)
+
+
 def create_movie_input_widget(default_value='Toy Story'):
     """
     Cria um widget de entrada de filme.
     """
+    import ipywidgets as widgets  # pylint: disable=import-outside-toplevel
+
     try:
         return widgets.Text(
             value=default_value,
@@ -85,53 +380,29 @@ def create_movie_input_widget(default_value='Toy Story'):
         logging.error("Erro ao criar widget de entrada de filme: %s", str(exc))
         return None
 
-def on_movie_input_change(change):
+def on_movie_input_change(change, engine, movie_list):
     """
     Callback para atualizar a lista de filmes com base no título inserido.
     """
+    from IPython.display import display  # pylint: disable=import-outside-toplevel
+
     try:
         if len(change.new) > 5:
             with movie_list:
                 movie_list.clear_output()
-                display(search(change.new, vectorizer, tfidf, movies))
+                display(engine.search(change.new, k=SEARCH_RESULTS))
     except ValueError as ve:
         logging.error("Erro na atualização da lista de filmes: %s", str(ve))
     except Exception as e:
         logging.error(
             "Erro desconhecido na atualização da lista de filmes: %s", str(e))
 
-def find_similar_movies(movie_id):
-    """
-    Encontra filmes similares com base no ID do filme.
-    """
-    try:
-        similar_users = ratings[(ratings["movieId"] == movie_id)
-                                & (ratings["rating"] > 4)]["userId"].unique()
-        similar_user_recs = ratings[(ratings["userId"].isin(similar_users))
-                                    & (ratings["rating"] > 4)]["movieId"]
-        similar_user_recs = similar_user_recs.value_counts() / len(similar_users)
-        similar_user_recs = similar_user_recs[similar_user_recs > 0.10]
-        all_users = ratings[(ratings["movieId"].isin(similar_user_recs.index))
-                            & (ratings["rating"] > 4)]
-        all_user_recs = all_users["movieId"].value_counts(
-        ) / len(all_users["userId"].unique())
-        rec_percentages = pd.concat([similar_user_recs, all_user_recs], axis=1)
-        rec_percentages.columns = ["similar", "all"]
-        rec_percentages["score"] = rec_percentages["similar"] / \
-            rec_percentages["all"]
-        rec_percentages = rec_percentages.sort_values("score", ascending=False)
-        return rec_percentages.head(10).merge(movies, left_index=True, right_on="movieId")[["score", "title", "genres"]]
-    except KeyError as ke:
-        logging.error(
-            "Erro ao encontrar filmes similares - KeyError: %s", str(ke))
-    except Exception as exc:
-        logging.error(
-            "Erro desconhecido ao encontrar filmes similares: %s", str(exc))
-
 def create_movie_name_input_widget(default_value='Toy Story'):
     """
     Cria um widget de entrada de nome de filme.
     """
+    import ipywidgets as widgets  # pylint: disable=import-outside-toplevel
+
     try:
         return widgets.Text(
             value=default_value,
@@ -143,41 +414,52 @@ def create_movie_name_input_widget(default_value='Toy Story'):
             "Erro ao criar widget de entrada de nome de filme: %s", str(exc))
         return None
 
-def on_movie_name_input_change(change):
+def on_movie_name_input_change(change, engine, recommendation_list):
     """
     Callback para exibir filmes recomendados com base no nome do filme inserido.
     """
+    from IPython.display import display  # pylint: disable=import-outside-toplevel
+
     try:
         if len(change.new) > 5:
-            results = search(change.new, vectorizer, tfidf, movies)
+            results = engine.search(change.new, k=SEARCH_RESULTS)
             if not results.empty:
                 movie_id = results.iloc[0]["movieId"]
                 with recommendation_list:
                     recommendation_list.clear_output()
-                    display(find_similar_movies(movie_id))
+                    display(engine.find_similar_movies(movie_id))
     except ValueError as ve:
         logging.error("Erro na exibição de filmes recomendados: %s", str(ve))
     except Exception as exc:
         logging.error("Erro desconhecido na exibição de filmes recomendados: %s", str(exc))
 
-load_movies_data = load_data(
-    "/workspaces/MLops2023/python_essentials_for_MLops/project1/ml-25m/movies.csv")
-ratings = load_data("python_essentials_for_MLops/project1/ml-25m/ratings.csv")
+def display_widgets(engine=None):
+    """
+    Exibe os widgets de busca e recomendação no notebook.
+    """
+    # pylint: disable=import-outside-toplevel
+    import ipywidgets as widgets
+    from IPython.display import display
 
-if load_movies_data is not None and ratings is not None:
+    engine = engine or get_engine()
+    if not engine.warm_up():
+        print("Erro no carregamento de dados. Verifique o arquivo de log para mais detalhes.")
+        return None
 
-    movies = preprocess_data(load_movies_data)
+    movie_input = create_movie_input_widget()
+    movie_list = widgets.Output()
+    movie_input.observe(partial(on_movie_input_change, engine=engine,
+                                movie_list=movie_list), names='value')
+    display(movie_input, movie_list)
 
-    tfidf, vectorizer = calculate_tfidf(movies)
-    if tfidf is not None and vectorizer is not None:
+    movie_name_input = create_movie_name_input_widget()
+    recommendation_list = widgets.Output()
+    movie_name_input.observe(partial(on_movie_name_input_change, engine=engine,
+                                     recommendation_list=recommendation_list),
+                             names='value')
+    display(movie_name_input, recommendation_list)
+    return engine
 
-        movie_input = create_movie_input_widget()
-        movie_list = widgets.Output()
-        movie_input.observe(on_movie_input_change, names='value')
-        display(movie_input, movie_list)
 
-        movie_name_input = create_movie_name_input_widget()
-        recommendation_list = widgets.Output()
-        movie_name_input.observe(on_movie_name_input_change, names='value')
-else:
-    print("Erro no carregamento de dados. Verifique o arquivo de log para mais detalhes.")
+if __name__ == "__main__":
+    display_widgets()
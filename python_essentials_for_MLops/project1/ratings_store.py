@@ -0,0 +1,92 @@
+"""
+ratings_store.py - Carregamento compacto das avaliações do ml-25m.
+
+Lê apenas as colunas usadas pela recomendação com tipos compactos e mantém
+um cache colunar (.npy) que pode ser mapeado em memória nas próximas execuções.
+"""
+
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+RATINGS_COLUMNS = ["userId", "movieId", "rating"]
+RATINGS_DTYPES = {"userId": np.int32, "movieId": np.int32, "rating": np.float32}
+CACHE_MANIFEST = "manifest.json"
+
+
+def _source_signature(file_path):
+    """
+    Retorna a assinatura (tamanho e data de modificação) do CSV de origem.
+    """
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _cache_is_valid(cache_dir, signature):
+    """
+    Verifica se o cache colunar corresponde ao CSV de origem.
+    """
+    manifest_path = os.path.join(cache_dir, CACHE_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get("source") != signature:
+        return False
+    return all(os.path.exists(os.path.join(cache_dir, f"{column}.npy"))
+               for column in RATINGS_COLUMNS)
+
+
+def read_ratings_csv(file_path, chunksize=None):
+    """
+    Lê o CSV de avaliações descartando o timestamp e usando tipos compactos.
+    """
+    return pd.read_csv(file_path, usecols=RATINGS_COLUMNS,
+                       dtype=RATINGS_DTYPES, chunksize=chunksize)
+
+
+def write_ratings_cache(ratings, cache_dir, signature=None):
+    """
+    Grava cada coluna das avaliações como um arquivo .npy no diretório de cache.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    for column in RATINGS_COLUMNS:
+        values = ratings[column].to_numpy(dtype=RATINGS_DTYPES[column])
+        tmp_path = os.path.join(cache_dir, f"{column}.tmp.npy")
+        np.save(tmp_path, values)
+        os.replace(tmp_path, os.path.join(cache_dir, f"{column}.npy"))
+    # O manifesto é gravado por último: um cache sem ele é considerado inválido.
+    with open(os.path.join(cache_dir, CACHE_MANIFEST), "w",
+              encoding="utf-8") as manifest_file:
+        json.dump({"source": signature, "rows": len(ratings)}, manifest_file)
+
+
+def read_ratings_cache(cache_dir, mmap_mode="r"):
+    """
+    Abre o cache colunar, por padrão mapeando os arquivos em memória.
+    """
+    columns = {column: np.load(os.path.join(cache_dir, f"{column}.npy"),
+                               mmap_mode=mmap_mode)
+               for column in RATINGS_COLUMNS}
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_ratings(file_path, cache_dir=None, mmap_mode="r"):
+    """
+    Carrega as avaliações com tipos compactos, usando o cache colunar quando existir.
+
+    Na primeira execução o CSV é convertido para o cache em `cache_dir`; nas
+    seguintes os arquivos .npy são abertos sem reprocessar o CSV.
+    """
+    try:
+        if cache_dir is None:
+            return read_ratings_csv(file_path)
+        signature = _source_signature(file_path)
+        if not _cache_is_valid(cache_dir, signature):
+            write_ratings_cache(read_ratings_csv(file_path), cache_dir, signature)
+        return read_ratings_cache(cache_dir, mmap_mode=mmap_mode)
+    except Exception as exc:
+        logging.error("Erro no carregamento das avaliações: %s", str(exc))
+        return None
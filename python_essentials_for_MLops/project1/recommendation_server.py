@@ -0,0 +1,370 @@
+"""
+recommendation_server.py - Servidor HTTP local de busca e recomendação de filmes.
+
+Uso:
+    python recommendation_server.py --port 8000
+
+Rotas:
+    GET /search?q=<título>&k=<quantidade>
+    GET /similar/<movie_id>
+
+Um único RecommenderEngine aquecido atende todas as conexões. Requisições
+concorrentes são agrupadas em micro-lotes executados com uma só chamada
+vetorizada, e as respostas ficam em um cache LRU limitado.
+"""
+
+import os
+import json
+import asyncio
+import logging
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from movie_recommendation import DATA_DIR, SEARCH_RESULTS, RecommenderEngine
+from title_search import clean_title
+
+MAX_SEARCH_RESULTS = 100
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class LRUCache:
+    """
+    Cache limitado que descarta a entrada usada há mais tempo.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Retorna o valor da chave ou None, marcando-a como usada recentemente.
+        """
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, value):
+        """
+        Guarda um valor, descartando a entrada mais antiga se o cache estiver cheio.
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MicroBatcher:
+    """
+    Agrupa chamadas concorrentes em lotes processados por uma única função.
+
+    A função recebe a lista de argumentos do lote e deve retornar a lista de
+    resultados na mesma ordem. Ela roda no `executor` para não bloquear o loop.
+    """
+
+    def __init__(self, handler, executor, max_batch=64, max_delay=0.002):
+        self.handler = handler
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = []
+        self._timer = None
+        # Referências aos lotes em andamento: o loop só guarda referências fracas.
+        self._tasks = set()
+
+    async def submit(self, item):
+        """
+        Enfileira um item e aguarda o resultado do lote em que ele for processado.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        """
+        Dispara o processamento de todos os itens pendentes.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(lambda done: self._finish(done, batch))
+
+    def _finish(self, task, batch):
+        """
+        Descarta a tarefa concluída e falha os itens que ficaram sem resultado.
+        """
+        self._tasks.discard(task)
+        error = None if task.cancelled() else task.exception()
+        if not task.cancelled() and error is None:
+            return
+        for _, future in batch:
+            if future.done():
+                continue
+            if error is None:
+                future.cancel()
+            else:
+                future.set_exception(error)
+
+    async def _run(self, batch):
+        """
+        Executa o lote no executor e entrega cada resultado ao seu solicitante.
+        """
+        items = [item for item, _ in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.handler, items)
+            if results is None:
+                raise RuntimeError("o lote não retornou resultados")
+        except Exception as exc:  # pylint: disable=broad-except
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class RecommendationService:
+    """
+    Fachada assíncrona do RecommenderEngine com micro-lotes e cache LRU.
+    """
+
+    def __init__(self, engine, cache_size=4096, max_batch=64, max_delay=0.002):
+        self.engine = engine
+        # Um único trabalhador: o motor é compartilhado e as chamadas são vetorizadas.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.search_cache = LRUCache(cache_size)
+        self.similar_cache = LRUCache(cache_size)
+        self.search_batcher = MicroBatcher(self._search_batch, self.executor,
+                                           max_batch, max_delay)
+        self.similar_batcher = MicroBatcher(self._similar_batch, self.executor,
+                                            max_batch, max_delay)
+        # Pedidos em andamento, por (cache, chave), compartilhados por requisições simultâneas.
+        self._in_flight = {}
+
+    def _search_batch(self, items):
+        """
+        Resolve um lote de buscas com o maior k pedido no lote.
+        """
+        k = max(item_k for _, item_k in items)
+        results = self.engine.search_batch([title for title, _ in items], k=k)
+        if results is None:
+            return None
+        return [_records(result.head(item_k)[["movieId", "title", "genres"]])
+                for result, (_, item_k) in zip(results, items)]
+
+    def _similar_batch(self, movie_ids):
+        """
+        Resolve um lote de recomendações por ID de filme; IDs repetidos no
+        lote são calculados uma única vez.
+        """
+        unique_ids = list(dict.fromkeys(movie_ids))
+        results = self.engine.find_similar_movies_many(unique_ids)
+        if results is None:
+            return None
+        records = {movie_id: _records(results[movie_id]) for movie_id in unique_ids}
+        return [records[movie_id] for movie_id in movie_ids]
+
+    async def _lookup(self, cache, batcher, key):
+        """
+        Retorna o valor em cache ou o calcula em um micro-lote.
+
+        Requisições simultâneas da mesma chave aguardam o mesmo pedido; o
+        resultado só vai para o cache se o lote terminar sem erro.
+        """
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        flight_key = (id(cache), key)
+        pending = self._in_flight.get(flight_key)
+        if pending is None:
+            pending = asyncio.ensure_future(batcher.submit(key))
+            self._in_flight[flight_key] = pending
+
+            def done(future):
+                self._in_flight.pop(flight_key, None)
+                if not future.cancelled() and future.exception() is None:
+                    cache.put(key, future.result())
+
+            pending.add_done_callback(done)
+        # O shield impede que o cancelamento de um cliente cancele os demais.
+        return await asyncio.shield(pending)
+
+    async def search(self, title, k=SEARCH_RESULTS):
+        """
+        Busca filmes pelo título, normalizado para o cache.
+        """
+        key = (clean_title(title).strip().lower(), k)
+        return await self._lookup(self.search_cache, self.search_batcher, key)
+
+    async def similar(self, movie_id):
+        """
+        Recomenda filmes similares a um ID de filme.
+        """
+        return await self._lookup(self.similar_cache, self.similar_batcher, movie_id)
+
+    def stats(self):
+        """
+        Estatísticas dos caches.
+        """
+        return {name: {"size": len(cache), "hits": cache.hits, "misses": cache.misses}
+                for name, cache in (("search", self.search_cache),
+                                    ("similar", self.similar_cache))}
+
+
+def _records(frame):
+    """
+    Converte um DataFrame em uma lista de dicionários serializáveis em JSON.
+    """
+    return frame.to_dict(orient="records")
+
+
+async def route(service, method, target):
+    """
+    Encaminha a requisição e retorna (status, corpo).
+    """
+    if method != "GET":
+        return 405, {"error": "apenas GET é suportado"}
+    url = urlsplit(target)
+    params = parse_qs(url.query)
+    parts = [part for part in url.path.split("/") if part]
+    try:
+        if parts == ["search"]:
+            title = params.get("q", [""])[0]
+            k = int(params.get("k", [SEARCH_RESULTS])[0])
+            if not title or not 0 < k <= MAX_SEARCH_RESULTS:
+                return 400, {"error": f"informe q e 0 < k <= {MAX_SEARCH_RESULTS}"}
+            return 200, {"query": title, "results": await service.search(title, k)}
+        if len(parts) == 2 and parts[0] == "similar":
+            movie_id = int(parts[1])
+            return 200, {"movieId": movie_id, "results": await service.similar(movie_id)}
+        if parts == ["stats"]:
+            return 200, service.stats()
+    except ValueError as ve:
+        return 400, {"error": str(ve)}
+    except Exception as exc:  # pylint: disable=broad-except
+        logging.error("Erro ao atender %s: %s", target, str(exc))
+        return 500, {"error": "erro interno"}
+    return 404, {"error": "rota não encontrada"}
+
+
+def _response(status, body, keep_alive):
+    """
+    Monta a resposta HTTP/1.1 com o corpo em JSON.
+    """
+    payload = json.dumps(body).encode("utf-8")
+    return (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            .encode("latin-1") + payload)
+
+
+async def handle_connection(service, reader, writer):
+    """
+    Atende as requisições HTTP/1.1 de uma conexão, com keep-alive.
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                break
+            try:
+                length = int(headers.get("content-length", 0))
+                if length < 0:
+                    raise ValueError(length)
+            except ValueError:
+                # Sem o tamanho do corpo não há como achar a próxima requisição.
+                writer.write(_response(400, {"error": "Content-Length inválido"}, False))
+                await writer.drain()
+                break
+            if length:
+                await reader.readexactly(length)
+            status, body = await route(service, method, target)
+            keep_alive = (headers.get("connection", "").lower() != "close"
+                          and version == "HTTP/1.1")
+            writer.write(_response(status, body, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service, host="127.0.0.1", port=8000):
+    """
+    Inicia o servidor e atende conexões até ser interrompido.
+    """
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(service, reader, writer), host, port)
+    print(f"Servindo em http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    """
+    Função principal do servidor.
+    """
+    parser = argparse.ArgumentParser(description="Servidor HTTP de recomendação de filmes.")
+    parser.add_argument("--data-dir", default=DATA_DIR,
+                        help="diretório com movies.csv e ratings.csv do ml-25m")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cache-size", type=int, default=4096)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-delay-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    engine = RecommenderEngine(
+        os.path.join(args.data_dir, "movies.csv"),
+        os.path.join(args.data_dir, "ratings.csv"),
+        os.path.join(args.data_dir, "ratings_cache"),
+        os.path.join(args.data_dir, "tfidf_artifact"))
+    if not engine.warm_up():
+        print("Erro no carregamento de dados. Verifique o arquivo de log para mais detalhes.")
+        return
+    service = RecommendationService(engine, args.cache_size, args.max_batch,
+                                    args.max_delay_ms / 1000)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
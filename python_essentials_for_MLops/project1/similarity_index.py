@@ -0,0 +1,251 @@
+"""
+similarity_index.py - Índice esparso das avaliações positivas (rating > 4).
+
+Pré-computa uma matriz usuários x filmes das avaliações "gostei" para que a
+recomendação por filtragem colaborativa seja feita com produtos esparsos em vez
+de varreduras completas do DataFrame de avaliações.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+LIKED_THRESHOLD = 4
+SIMILAR_THRESHOLD = 0.10
+BATCH_COLUMNS = ["seed_id", "rec_id", "score", "similar", "all"]
+# Orçamento padrão de memória por bloco de filmes-semente no cálculo em lote.
+DEFAULT_BLOCK_MEMORY_MB = 256
+# Bytes por elemento não nulo de uma matriz esparsa (índice int32 + valor float64).
+_BYTES_PER_NNZ = 12
+
+_worker_index = None
+
+
+class LikedRatingsIndex:
+    """
+    Matriz esparsa (CSR e CSC) das avaliações positivas com os mapas de IDs.
+    """
+
+    def __init__(self, user_ids, movie_ids, matrix):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.csr = matrix.tocsr()
+        self.csc = matrix.tocsc()
+        # Número de avaliações positivas de cada filme (coluna).
+        self.movie_like_counts = np.asarray(self.csc.sum(axis=0)).ravel()
+
+    @classmethod
+    def from_ratings(cls, ratings, threshold=LIKED_THRESHOLD):
+        """
+        Constrói o índice a partir de um DataFrame com userId, movieId e rating.
+        """
+        liked = ratings["rating"].to_numpy() > threshold
+        users = ratings["userId"].to_numpy()[liked]
+        movies = ratings["movieId"].to_numpy()[liked]
+        user_ids, user_codes = np.unique(users, return_inverse=True)
+        movie_ids, movie_codes = np.unique(movies, return_inverse=True)
+        # Avaliações repetidas são somadas, como faria o value_counts.
+        matrix = sparse.coo_matrix(
+            (np.ones(len(users), dtype=np.int32), (user_codes, movie_codes)),
+            shape=(len(user_ids), len(movie_ids)))
+        return cls(user_ids, movie_ids, matrix)
+
+    @property
+    def shape(self):
+        """
+        Dimensões (usuários, filmes) da matriz.
+        """
+        return self.csr.shape
+
+    def movie_position(self, movie_id):
+        """
+        Retorna a coluna do filme na matriz ou None se ninguém gostou dele.
+        """
+        position = np.searchsorted(self.movie_ids, movie_id)
+        if position < len(self.movie_ids) and self.movie_ids[position] == movie_id:
+            return int(position)
+        return None
+
+    def similar_movie_scores(self, movie_id, threshold=SIMILAR_THRESHOLD):
+        """
+        Calcula as colunas similar, all e score para um filme.
+
+        Equivale ao algoritmo original em pandas, mas usando dois produtos
+        matriz-vetor esparsos sobre o índice pré-computado.
+        """
+        position = self.movie_position(movie_id)
+        if position is None:
+            return _empty_scores()
+        users = self.csc.indices[self.csc.indptr[position]:self.csc.indptr[position + 1]]
+        user_mask = np.zeros(self.shape[0], dtype=np.int32)
+        user_mask[users] = 1
+        # Fração dos usuários similares que gostou de cada filme.
+        similar = (self.csc.T @ user_mask) / len(users)
+        columns = np.flatnonzero(similar > threshold)
+        movie_mask = np.zeros(self.shape[1], dtype=np.int32)
+        movie_mask[columns] = 1
+        # Usuários que gostaram de ao menos um dos filmes recomendados.
+        all_users = np.count_nonzero(self.csr @ movie_mask)
+        scores = pd.DataFrame({
+            "similar": similar[columns],
+            "all": self.movie_like_counts[columns] / all_users,
+        }, index=pd.Index(self.movie_ids[columns], name="movieId"))
+        scores["score"] = scores["similar"] / scores["all"]
+        return scores
+
+    def block_size_for_budget(self, memory_mb=DEFAULT_BLOCK_MEMORY_MB):
+        """
+        Número de sementes por bloco para que os produtos esparsos caibam no orçamento.
+
+        No pior caso cada semente gera uma coluna densa de filmes (contagens) e
+        outra de usuários (usuários que gostaram dos filmes recomendados).
+        """
+        bytes_per_seed = (self.shape[0] + self.shape[1]) * _BYTES_PER_NNZ
+        return max(1, int(memory_mb * 1024 * 1024) // bytes_per_seed)
+
+    def similar_movie_scores_block(self, movie_ids, top_k=10,
+                                   threshold=SIMILAR_THRESHOLD):
+        """
+        Calcula as recomendações de um bloco de filmes-semente de uma só vez.
+
+        Usa produtos esparso-esparso sobre o índice e retorna um DataFrame longo
+        com as colunas seed_id, rec_id, score, similar e all, com até `top_k`
+        recomendações por semente ordenadas pelo score.
+        """
+        positions = [position for position in map(self.movie_position, movie_ids)
+                     if position is not None]
+        if not positions:
+            return _empty_batch()
+        seeds = self.csc[:, positions]
+        seeds.data[:] = 1
+        similar_users = np.diff(seeds.indptr)
+        # Contagem, por semente, de usuários similares que gostaram de cada filme.
+        counts = (self.csc.T @ seeds).tocsc()
+        counts.sort_indices()
+        rows = counts.indices
+        columns = np.repeat(np.arange(len(positions)), np.diff(counts.indptr))
+        similar = counts.data / similar_users[columns]
+        keep = similar > threshold
+        rows, columns, similar = rows[keep], columns[keep], similar[keep]
+        recommended = sparse.csc_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, columns)),
+            shape=(self.shape[1], len(positions)))
+        # Usuários distintos que gostaram de ao menos um filme recomendado, por semente.
+        all_users = np.diff((self.csr @ recommended).tocsc().indptr)
+        all_fraction = self.movie_like_counts[rows] / all_users[columns]
+        score = similar / all_fraction
+        order = np.lexsort((rows, -score, columns))
+        rows, columns = rows[order], columns[order]
+        similar, all_fraction, score = similar[order], all_fraction[order], score[order]
+        starts = np.searchsorted(columns, columns, side="left")
+        top = (np.arange(len(columns)) - starts) < top_k
+        seed_ids = self.movie_ids[positions]
+        return pd.DataFrame({
+            "seed_id": seed_ids[columns[top]].astype(np.int64),
+            "rec_id": self.movie_ids[rows[top]].astype(np.int64),
+            "score": score[top],
+            "similar": similar[top],
+            "all": all_fraction[top],
+        }, columns=BATCH_COLUMNS)
+
+
+def _empty_scores():
+    """
+    DataFrame de pontuações vazio com as colunas esperadas.
+    """
+    return pd.DataFrame({"similar": [], "all": [], "score": []},
+                        index=pd.Index([], name="movieId", dtype=np.int64))
+
+
+def _empty_batch():
+    """
+    DataFrame longo de recomendações em lote vazio.
+    """
+    return pd.DataFrame({
+        column: pd.Series(dtype=np.int64 if column.endswith("_id") else np.float64)
+        for column in BATCH_COLUMNS})
+
+
+def _init_worker(index):
+    """
+    Guarda o índice no processo trabalhador para reutilizá-lo entre blocos.
+    """
+    global _worker_index  # pylint: disable=global-statement
+    _worker_index = index
+
+
+def _score_block_in_worker(movie_ids, top_k):
+    """
+    Calcula um bloco de sementes no processo trabalhador.
+    """
+    return _worker_index.similar_movie_scores_block(movie_ids, top_k=top_k)
+
+
+def iter_similar_movies_batch(index, movie_ids, top_k=10,
+                              memory_mb=DEFAULT_BLOCK_MEMORY_MB, n_jobs=None):
+    """
+    Gera os DataFrames de recomendações bloco a bloco, na ordem das sementes.
+
+    Com `n_jobs` maior que 1 os blocos são distribuídos em um pool de processos.
+    """
+    movie_ids = np.asarray(movie_ids)
+    block_size = index.block_size_for_budget(memory_mb)
+    blocks = [movie_ids[start:start + block_size]
+              for start in range(0, len(movie_ids), block_size)]
+    if n_jobs is None or n_jobs <= 1:
+        for block in blocks:
+            yield index.similar_movie_scores_block(block, top_k=top_k)
+        return
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                             initargs=(index,)) as executor:
+        yield from executor.map(_score_block_in_worker, blocks,
+                                [top_k] * len(blocks))
+
+
+def write_batch_parquet(frames, output_path):
+    """
+    Grava os blocos de recomendações em um arquivo Parquet à medida que chegam.
+
+    Sem nenhum bloco (nenhuma semente), grava um arquivo vazio com as colunas
+    esperadas, então o caminho retornado sempre existe.
+    """
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+    import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+    writer = None
+    try:
+        for frame in frames:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+        if writer is None:
+            table = pa.Table.from_pandas(_empty_batch(), preserve_index=False)
+            writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return output_path
+
+
+def similar_movie_scores_pandas(ratings, movie_id, threshold=SIMILAR_THRESHOLD):
+    """
+    Implementação de referência em pandas, varrendo o DataFrame de avaliações.
+    """
+    similar_users = ratings[(ratings["movieId"] == movie_id)
+                            & (ratings["rating"] > LIKED_THRESHOLD)]["userId"].unique()
+    similar_user_recs = ratings[(ratings["userId"].isin(similar_users))
+                                & (ratings["rating"] > LIKED_THRESHOLD)]["movieId"]
+    similar_user_recs = similar_user_recs.value_counts() / len(similar_users)
+    similar_user_recs = similar_user_recs[similar_user_recs > threshold]
+    all_users = ratings[(ratings["movieId"].isin(similar_user_recs.index))
+                        & (ratings["rating"] > LIKED_THRESHOLD)]
+    all_user_recs = all_users["movieId"].value_counts(
+    ) / len(all_users["userId"].unique())
+    rec_percentages = pd.concat([similar_user_recs, all_user_recs], axis=1)
+    rec_percentages.columns = ["similar", "all"]
+    rec_percentages["score"] = rec_percentages["similar"] / \
+        rec_percentages["all"]
+    return rec_percentages
@@ -0,0 +1,93 @@
+"""
+synthetic_data.py - Gerador de dados sintéticos no formato do ml-25m.
+
+Gera um movies.csv (movieId, title, genres) e um ratings.csv (userId,
+movieId, rating, timestamp) com popularidade de filmes e atividade de usuários
+seguindo uma distribuição de Zipf, como no conjunto real.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+WORDS = ["Love", "War", "Night", "Day", "Story", "Man", "City", "Dark", "Blue",
+         "King", "Queen", "Lost", "Toy", "River", "Sun", "Moon", "Star", "Road",
+         "Home", "Girl", "Boy", "Dead", "Last", "Secret", "House", "Dream",
+         "Fire", "Ice", "Heart", "World", "Life", "Time", "Ghost", "Island"]
+GENRES = ["Action", "Adventure", "Animation", "Children", "Comedy", "Crime",
+          "Documentary", "Drama", "Fantasy", "Horror", "Musical", "Mystery",
+          "Romance", "Sci-Fi", "Thriller", "War", "Western"]
+# Distribuição aproximada das notas (0.5 a 5.0) do ml-25m.
+RATING_PROBABILITIES = [0.016, 0.032, 0.016, 0.068, 0.05, 0.196, 0.131, 0.266, 0.088, 0.137]
+
+SCALES = {
+    "small": {"n_users": 1_000, "n_movies": 2_000, "n_ratings": 100_000},
+    "medium": {"n_users": 20_000, "n_movies": 10_000, "n_ratings": 2_000_000},
+    "large": {"n_users": 162_541, "n_movies": 62_423, "n_ratings": 25_000_095},
+}
+
+
+def zipf_probabilities(size, exponent):
+    """
+    Probabilidades de Zipf para `size` itens ordenados por popularidade.
+    """
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def generate_movies(n_movies, seed=42):
+    """
+    Gera o catálogo de filmes com títulos no formato 'Título (Ano)'.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array(WORDS)
+    lengths = rng.integers(1, 5, n_movies)
+    titles = [" ".join(words[rng.integers(0, len(words), length)]) for length in lengths]
+    years = rng.integers(1920, 2020, n_movies)
+    genres = ["|".join(rng.choice(GENRES, rng.integers(1, 4), replace=False))
+              for _ in range(n_movies)]
+    return pd.DataFrame({
+        "movieId": np.arange(1, n_movies + 1),
+        "title": [f"{title} {movie_id} ({year})"
+                  for movie_id, title, year in zip(range(1, n_movies + 1), titles, years)],
+        "genres": genres,
+    })
+
+
+def generate_ratings(n_users, n_movies, n_ratings, movie_exponent=1.1,
+                     user_exponent=0.8, seed=42, chunk_size=5_000_000):
+    """
+    Gera as avaliações em blocos de até `chunk_size` linhas.
+
+    Filmes e usuários são sorteados com probabilidades de Zipf, em ordens
+    embaralhadas para que os IDs populares não sejam sempre os menores.
+    """
+    rng = np.random.default_rng(seed)
+    movie_ids = rng.permutation(n_movies) + 1
+    user_ids = rng.permutation(n_users) + 1
+    movie_p = zipf_probabilities(n_movies, movie_exponent)
+    user_p = zipf_probabilities(n_users, user_exponent)
+    ratings = np.arange(1, 11) / 2
+    for start in range(0, n_ratings, chunk_size):
+        size = min(chunk_size, n_ratings - start)
+        yield pd.DataFrame({
+            "userId": user_ids[rng.choice(n_users, size, p=user_p)],
+            "movieId": movie_ids[rng.choice(n_movies, size, p=movie_p)],
+            "rating": rng.choice(ratings, size, p=RATING_PROBABILITIES),
+            "timestamp": rng.integers(789652009, 1574327703, size),
+        })
+
+
+def write_dataset(out_dir, n_users, n_movies, n_ratings, seed=42, **kwargs):
+    """
+    Grava movies.csv e ratings.csv sintéticos em `out_dir` e retorna os caminhos.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    movies_path = os.path.join(out_dir, "movies.csv")
+    ratings_path = os.path.join(out_dir, "ratings.csv")
+    generate_movies(n_movies, seed=seed).to_csv(movies_path, index=False)
+    for number, chunk in enumerate(generate_ratings(n_users, n_movies, n_ratings,
+                                                     seed=seed, **kwargs)):
+        chunk.to_csv(ratings_path, index=False, header=number == 0,
+                     mode="w" if number == 0 else "a")
+    return movies_path, ratings_path
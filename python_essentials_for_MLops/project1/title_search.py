@@ -0,0 +1,208 @@
+"""
+title_search.py - Busca de filmes por título sobre o índice invertido do TF-IDF.
+
+As linhas do TF-IDF já são normalizadas (L2), então a similaridade de cosseno
+é o produto escalar com a consulta. Guardando a matriz em CSC (uma lista de
+filmes por termo) só os filmes que compartilham algum termo com a consulta
+são pontuados.
+"""
+
+import os
+import re
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+TITLE_PATTERN = re.compile(r"[^a-zA-Z0-9 ]")
+# Incrementar quando o formato do artefato mudar.
+ARTIFACT_VERSION = 1
+ARTIFACT_META = "meta.json"
+ARTIFACT_ARRAYS = ["data", "indices", "indptr", "idf"]
+# Fração do vocabulário em termos novos (fora do vocabulário) que força um reajuste.
+DRIFT_THRESHOLD = 0.05
+
+
+def clean_title(title):
+    """
+    Limpa um título removendo caracteres não alfanuméricos.
+    """
+    return TITLE_PATTERN.sub("", title)
+
+
+def clean_titles(titles):
+    """
+    Limpa uma série de títulos de uma vez com o motor de regex do pandas.
+    """
+    # Passar o padrão como texto permite ao pandas usar o regex do pyarrow;
+    # com o objeto compilado ele volta ao laço em Python.
+    return titles.str.replace(TITLE_PATTERN.pattern, "", regex=True)
+
+
+class TitleSearchIndex:
+    """
+    Índice invertido dos títulos para buscas top-k por similaridade de cosseno.
+    """
+
+    def __init__(self, vectorizer, tfidf, movies, drift_threshold=DRIFT_THRESHOLD):
+        self.vectorizer = vectorizer
+        self.postings = tfidf.tocsc()
+        self.movies = movies
+        self.drift_threshold = drift_threshold
+        self.unseen_terms = set()
+
+    @property
+    def drift(self):
+        """
+        Termos novos vistos desde o último ajuste, como fração do vocabulário.
+        """
+        return len(self.unseen_terms) / max(len(self.vectorizer.vocabulary_), 1)
+
+    def add_movies(self, movies_data):
+        """
+        Acrescenta filmes ao índice sem reajustar o vetorizador.
+
+        Os títulos novos são limpos e transformados com o vocabulário e o idf
+        atuais. Quando os termos fora do vocabulário passam de
+        `drift_threshold`, o vetorizador é reajustado com o catálogo inteiro.
+        Retorna True se houve reajuste.
+        """
+        movies_data = movies_data.copy()
+        movies_data["clean_title"] = clean_titles(movies_data["title"])
+        self.movies = pd.concat([self.movies, movies_data], ignore_index=True)
+        analyzer = self.vectorizer.build_analyzer()
+        vocabulary = self.vectorizer.vocabulary_
+        for title in movies_data["clean_title"]:
+            self.unseen_terms.update(term for term in analyzer(title)
+                                     if term not in vocabulary)
+        if self.drift > self.drift_threshold:
+            self.refit()
+            return True
+        added = self.vectorizer.transform(movies_data["clean_title"])
+        self.postings = sparse.vstack([self.postings, added], format="csc")
+        return False
+
+    def refit(self):
+        """
+        Reajusta o vetorizador e reconstrói o índice com o catálogo inteiro.
+        """
+        from sklearn.base import clone  # pylint: disable=import-outside-toplevel
+
+        self.vectorizer = clone(self.vectorizer)
+        self.postings = self.vectorizer.fit_transform(self.movies["clean_title"]).tocsc()
+        self.unseen_terms = set()
+
+    def score(self, title):
+        """
+        Retorna as linhas candidatas e suas similaridades com o título.
+        """
+        query = self.vectorizer.transform([clean_title(title)])
+        starts = self.postings.indptr[query.indices]
+        ends = self.postings.indptr[query.indices + 1]
+        if not query.nnz or not np.any(ends > starts):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        rows = np.concatenate([self.postings.indices[start:end]
+                               for start, end in zip(starts, ends)])
+        weights = np.concatenate([self.postings.data[start:end] * weight
+                                  for start, end, weight in zip(starts, ends, query.data)])
+        candidates, positions = np.unique(rows, return_inverse=True)
+        return candidates, np.bincount(positions, weights=weights)
+
+    def search(self, title, k=5):
+        """
+        Retorna os `k` filmes mais similares ao título, do mais ao menos similar.
+        """
+        candidates, scores = self.score(title)
+        return self.movies.iloc[top_k(candidates, scores, k)]
+
+    def search_many(self, titles, k=5):
+        """
+        Busca vários títulos de uma vez, com uma única transformação e um
+        único produto esparso entre as consultas e o índice invertido.
+        """
+        queries = self.vectorizer.transform([clean_title(title) for title in titles])
+        scores = (queries @ self.postings.T).tocsr()
+        return [self.movies.iloc[top_k(scores.indices[start:end], scores.data[start:end], k)]
+                for start, end in zip(scores.indptr[:-1], scores.indptr[1:])]
+
+
+def top_k(candidates, scores, k):
+    """
+    Retorna as `k` linhas candidatas de maior score, em ordem decrescente.
+    """
+    if len(candidates) > k:
+        # Mantém todos os empatados com o k-ésimo score, para que o corte
+        # também siga a ordem do catálogo.
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        keep = scores >= kth
+        candidates, scores = candidates[keep], scores[keep]
+    # Empates são desfeitos pela ordem do catálogo (a menor linha primeiro).
+    return candidates[np.lexsort((candidates, -scores))][:k]
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """
+    Calcula o hash SHA-256 do conteúdo de um arquivo.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as source:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_tfidf_artifact(vectorizer, tfidf, artifact_dir, catalog_hash):
+    """
+    Grava o vetorizador ajustado e a matriz TF-IDF dos títulos em disco.
+
+    A matriz CSR é gravada como arquivos .npy separados (data, indices e
+    indptr) para que possa ser mapeada em memória ao ser carregada.
+    """
+    os.makedirs(artifact_dir, exist_ok=True)
+    meta_path = os.path.join(artifact_dir, ARTIFACT_META)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    tfidf = tfidf.tocsr()
+    arrays = {"data": tfidf.data, "indices": tfidf.indices,
+              "indptr": tfidf.indptr, "idf": vectorizer.idf_}
+    for name, values in arrays.items():
+        np.save(os.path.join(artifact_dir, f"{name}.npy"), values)
+    vocabulary = {term: int(column) for term, column in vectorizer.vocabulary_.items()}
+    with open(os.path.join(artifact_dir, "vocabulary.json"), "w",
+              encoding="utf-8") as vocabulary_file:
+        json.dump(vocabulary, vocabulary_file)
+    # O meta é gravado por último: um artefato sem ele é considerado incompleto.
+    with open(meta_path, "w", encoding="utf-8") as meta_file:
+        json.dump({"version": ARTIFACT_VERSION, "catalog_sha256": catalog_hash,
+                   "shape": list(tfidf.shape),
+                   "ngram_range": list(vectorizer.ngram_range)}, meta_file)
+
+
+def load_tfidf_artifact(artifact_dir, catalog_hash, mmap_mode="r"):
+    """
+    Carrega o artefato TF-IDF se ele corresponder ao catálogo e à versão atual.
+
+    Retorna (tfidf, vectorizer) ou (None, None) quando o artefato não existe
+    ou está desatualizado.
+    """
+    # Importado sob demanda para não pesar na importação do módulo.
+    from sklearn.feature_extraction.text import TfidfVectorizer  # pylint: disable=import-outside-toplevel
+
+    meta_path = os.path.join(artifact_dir, ARTIFACT_META)
+    if not os.path.exists(meta_path):
+        return None, None
+    with open(meta_path, encoding="utf-8") as meta_file:
+        meta = json.load(meta_file)
+    if meta.get("version") != ARTIFACT_VERSION or meta.get("catalog_sha256") != catalog_hash:
+        return None, None
+    arrays = {name: np.load(os.path.join(artifact_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+              for name in ARTIFACT_ARRAYS}
+    with open(os.path.join(artifact_dir, "vocabulary.json"), encoding="utf-8") as vocabulary_file:
+        vocabulary = json.load(vocabulary_file)
+    vectorizer = TfidfVectorizer(ngram_range=tuple(meta["ngram_range"]))
+    vectorizer.vocabulary_ = vocabulary
+    vectorizer.idf_ = np.asarray(arrays["idf"])
+    tfidf = sparse.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                              shape=tuple(meta["shape"]), copy=False)
+    return tfidf, vectorizer
@@ -0,0 +1,646 @@
+import io
+import os
+import sys
+import json
+import socket
+import shutil
+import sqlite3
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from episode_downloader import (EpisodeDownloader, IncompleteDownloadError,
+                                create_session, download_file, episode_filename)
+from episode_store import (CREATE_EPISODES_TABLE, CREATE_FEEDS_TABLE, enable_wal, feed_validators,
+                           insert_new_episodes, save_transcripts, transcribed_links)
+from audio_store import AudioStore
+import episode_store
+from podcast_feed import fetch_feed, parse_episodes, parse_episodes_xmltodict
+from benchmark_podcast_summary import fake_audio, synthetic_feed, write_fake_ffmpeg
+from podcast_pipeline import create_tables, load_episodes, run_pipeline
+import instrumentation
+import transcript_search
+from transcript_search import create_search_index, fts_query, search_transcripts
+from transcription import (clear_model_cache, decoder_command, get_model, iter_pcm_file,
+                           iter_process_output, plan_windows, stitch_windows,
+                           transcribe_stream)
+from transcription_engine import TranscriptionEngine
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """
+    Servidor local que serve os arquivos de fixture com suporte a Range.
+    """
+    files = {}
+    truncate = set()
+    requests_seen = []
+
+    def do_GET(self):
+        name = self.path.lstrip("/")
+        if name not in self.files:
+            self.send_error(404)
+            return
+        body = self.files[name]
+        etag = f'"{len(body)}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        range_header = self.headers.get("Range")
+        self.requests_seen.append((name, range_header))
+        if range_header:
+            start = int(range_header.split("=")[1].split("-")[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        chunk = body[start:]
+        self.send_header("Content-Length", str(len(chunk)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        if name in self.truncate and not range_header:
+            # Simula uma conexão interrompida no meio do arquivo: o cabeçalho
+            # anuncia o corpo inteiro, mas o socket cai na metade.
+            self.wfile.write(chunk[:len(chunk) // 2])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            return
+        self.wfile.write(chunk)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_feed(count):
+    items = "".join(
+        f"<item><title>Episode {n}</title><link>https://example.com/episodes/{n}/</link>"
+        f"<pubDate>Mon, 0{n + 1} May 2023 10:00:00 GMT</pubDate>"
+        f"<description>About {n}</description>"
+        f'<enclosure url="https://cdn.example.com/{n}.mp3" length="{n * 100}" type="audio/mpeg"/>'
+        f"</item>" for n in range(count))
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>Feed</title>{items}</channel></rss>'
+
+
+@pytest.fixture
+def fixture_server(tmp_path):
+    fixtures = tmp_path / "fixtures"
+    fixtures.mkdir()
+    for name, size in [("one.mp3", 300_000), ("two.mp3", 150_000), ("three.mp3", 10)]:
+        (fixtures / name).write_bytes(os.urandom(size))
+    (fixtures / "feed.xml").write_text(make_feed(3))
+    FixtureHandler.files = {path.name: path.read_bytes() for path in fixtures.iterdir()}
+    FixtureHandler.truncate = set()
+    FixtureHandler.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def make_episode(base_url, name):
+    return {"link": f"https://example.com/episodes/{name[:-4]}/",
+            "enclosure_url": f"{base_url}/{name}",
+            "enclosure_length": str(len(FixtureHandler.files[name]))}
+
+
+def test_episode_filename():
+    assert episode_filename("https://example.com/2023/show-name/") == "show-name.mp3"
+
+
+def test_download_all_streams_every_episode(fixture_server, tmp_path):
+    folder = tmp_path / "episodes"
+    names = ["one.mp3", "two.mp3", "three.mp3"]
+    episodes = [make_episode(fixture_server, name) for name in names]
+    downloaded = EpisodeDownloader(str(folder), max_workers=3).download_all(episodes)
+    assert [episode["filename"] for episode in downloaded] == names
+    for name in names:
+        assert (folder / name).read_bytes() == FixtureHandler.files[name]
+    assert not list(folder.glob("*.part"))
+
+
+def test_download_resumes_partial_file(fixture_server, tmp_path):
+    FixtureHandler.truncate = {"one.mp3"}
+    path = tmp_path / "one.mp3"
+    episode = make_episode(fixture_server, "one.mp3")
+    with pytest.raises(IncompleteDownloadError):
+        download_file(create_session(), episode["enclosure_url"], str(path),
+                      int(episode["enclosure_length"]))
+    assert not path.exists()
+    offset = (tmp_path / "one.mp3.part").stat().st_size
+    assert 0 < offset < 300_000
+    download_file(create_session(), episode["enclosure_url"], str(path),
+                  int(episode["enclosure_length"]))
+    assert path.read_bytes() == FixtureHandler.files["one.mp3"]
+    assert FixtureHandler.requests_seen[-1] == ("one.mp3", f"bytes={offset}-")
+
+
+def test_downloader_retries_interrupted_download(fixture_server, tmp_path):
+    FixtureHandler.truncate = {"two.mp3"}
+    episode = make_episode(fixture_server, "two.mp3")
+    EpisodeDownloader(str(tmp_path)).download_all([episode])
+    assert (tmp_path / "two.mp3").read_bytes() == FixtureHandler.files["two.mp3"]
+    (first, first_range), (second, second_range) = FixtureHandler.requests_seen
+    assert first == second == "two.mp3" and first_range is None
+    assert second_range.startswith("bytes=") and second_range != "bytes=0-"
+    assert not (tmp_path / "two.mp3.part").exists()
+
+
+def test_download_all_reports_failures(fixture_server, tmp_path):
+    episodes = [make_episode(fixture_server, "one.mp3"),
+                {"link": "https://example.com/missing/",
+                 "enclosure_url": f"{fixture_server}/missing.mp3"}]
+    with pytest.raises(RuntimeError):
+        EpisodeDownloader(str(tmp_path)).download_all(episodes)
+    assert (tmp_path / "one.mp3").exists()
+
+
+def test_model_loaded_once_per_process():
+    loads = []
+    clear_model_cache()
+    first = get_model("test-model", loader=lambda name: loads.append(name) or object())
+    second = get_model("test-model", loader=lambda name: loads.append(name) or object())
+    assert first is second
+    assert loads == ["test-model"]
+    clear_model_cache()
+
+
+class ScriptedRecognizer:
+    """
+    Reconhecedor que conclui uma frase a cada dois blocos.
+    """
+
+    def __init__(self):
+        self.chunks = 0
+
+    def AcceptWaveform(self, data):
+        self.chunks += 1
+        return self.chunks % 2 == 0
+
+    def Result(self):
+        return json.dumps({"text": f"sentence {self.chunks // 2}"})
+
+    def PartialResult(self):
+        return json.dumps({"partial": "sentence"})
+
+    def FinalResult(self):
+        return json.dumps({"text": "tail"})
+
+
+def test_transcribe_stream_keeps_final_result():
+    partials = []
+    transcript = transcribe_stream([b"\0" * 4] * 5, ScriptedRecognizer(),
+                                   on_partial=partials.append)
+    assert transcript == "sentence 1 sentence 2 tail"
+    assert partials == ["sentence"] * 3
+
+
+def test_iter_process_output_streams_in_chunks():
+    command = [sys.executable, "-c", "import sys; sys.stdout.buffer.write(bytes(10000))"]
+    chunks = list(iter_process_output(command, chunk_bytes=4096))
+    assert [len(chunk) for chunk in chunks] == [4096, 4096, 1808]
+
+
+def test_iter_process_output_raises_on_decoder_error():
+    command = [sys.executable, "-c", "import sys; sys.stderr.write('bad header'); sys.exit(1)"]
+    with pytest.raises(RuntimeError, match="bad header"):
+        list(iter_process_output(command))
+
+
+def test_iter_process_output_survives_stderr_flood():
+    # 1 MiB de avisos no stderr antes do áudio: bem mais que o buffer de um pipe.
+    command = [sys.executable, "-c",
+               "import sys; sys.stderr.write('warning\\n' * 131072); sys.stderr.flush(); "
+               "sys.stdout.buffer.write(bytes(10000))"]
+    chunks = []
+    reader = threading.Thread(target=lambda: chunks.extend(iter_process_output(command)),
+                              daemon=True)
+    reader.start()
+    reader.join(timeout=30)
+    assert not reader.is_alive()
+    assert sum(len(chunk) for chunk in chunks) == 10000
+
+
+def test_decoder_command_limits_window():
+    command = decoder_command("a.mp3", start=595, duration=605)
+    assert command[command.index("-ss") + 1] == "595.000"
+    assert command.index("-ss") < command.index("-i") < command.index("-t")
+    assert "-ss" not in decoder_command("a.mp3")
+
+
+def test_plan_windows_overlap_and_cover_episode():
+    assert plan_windows(300, 600, 5) == [(0.0, None)]
+    assert plan_windows(None, 600, 5) == [(0.0, None)]
+    assert plan_windows(10, 4, 1) == [(0.0, 4), (3.0, 4), (6.0, None)]
+    with pytest.raises(ValueError):
+        plan_windows(10, 4, 4)
+
+
+def test_stitch_windows_drops_overlap_duplicates():
+    # Palavras com o tempo absoluto no texto; a sobreposição é de 1 s.
+    first = [(time, f"w{time}") for time in (0, 1, 2, 3)]
+    second = [(time - 3, f"w{time}") for time in (3, 4, 5, 6)]
+    third = [(time - 6, f"w{time}") for time in (6, 7, 8)]
+    transcript = stitch_windows([(0, first), (3, second), (6, third)], 1)
+    assert transcript == " ".join(f"w{time}" for time in range(9))
+
+
+class ChunkRecognizer:
+    """
+    Reconhecedor que conclui uma palavra a cada bloco de áudio.
+    """
+
+    def __init__(self, model, frame_rate):
+        self.chunks = 0
+
+    def AcceptWaveform(self, data):
+        self.chunks += 1
+        return True
+
+    def Result(self):
+        return json.dumps({"text": f"chunk {self.chunks}"})
+
+    def PartialResult(self):
+        return json.dumps({"partial": ""})
+
+    def FinalResult(self):
+        return json.dumps({"text": ""})
+
+
+def load_test_model(model_name):
+    return model_name
+
+
+@pytest.fixture
+def ffmpeg(tmp_path):
+    return write_fake_ffmpeg(str(tmp_path))
+
+
+def test_engine_transcribes_windows_in_parallel(tmp_path, ffmpeg):
+    short, long = tmp_path / "short.mp3", tmp_path / "long.mp3"
+    short.write_text("2")
+    long.write_text("10")
+    metrics = []
+    engine = TranscriptionEngine(max_workers=2, window_seconds=4, overlap_seconds=1,
+                                 model_name="test-model", loader=load_test_model,
+                                 recognizer_factory=ChunkRecognizer, ffmpeg=str(ffmpeg),
+                                 ffprobe=str(ffmpeg),
+                                 metrics=lambda event, **fields: metrics.append((event, fields)))
+    finished = {}
+    short_transcript, long_transcript = engine.transcribe_all(
+        [str(short), str(long)], on_episode=finished.__setitem__)
+    assert finished == {0: short_transcript, 1: long_transcript}
+    # Um resultado a cada bloco de 0,25 s, sem repetições nas sobreposições.
+    assert len(short_transcript.split(" ")) == 2 * 2 * 4
+    assert len(long_transcript.split(" ")) == 2 * 10 * 4
+    events = [event for event, _ in metrics]
+    assert events.count("transcription.window") == 4
+    assert events.count("transcription.episode") == 2
+    assert events[-1] == "transcription.run"
+    episodes = {fields["file"]: fields for event, fields in metrics
+                if event == "transcription.episode"}
+    assert episodes[str(long)]["windows"] == 3
+    assert episodes[str(long)]["audio_seconds"] == 10
+    assert metrics[-1][1]["workers"] == 2
+
+
+def create_episodes_table(path):
+    connection = sqlite3.connect(path)
+    connection.executescript(CREATE_EPISODES_TABLE)
+    connection.executemany("INSERT INTO episodes (link, title) VALUES (?, ?);",
+                           [(f"https://example.com/{n}", f"Episode {n}") for n in range(3)])
+    connection.commit()
+    return connection
+
+
+def test_save_transcripts_upserts_in_batches(tmp_path):
+    connection = create_episodes_table(tmp_path / "podcasts.db")
+    assert enable_wal(connection) == "wal"
+    links = [f"https://example.com/{n}" for n in range(4)]
+    saved = save_transcripts(connection, [(link, f"text {n}") for n, link in enumerate(links)],
+                             batch_size=3)
+    assert saved == 4
+    rows = dict(connection.execute("SELECT link, transcript FROM episodes;"))
+    assert rows == {link: f"text {n}" for n, link in enumerate(links)}
+    # O upsert mantém as demais colunas dos episódios já carregados.
+    assert connection.execute("SELECT title FROM episodes WHERE link = ?;",
+                              (links[0],)).fetchone() == ("Episode 0",)
+    connection.close()
+
+
+def test_transcribed_links_skips_stored_transcripts(tmp_path):
+    connection = create_episodes_table(tmp_path / "podcasts.db")
+    save_transcripts(connection, [("https://example.com/1", "text")])
+    links = [f"https://example.com/{n}" for n in range(3)]
+    assert transcribed_links(connection, links, batch_size=2) == {"https://example.com/1"}
+    connection.close()
+
+
+def test_save_transcripts_rolls_back_on_error(tmp_path):
+    connection = create_episodes_table(tmp_path / "podcasts.db")
+    with pytest.raises(sqlite3.Error):
+        save_transcripts(connection, [("https://example.com/0", "text"), ("only link",)])
+    assert transcribed_links(connection, ["https://example.com/0"]) == set()
+    connection.close()
+
+
+def test_fetch_feed_sends_conditional_request(fixture_server):
+    text, etag, _ = fetch_feed(f"{fixture_server}/feed.xml")
+    assert [episode["link"] for episode in parse_episodes(text)] == [
+        f"https://example.com/episodes/{n}/" for n in range(3)]
+    assert etag
+    assert fetch_feed(f"{fixture_server}/feed.xml", etag=etag) == (None, etag, None)
+
+
+def test_parse_episodes_builds_records():
+    episodes = parse_episodes(make_feed(1))
+    assert episodes == [{"link": "https://example.com/episodes/0/", "title": "Episode 0",
+                         "published": "Mon, 01 May 2023 10:00:00 GMT",
+                         "description": "About 0", "filename": "0.mp3",
+                         "enclosure_url": "https://cdn.example.com/0.mp3",
+                         "enclosure_length": "0"}]
+
+
+def test_insert_new_episodes_returns_only_new(tmp_path):
+    connection = create_episodes_table(tmp_path / "podcasts.db")
+    connection.execute(CREATE_FEEDS_TABLE)
+    feed = [{"link": f"https://example.com/{n}", "title": f"New {n}", "published": None,
+             "description": None, "filename": f"{n}.mp3"} for n in (2, 3, 4, 3)]
+    new_episodes = insert_new_episodes(connection, feed, "https://example.com/feed",
+                                       '"etag"', "Mon, 01 May 2023 10:00:00 GMT")
+    assert [episode["link"] for episode in new_episodes] == [
+        "https://example.com/3", "https://example.com/4"]
+    assert connection.execute("SELECT COUNT(*) FROM episodes;").fetchone() == (5,)
+    # Os episódios já armazenados não são alterados.
+    assert connection.execute("SELECT title FROM episodes WHERE link = ?;",
+                              ("https://example.com/2",)).fetchone() == ("Episode 2",)
+    assert feed_validators(connection, "https://example.com/feed") == (
+        '"etag"', "Mon, 01 May 2023 10:00:00 GMT")
+    assert feed_validators(connection, "https://example.com/other") == (None, None)
+    assert insert_new_episodes(connection, feed) == []
+    connection.close()
+
+
+def test_insert_new_episodes_skips_links_inserted_concurrently(tmp_path, monkeypatch):
+    database = tmp_path / "podcasts.db"
+    connection = create_episodes_table(database)
+    feed = [{"link": f"https://example.com/{n}", "title": f"New {n}", "published": None,
+             "description": None, "filename": f"{n}.mp3"} for n in (5, 6)]
+    original = episode_store.known_links
+
+    def racing_known_links(conn, links):
+        stored = original(conn, links)
+        # Outra tarefa grava o episódio 5 entre a consulta e a inserção.
+        other = sqlite3.connect(database)
+        with other:
+            other.execute("INSERT INTO episodes (link, title, filename) VALUES (?, ?, ?);",
+                          ("https://example.com/5", "Other 5", "5.mp3"))
+        other.close()
+        return stored
+
+    monkeypatch.setattr(episode_store, "known_links", racing_known_links)
+    new_episodes = insert_new_episodes(connection, feed)
+    assert [episode["link"] for episode in new_episodes] == ["https://example.com/6"]
+    assert connection.execute("SELECT title FROM episodes WHERE link = ?;",
+                              ("https://example.com/5",)).fetchone() == ("Other 5",)
+    connection.close()
+
+def test_parse_episodes_matches_xmltodict():
+    content = synthetic_feed(50, description_words=5)
+    assert parse_episodes(content) == parse_episodes_xmltodict(content)
+
+
+def test_parse_episodes_stops_at_known_link():
+    known = {"https://example.com/episodes/1/", "https://example.com/episodes/2/"}
+    episodes = parse_episodes(synthetic_feed(5), is_known=known.__contains__)
+    assert [episode["link"] for episode in episodes] == [
+        f"https://example.com/episodes/{number}/" for number in (5, 4, 3)]
+
+
+def test_search_index_follows_transcript_upserts(tmp_path):
+    connection = create_episodes_table(tmp_path / "podcasts.db")
+    save_transcripts(connection, [("https://example.com/0", "interest rates rose again")])
+    # Episódios gravados antes do índice entram na reconstrução inicial.
+    assert create_search_index(connection)
+    assert not create_search_index(connection)
+    save_transcripts(connection, [
+        ("https://example.com/1", "the fed raised interest rates and rates matter"),
+        ("https://example.com/2", "a story about housing"),
+    ])
+    results = search_transcripts(connection, "rates")
+    assert [result["link"] for result in results] == [
+        "https://example.com/1", "https://example.com/0"]
+    assert "[rates]" in results[0]["snippet"]
+    assert results[0]["title"] == "Episode 1"
+    # Stemming: "raise" encontra "raised".
+    assert [result["link"] for result in search_transcripts(connection, "raise")] == [
+        "https://example.com/1"]
+    save_transcripts(connection, [("https://example.com/2", "interest rates and housing")])
+    assert len(search_transcripts(connection, "interest rates")) == 3
+    assert search_transcripts(connection, "housing")[0]["link"] == "https://example.com/2"
+    connection.execute("DELETE FROM episodes WHERE link = ?;", ("https://example.com/0",))
+    assert len(search_transcripts(connection, "interest rates")) == 2
+    connection.close()
+
+
+def test_search_index_survives_rowid_changes(tmp_path):
+    connection = create_episodes_table(tmp_path / "podcasts.db")
+    create_search_index(connection)
+    save_transcripts(connection, [(f"https://example.com/{n}", f"word{n} shared")
+                                  for n in range(6)])
+    connection.execute("DELETE FROM episodes WHERE link IN (?, ?);",
+                       ("https://example.com/0", "https://example.com/2"))
+    connection.commit()
+    # O rowid implícito de `episodes` (sem INTEGER PRIMARY KEY) não é estável:
+    # o VACUUM pode renumerá-lo, e reconstruir a tabela (como no procedimento
+    # de ALTER TABLE do SQLite) sempre renumera.
+    connection.execute("VACUUM;")
+    connection.executescript("""
+        CREATE TABLE episodes_copy (link TEXT PRIMARY KEY, title TEXT, filename TEXT,
+                                    published TEXT, description TEXT, transcript TEXT);
+        INSERT INTO episodes_copy SELECT * FROM episodes ORDER BY link DESC;
+        DROP TABLE episodes;
+        ALTER TABLE episodes_copy RENAME TO episodes;
+    """)
+    create_search_index(connection)
+    for n in (1, 3, 4, 5):
+        assert [result["link"] for result in search_transcripts(connection, f"word{n}")] == [
+            f"https://example.com/{n}"]
+    assert search_transcripts(connection, "word0") == []
+    save_transcripts(connection, [("https://example.com/5", "word9")])
+    assert search_transcripts(connection, "word5") == []
+    assert [result["link"] for result in search_transcripts(connection, "word9")] == [
+        "https://example.com/5"]
+    connection.close()
+
+
+def test_search_index_migrates_external_content_table(tmp_path):
+    connection = create_episodes_table(tmp_path / "podcasts.db")
+    save_transcripts(connection, [("https://example.com/0", "interest rates")])
+    connection.executescript(
+        "CREATE VIRTUAL TABLE episodes_fts USING fts5(title, transcript, "
+        "content='episodes', content_rowid='rowid');")
+    assert create_search_index(connection)
+    assert [result["link"] for result in search_transcripts(connection, "rates")] == [
+        "https://example.com/0"]
+    connection.close()
+
+
+def test_search_index_rebuild_failure_rolls_back(tmp_path, monkeypatch):
+    connection = create_episodes_table(tmp_path / "podcasts.db")
+    save_transcripts(connection, [("https://example.com/0", "interest rates")])
+    monkeypatch.setattr(transcript_search, "REBUILD_SEARCH_INDEX",
+                        "DELETE FROM episodes_fts;\nINSERT INTO missing_table VALUES (1);")
+    with pytest.raises(sqlite3.OperationalError):
+        create_search_index(connection)
+    assert not connection.in_transaction
+    assert connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'episodes_fts';").fetchone() is None
+    monkeypatch.undo()
+    assert create_search_index(connection)
+    assert [result["link"] for result in search_transcripts(connection, "rates")] == [
+        "https://example.com/0"]
+    connection.close()
+
+
+def test_fts_query_quotes_user_input():
+    assert fts_query('rates AND "fed" -housing') == '"rates" "AND" "fed" "housing"'
+    assert fts_query("...") == ""
+
+
+def test_store_downloads_once_and_deduplicates(fixture_server, tmp_path):
+    store = AudioStore(str(tmp_path / "store"))
+    downloader = EpisodeDownloader(str(tmp_path / "store"), store=store)
+    episode = make_episode(fixture_server, "one.mp3")
+    first = downloader.download(episode)
+    assert first["filename"] == store.relative_path(first["sha256"])
+    with open(tmp_path / "store" / first["filename"], "rb") as audio:
+        assert audio.read() == FixtureHandler.files["one.mp3"]
+    # Mesmo enclosure republicado sob outro link: nenhum download novo.
+    republished = dict(episode, link="https://example.com/episodes/one-again/")
+    assert downloader.download(republished)["sha256"] == first["sha256"]
+    assert len(FixtureHandler.requests_seen) == 1
+    # Mesmo conteúdo em outra URL: baixado, mas guardado uma única vez.
+    FixtureHandler.files["copy.mp3"] = FixtureHandler.files["one.mp3"]
+    copy = downloader.download(make_episode(fixture_server, "copy.mp3"))
+    assert copy["sha256"] == first["sha256"]
+    assert store.total_bytes() == len(FixtureHandler.files["one.mp3"])
+    assert os.listdir(store.incoming) == []
+    store.close()
+
+
+def test_store_discards_incomplete_files(fixture_server, tmp_path):
+    store = AudioStore(str(tmp_path / "store"))
+    downloader = EpisodeDownloader(str(tmp_path / "store"), store=store)
+    episode = make_episode(fixture_server, "two.mp3")
+    sha256 = downloader.download(episode)["sha256"]
+    with open(store.path(sha256), "r+b") as audio:
+        audio.truncate(100)
+    assert store.lookup(episode["link"]) is None
+    assert downloader.download(episode)["sha256"] == sha256
+    assert os.path.getsize(store.path(sha256)) == len(FixtureHandler.files["two.mp3"])
+    store.close()
+
+
+def test_store_keeps_pcm_derivative_and_evicts_lru(tmp_path, ffmpeg):
+    store = AudioStore(str(tmp_path / "store"))
+    hashes = []
+    for number, seconds in enumerate(["2", "1"]):
+        source = tmp_path / f"{number}.mp3"
+        source.write_text(seconds)
+        hashes.append(store.add(str(source), f"https://example.com/{number}"))
+    pcm_path = store.pcm(hashes[0], ffmpeg=str(ffmpeg))
+    assert os.path.getsize(pcm_path) == 2 * 16000 * 2
+    # O derivado já existe: o ffmpeg não é chamado de novo.
+    assert store.pcm(hashes[0], ffmpeg="missing-ffmpeg") == pcm_path
+    store.lookup("https://example.com/1")
+    evicted = store.evict(max_bytes=store.total_bytes() - 1)
+    assert evicted == [(hashes[0], "audio")]
+    assert store.lookup("https://example.com/0") is None
+    assert os.path.exists(pcm_path)
+    store.close()
+
+
+def test_store_removes_partial_pcm_on_decoder_failure(tmp_path):
+    store = AudioStore(str(tmp_path / "store"))
+    source = tmp_path / "corrupt.mp3"
+    source.write_text("corrupt")
+    sha256 = store.add(str(source), "https://example.com/corrupt")
+    broken = tmp_path / "broken_ffmpeg"
+    broken.write_text(f"#!{sys.executable}\nimport sys\n"
+                      "sys.stdout.buffer.write(bytes(100000)); sys.exit(1)\n")
+    broken.chmod(0o755)
+    with pytest.raises(RuntimeError):
+        store.pcm(sha256, ffmpeg=str(broken))
+    assert os.listdir(tmp_path / "store" / "derived") == []
+    store.close()
+
+
+def test_iter_pcm_file_reads_window(tmp_path):
+    path = tmp_path / "audio.pcm"
+    path.write_bytes(bytes(range(256)) * 250)
+    chunks = list(iter_pcm_file(str(path), frame_rate=8000, chunk_bytes=1000,
+                                start=1, duration=0.5))
+    assert [len(chunk) for chunk in chunks] == [1000] * 8
+    assert chunks[0][:4] == path.read_bytes()[16000:16004]
+
+
+def test_pipeline_runs_end_to_end(fixture_server, tmp_path, ffmpeg):
+    FixtureHandler.files = {f"{number}.mp3": fake_audio(number + 1, 5000)
+                            for number in range(1, 4)}
+    FixtureHandler.files["feed.xml"] = synthetic_feed(
+        3, 5, fixture_server, {number: 5000 for number in range(1, 4)})
+    engine = TranscriptionEngine(max_workers=2, window_seconds=4, overlap_seconds=1,
+                                 model_name="test-model", loader=load_test_model,
+                                 recognizer_factory=ChunkRecognizer,
+                                 metrics=lambda event, **fields: None)
+    db_path = str(tmp_path / "podcasts.db")
+    summary = run_pipeline(f"{fixture_server}/feed.xml", db_path, str(tmp_path / "episodes"),
+                           engine, download_workers=2, queue_size=1, ffmpeg=ffmpeg)
+    assert (summary["episodes"], summary["transcribed"], summary["failures"]) == (3, 3, [])
+    assert {"fetch", "load", "download", "decode", "transcribe", "store"} <= set(
+        summary["stages"])
+    assert summary["stages"]["download"]["items"] == 3
+    connection = sqlite3.connect(db_path)
+    transcripts = dict(connection.execute("SELECT link, transcript FROM episodes;"))
+    # Um resultado de duas palavras a cada 0,25 s de áudio.
+    assert {link: len(text.split(" ")) for link, text in transcripts.items()} == {
+        f"https://example.com/episodes/{number}/": 2 * 4 * (number + 1)
+        for number in range(1, 4)}
+    assert len(search_transcripts(connection, "chunk")) == 3
+    connection.close()
+    # Na segunda execução o feed responde 304 e nenhum áudio é baixado de novo.
+    requests_before = list(FixtureHandler.requests_seen)
+    summary = run_pipeline(f"{fixture_server}/feed.xml", db_path, str(tmp_path / "episodes"),
+                           engine, ffmpeg=ffmpeg)
+    assert summary["episodes"] == 0
+    assert FixtureHandler.requests_seen == requests_before
+
+
+def test_pipeline_stages_are_instrumented():
+    connection = sqlite3.connect(":memory:")
+    feed = {"episodes": parse_episodes(synthetic_feed(3, 5, "https://example.com")),
+            "etag": None, "last_modified": None}
+    output = io.StringIO()
+    instrumentation.enable(output)
+    try:
+        create_tables(connection)
+        load_episodes(connection, feed, "https://example.com/feed.xml")
+    finally:
+        instrumentation.disable()
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [(record["stage"], record["items"]) for record in records] == [
+        ("podcast.create_tables", None), ("podcast.load_episodes", 3)]
+
+
+def test_pipeline_imports_from_copied_dags_folder(tmp_path):
+    # Implantação usual: a pasta do projeto copiada sozinha para dags/ do Airflow.
+    project = os.path.dirname(os.path.abspath(__file__))
+    dags = tmp_path / "dags"
+    shutil.copytree(project, dags, ignore=shutil.ignore_patterns("__pycache__"))
+    result = subprocess.run([sys.executable, "-c", "import podcast_pipeline"],
+                            cwd=dags, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
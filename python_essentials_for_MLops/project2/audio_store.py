@@ -0,0 +1,236 @@
+"""
+audio_store.py - Armazenamento endereçado por conteúdo do áudio dos episódios.
+
+Cada arquivo é guardado pelo SHA-256 do seu conteúdo (objects/ab/abcd....mp3)
+e registrado em um manifesto SQLite junto com o tamanho e o último uso. Um
+episódio só conta como baixado se o manifesto tiver o arquivo e o tamanho em
+disco conferir; enclosures idênticos (mesma URL ou mesmo conteúdo sob outro
+link) apontam para o mesmo arquivo.
+
+Também ficam no armazenamento os derivados em PCM s16le de 16 kHz mono
+(derived/abcd....pcm), para que novas tentativas de transcrição não precisem
+decodificar o MP3 de novo. Acima de `max_bytes`, os arquivos usados há mais
+tempo são removidos.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+from transcription import FFMPEG, FRAME_RATE, PCM_SUFFIX, iter_pcm_chunks
+
+MANIFEST = "manifest.sqlite"
+# 20 GiB de áudio e derivados.
+MAX_BYTES = 20 * 2**30
+
+CREATE_MANIFEST = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT,
+    kind TEXT,
+    path TEXT,
+    size INTEGER,
+    last_used REAL,
+    PRIMARY KEY (sha256, kind)
+);
+CREATE TABLE IF NOT EXISTS enclosures (
+    link TEXT PRIMARY KEY,
+    enclosure_url TEXT,
+    sha256 TEXT
+);
+CREATE INDEX IF NOT EXISTS enclosures_url ON enclosures (enclosure_url);
+"""
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """
+    Calcula o hash SHA-256 do conteúdo de um arquivo.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as source:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AudioStore:
+    """
+    Pasta de áudio endereçada por conteúdo com manifesto e limite de tamanho.
+    """
+
+    def __init__(self, folder, max_bytes=MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.incoming = os.path.join(folder, "incoming")
+        os.makedirs(self.incoming, exist_ok=True)
+        # A conexão é compartilhada pelas threads de download, sob o lock.
+        self._connection = sqlite3.connect(os.path.join(folder, MANIFEST),
+                                           check_same_thread=False)
+        self._connection.executescript(CREATE_MANIFEST)
+        self._lock = threading.Lock()
+
+    def close(self):
+        """
+        Fecha o manifesto.
+        """
+        self._connection.close()
+
+    def relative_path(self, sha256, kind="audio"):
+        """
+        Caminho de um arquivo, relativo à pasta do armazenamento.
+        """
+        if kind == "audio":
+            return os.path.join("objects", sha256[:2], f"{sha256}.mp3")
+        return os.path.join("derived", f"{sha256}{PCM_SUFFIX}")
+
+    def path(self, sha256, kind="audio"):
+        """
+        Caminho absoluto (ou relativo ao diretório atual) de um arquivo.
+        """
+        return os.path.join(self.folder, self.relative_path(sha256, kind))
+
+    def _valid(self, sha256, kind):
+        """
+        Confere se o arquivo está no manifesto e no disco com o tamanho certo.
+
+        Entradas incompletas são removidas. Deve ser chamada sob o lock.
+        """
+        row = self._connection.execute(
+            "SELECT size FROM blobs WHERE sha256 = ? AND kind = ?;", (sha256, kind)).fetchone()
+        if row is None:
+            return False
+        path = self.path(sha256, kind)
+        if os.path.exists(path) and os.path.getsize(path) == row[0]:
+            self._connection.execute(
+                "UPDATE blobs SET last_used = ? WHERE sha256 = ? AND kind = ?;",
+                (time.time(), sha256, kind))
+            self._connection.commit()
+            return True
+        logging.info("Discarding incomplete %s %s", kind, sha256)
+        self._forget(sha256, kind)
+        return False
+
+    def _forget(self, sha256, kind):
+        """
+        Remove um arquivo do disco e do manifesto. Deve ser chamada sob o lock.
+        """
+        path = self.path(sha256, kind)
+        if os.path.exists(path):
+            os.remove(path)
+        with self._connection:
+            self._connection.execute("DELETE FROM blobs WHERE sha256 = ? AND kind = ?;",
+                                     (sha256, kind))
+
+    def _record(self, sha256, kind, size):
+        """
+        Registra um arquivo no manifesto. Deve ser chamada sob o lock.
+        """
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO blobs (sha256, kind, path, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?);",
+                (sha256, kind, self.relative_path(sha256, kind), size, time.time()))
+
+    def lookup(self, link, enclosure_url=None):
+        """
+        Retorna o hash do áudio completo de um episódio, ou None.
+
+        O episódio é encontrado pelo link ou, se republicado sob outro link,
+        pela URL do enclosure; nesse caso o link novo passa a apontar para o
+        mesmo arquivo.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT sha256 FROM enclosures WHERE link = ? OR enclosure_url = ? "
+                "ORDER BY link = ? DESC LIMIT 1;", (link, enclosure_url, link)).fetchone()
+            if row is None or not self._valid(row[0], "audio"):
+                return None
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR IGNORE INTO enclosures (link, enclosure_url, sha256) "
+                    "VALUES (?, ?, ?);", (link, enclosure_url, row[0]))
+            return row[0]
+
+    def add(self, file_path, link, enclosure_url=None):
+        """
+        Move um arquivo baixado para o armazenamento e retorna o seu hash.
+
+        Se o mesmo conteúdo já estiver guardado, o arquivo novo é descartado
+        e o episódio passa a apontar para o existente.
+        """
+        sha256 = file_sha256(file_path)
+        size = os.path.getsize(file_path)
+        with self._lock:
+            if self._valid(sha256, "audio"):
+                logging.info("Deduplicated %s as %s", link, sha256)
+                os.remove(file_path)
+            else:
+                destination = self.path(sha256)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                os.replace(file_path, destination)
+                self._record(sha256, "audio", size)
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO enclosures (link, enclosure_url, sha256) "
+                    "VALUES (?, ?, ?);", (link, enclosure_url, sha256))
+        return sha256
+
+    def pcm(self, sha256, frame_rate=FRAME_RATE, ffmpeg=FFMPEG):
+        """
+        Retorna o caminho do derivado PCM de 16 kHz mono, decodificando-o se preciso.
+        """
+        with self._lock:
+            if self._valid(sha256, "pcm"):
+                return self.path(sha256, "pcm")
+            if not self._valid(sha256, "audio"):
+                raise FileNotFoundError(f"audio {sha256} is not in the store")
+        destination = self.path(sha256, "pcm")
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        # Um .part por thread: dois links com o mesmo conteúdo podem decodificar juntos.
+        part_path = f"{destination}.{threading.get_ident()}.part"
+        try:
+            with open(part_path, "wb") as part_file:
+                for chunk in iter_pcm_chunks(self.path(sha256), frame_rate, 1 << 16, ffmpeg):
+                    part_file.write(chunk)
+            os.replace(part_path, destination)
+        except Exception:
+            # O .part não está no manifesto e o evict nunca o removeria.
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        with self._lock:
+            self._record(sha256, "pcm", os.path.getsize(destination))
+        return destination
+
+    def total_bytes(self):
+        """
+        Tamanho total dos arquivos registrados no manifesto.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM blobs;").fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """
+        Remove os arquivos usados há mais tempo até o total caber em `max_bytes`.
+
+        Retorna a lista de (hash, tipo) removidos.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        evicted = []
+        with self._lock:
+            total = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM blobs;").fetchone()[0]
+            rows = self._connection.execute(
+                "SELECT sha256, kind, size FROM blobs ORDER BY last_used;").fetchall()
+            for sha256, kind, size in rows:
+                if total <= max_bytes:
+                    break
+                self._forget(sha256, kind)
+                total -= size
+                evicted.append((sha256, kind))
+        if evicted:
+            logging.info("Evicted %d files from the audio store", len(evicted))
+        return evicted
@@ -0,0 +1,362 @@
+"""
+benchmark_podcast_summary.py - Benchmarks do pipeline de podcasts.
+
+Uso:
+    python benchmark_podcast_summary.py --episodes 5
+    python benchmark_podcast_summary.py --model vosk-model-small-en-us-0.15 --audio a.mp3 b.mp3
+    python benchmark_podcast_summary.py --feed-items 20000
+    python benchmark_podcast_summary.py --transcripts 3000
+    python benchmark_podcast_summary.py --pipeline 8
+
+Sem --model, o modelo e o reconhecedor do Vosk são substituídos por dublês com
+tempo de carga configurável, para medir só o custo de carregar o modelo. Com
+--feed-items, compara a leitura de um feed sintético com o xmltodict e com o
+parser em streaming. Com --transcripts, compara a busca FTS5 nos transcritos
+com uma varredura LIKE. Com --pipeline, executa o pipeline inteiro
+(`podcast_pipeline.run_pipeline`) contra um feed e um servidor HTTP locais,
+com dublês do ffmpeg e do Vosk, e mostra o tempo de cada etapa.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from episode_store import CREATE_EPISODES_TABLE, save_transcripts
+from podcast_pipeline import run_pipeline
+from transcript_search import create_search_index, search_transcripts, search_transcripts_like
+from podcast_feed import parse_episodes, parse_episodes_xmltodict
+from transcription import (CHUNK_BYTES, FRAME_RATE, clear_model_cache, get_model,
+                           transcribe_file, transcribe_stream)
+from transcription_engine import TranscriptionEngine
+
+# Dublê do ffmpeg/ffprobe: a primeira linha do "áudio" é a sua duração em
+# segundos, e a decodificação gera silêncio PCM de 16 kHz com essa duração.
+FAKE_FFMPEG = """#!{python}
+import sys
+args = sys.argv[1:]
+path = args[-1] if "-show_entries" in args else args[args.index("-i") + 1]
+with open(path, "rb") as audio:
+    seconds = float(audio.readline())
+if "-show_entries" in args:
+    print(seconds)
+    sys.exit(0)
+start = float(args[args.index("-ss") + 1]) if "-ss" in args else 0.0
+if "-t" in args:
+    seconds = min(seconds, start + float(args[args.index("-t") + 1]))
+sys.stdout.buffer.write(bytes(int(round((seconds - start) * 16000)) * 2))
+"""
+
+
+class FakeModel:
+    """
+    Dublê do vosk.Model que demora `load_seconds` para carregar.
+    """
+
+    def __init__(self, model_name, load_seconds=2.0):
+        time.sleep(load_seconds)
+        self.model_name = model_name
+
+
+class FakeRecognizer:
+    """
+    Dublê do KaldiRecognizer que devolve uma palavra por bloco de áudio.
+    """
+
+    def __init__(self, model, frame_rate, real_time_factor=0.0):
+        self.model = model
+        self.frame_rate = frame_rate
+        # Segundos de CPU gastos por segundo de áudio, para simular o Kaldi.
+        self.real_time_factor = real_time_factor
+
+    def AcceptWaveform(self, data):  # pylint: disable=invalid-name
+        deadline = time.perf_counter() + self.real_time_factor * len(data) / (2 * self.frame_rate)
+        while time.perf_counter() < deadline:
+            pass
+        return bool(data)
+
+    def Result(self):  # pylint: disable=invalid-name
+        return json.dumps({"text": "word"})
+
+    def PartialResult(self):  # pylint: disable=invalid-name
+        return json.dumps({"partial": ""})
+
+    def FinalResult(self):  # pylint: disable=invalid-name
+        return json.dumps({"text": ""})
+
+
+def _silence(seconds, frame_rate=FRAME_RATE):
+    """
+    Blocos de silêncio PCM de 16 bits, como os entregues pelo decodificador.
+    """
+    chunk = bytes(CHUNK_BYTES)
+    return [chunk] * max(1, seconds * frame_rate * 2 // CHUNK_BYTES)
+
+
+def benchmark_model_cache(episodes, episode_seconds=600, load_seconds=2.0,
+                          model_name=None, audio_files=None):
+    """
+    Transcreve vários episódios em sequência recarregando o modelo a cada um
+    (comportamento antigo) e reaproveitando o modelo do processo.
+    """
+    if model_name:
+        jobs = audio_files
+
+        def load(name):
+            return get_model(name)
+    else:
+        jobs = [_silence(episode_seconds) for _ in range(episodes)]
+        model_name = "fake-model"
+
+        def load(name):
+            return get_model(name, loader=lambda name: FakeModel(name, load_seconds))
+
+    def transcribe(job, model):
+        if isinstance(job, str):
+            return transcribe_file(job, model)
+        return transcribe_stream(job, FakeRecognizer(model, FRAME_RATE))
+
+    results = {}
+    for mode in ("reload", "cached"):
+        clear_model_cache()
+        start = time.perf_counter()
+        for job in jobs:
+            if mode == "reload":
+                clear_model_cache()
+            transcribe(job, load(model_name))
+        results[mode] = time.perf_counter() - start
+    results["saved_seconds"] = results["reload"] - results["cached"]
+    results["episodes"] = len(jobs)
+    return results
+
+
+def synthetic_feed(items, description_words=200, base_url="https://cdn.example.com",
+                   lengths=None):
+    """
+    Gera um feed RSS com `items` episódios, do mais novo para o mais antigo.
+
+    Os enclosures apontam para `base_url`/<número>.mp3; `lengths` pode dar o
+    tamanho de cada enclosure por número do episódio.
+    """
+    description = escape("<p>" + " ".join(["marketplace"] * description_words) + "</p>")
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>'
+             '<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">'
+             '<channel><title>Synthetic</title><link>https://example.com/</link>']
+    for number in range(items, 0, -1):
+        parts.append(
+            f"<item><title>Episode {number}</title>"
+            f"<link>https://example.com/episodes/{number}/</link>"
+            f"<pubDate>Mon, 01 May 2023 10:00:00 GMT</pubDate>"
+            f"<description>{description}</description>"
+            f"<itunes:duration>00:30:00</itunes:duration>"
+            f'<enclosure url="{base_url}/{number}.mp3"'
+            f' length="{(lengths or {}).get(number, number * 1000)}"'
+            f' type="audio/mpeg"/></item>')
+    parts.append("</channel></rss>")
+    return "".join(parts).encode("utf-8")
+
+
+def _measure(function, *args, **kwargs):
+    """
+    Executa a função e retorna (resultado, segundos, pico de memória em MB).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak / 2**20
+
+
+def benchmark_feed_parser(items, new_items=10):
+    """
+    Lê um feed sintético com o xmltodict, com o parser em streaming e com o
+    parser em streaming parando após `new_items` episódios novos.
+    """
+    content = synthetic_feed(items)
+    known = {f"https://example.com/episodes/{number}/"
+             for number in range(1, items - new_items + 1)}
+    runs = {
+        "xmltodict": (parse_episodes_xmltodict, (content,), {}),
+        "iterparse": (parse_episodes, (content,), {}),
+        "iterparse_early_stop": (parse_episodes, (content,), {"is_known": known.__contains__}),
+    }
+    results = {"items": items, "feed_mb": len(content) / 2**20}
+    for name, (function, args, kwargs) in runs.items():
+        episodes, seconds, peak_mb = _measure(function, *args, **kwargs)
+        results[name] = {"episodes": len(episodes), "seconds": seconds, "peak_mb": peak_mb}
+    return results
+
+
+SEARCH_TERMS = ["term1", "term500", "term15000", "term500 term15000"]
+
+
+def synthetic_transcripts(episodes, words=5000, vocabulary=20000, seed=42):
+    """
+    Gera transcritos com palavras sorteadas com frequências de Zipf.
+    """
+    rng = random.Random(seed)
+    terms = [f"term{number}" for number in range(vocabulary)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary)]
+    for number in range(episodes):
+        yield (f"https://example.com/episodes/{number}/",
+               " ".join(rng.choices(terms, weights, k=words)))
+
+
+def benchmark_transcript_search(episodes, words=5000, repeats=5):
+    """
+    Compara a busca FTS5 com a varredura LIKE em um banco com `episodes`
+    transcritos sintéticos, para termos frequentes, medianos e raros e uma
+    consulta de duas palavras.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        connection = sqlite3.connect(os.path.join(folder, "podcasts.db"))
+        connection.executescript(CREATE_EPISODES_TABLE)
+        create_search_index(connection)
+        start = time.perf_counter()
+        save_transcripts(connection, synthetic_transcripts(episodes, words))
+        results = {"episodes": episodes, "words": words,
+                   "load_seconds": time.perf_counter() - start,
+                   "db_mb": os.path.getsize(os.path.join(folder, "podcasts.db")) / 2**20}
+        for term in SEARCH_TERMS:
+            timings = {}
+            for name, function in (("fts5", search_transcripts),
+                                   ("like", search_transcripts_like)):
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    function(connection, term)
+                timings[name] = (time.perf_counter() - start) / repeats
+            results[term] = timings
+        connection.close()
+    return results
+
+
+def write_fake_ffmpeg(folder):
+    """
+    Grava o dublê do ffmpeg/ffprobe em `folder` e retorna o seu caminho.
+    """
+    path = os.path.join(folder, "fake_ffmpeg")
+    with open(path, "w", encoding="utf-8") as script:
+        script.write(FAKE_FFMPEG.format(python=sys.executable))
+    os.chmod(path, 0o755)
+    return path
+
+
+def fake_audio(seconds, size):
+    """
+    Conteúdo de um "MP3" de `size` bytes que o dublê do ffmpeg decodifica
+    como `seconds` segundos de silêncio.
+    """
+    header = f"{seconds}\n".encode()
+    return header + os.urandom(max(size - len(header), 0))
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """
+    Servidor de arquivos estáticos sem log das requisições.
+    """
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+def benchmark_pipeline(episodes, episode_seconds=600, audio_mb=5.0, workers=None,
+                       download_workers=4, real_time_factor=0.01, load_seconds=1.0):
+    """
+    Executa o pipeline inteiro contra um feed e um servidor HTTP locais.
+
+    O ffmpeg e o Vosk são substituídos por dublês: o reconhecedor gasta
+    `real_time_factor` segundos de CPU por segundo de áudio.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        public = os.path.join(folder, "public")
+        os.makedirs(public)
+        lengths = {}
+        for number in range(1, episodes + 1):
+            content = fake_audio(episode_seconds, int(audio_mb * 2**20))
+            lengths[number] = len(content)
+            with open(os.path.join(public, f"{number}.mp3"), "wb") as audio:
+                audio.write(content)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=public))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        with open(os.path.join(public, "feed.xml"), "wb") as feed:
+            feed.write(synthetic_feed(episodes, 50, base_url, lengths))
+        engine = TranscriptionEngine(
+            max_workers=workers, model_name="fake-model",
+            loader=partial(FakeModel, load_seconds=load_seconds),
+            recognizer_factory=partial(FakeRecognizer, real_time_factor=real_time_factor),
+            metrics=lambda event, **fields: None)
+        try:
+            summary = run_pipeline(f"{base_url}/feed.xml", os.path.join(folder, "podcasts.db"),
+                                   os.path.join(folder, "episodes"), engine,
+                                   download_workers=download_workers,
+                                   ffmpeg=write_fake_ffmpeg(folder))
+        finally:
+            server.shutdown()
+    return summary
+
+
+def main():
+    """
+    Função principal dos benchmarks.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--episodes", type=int, default=5)
+    parser.add_argument("--load-seconds", type=float, default=2.0,
+                        help="tempo de carga do modelo dublê")
+    parser.add_argument("--model", help="nome de um modelo real do Vosk")
+    parser.add_argument("--audio", nargs="*", help="arquivos MP3 para o modelo real")
+    parser.add_argument("--feed-items", type=int,
+                        help="compara os parsers de feed com um feed sintético desse tamanho")
+    parser.add_argument("--transcripts", type=int,
+                        help="compara a busca FTS5 com LIKE nesse número de transcritos")
+    parser.add_argument("--pipeline", type=int,
+                        help="executa o pipeline inteiro com esse número de episódios locais")
+    args = parser.parse_args()
+    if args.pipeline:
+        summary = benchmark_pipeline(args.pipeline, load_seconds=min(args.load_seconds, 1.0))
+        print(f"{summary['episodes']} episódios, {summary['transcribed']} transcritos "
+              f"em {summary['total_seconds']:.2f}s:")
+        for stage, stats in summary["stages"].items():
+            print(f"  {stage}: {stats['items']} itens, de {stats['start']:.2f}s a "
+                  f"{stats['end']:.2f}s, {stats['busy_seconds']:.2f}s ocupados")
+        return
+    if args.transcripts:
+        results = benchmark_transcript_search(args.transcripts)
+        print(f"{results['episodes']} transcritos de {results['words']} palavras "
+              f"({results['db_mb']:.1f} MB, gravados em {results['load_seconds']:.2f}s):")
+        for term in SEARCH_TERMS:
+            timings = results[term]
+            print(f"  {term}: FTS5 {timings['fts5'] * 1000:.2f} ms, "
+                  f"LIKE {timings['like'] * 1000:.2f} ms")
+        return
+    if args.feed_items:
+        results = benchmark_feed_parser(args.feed_items)
+        print(f"Feed com {results['items']} episódios ({results['feed_mb']:.1f} MB):")
+        for name in ("xmltodict", "iterparse", "iterparse_early_stop"):
+            run = results[name]
+            print(f"  {name}: {run['episodes']} episódios em {run['seconds']:.3f}s, "
+                  f"pico de {run['peak_mb']:.1f} MB")
+        return
+    if args.model and not args.audio:
+        parser.error("--model exige arquivos em --audio")
+    results = benchmark_model_cache(args.episodes, load_seconds=args.load_seconds,
+                                    model_name=args.model, audio_files=args.audio)
+    print(f"{results['episodes']} episódios: recarregando o modelo "
+          f"{results['reload']:.2f}s, com o modelo em cache {results['cached']:.2f}s "
+          f"({results['saved_seconds']:.2f}s economizados)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+episode_downloader.py - Download concorrente e em streaming dos episódios.
+
+Cada arquivo é gravado em blocos em um arquivo temporário (.part) e renomeado
+atomicamente ao final. Downloads interrompidos são retomados com HTTP Range e
+o tamanho final é conferido com o tamanho informado no enclosure do feed.
+"""
+
+import os
+import logging
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CHUNK_SIZE = 1 << 16
+MAX_WORKERS = 4
+PER_HOST_LIMIT = 2
+ATTEMPTS = 3
+TIMEOUT = (10, 60)
+
+
+class IncompleteDownloadError(IOError):
+    """
+    O arquivo baixado não tem o tamanho esperado.
+    """
+
+
+def create_session(pool_size=MAX_WORKERS, retries=3):
+    """
+    Cria uma Session com pool de conexões e novas tentativas com backoff.
+    """
+    retry = Retry(total=retries, backoff_factor=0.5,
+                  status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=["GET", "HEAD"])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def episode_filename(link):
+    """
+    Nome do arquivo de áudio de um episódio a partir do seu link.
+    """
+    return f"{link.rstrip('/').split('/')[-1]}.mp3"
+
+
+def _expected_length(response, offset):
+    """
+    Tamanho total do arquivo segundo os cabeçalhos da resposta, se houver.
+    """
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    if "Content-Length" in response.headers:
+        return offset + int(response.headers["Content-Length"])
+    return None
+
+
+def download_file(session, url, path, expected_length=None, chunk_size=CHUNK_SIZE,
+                  timeout=TIMEOUT):
+    """
+    Baixa `url` para `path` em streaming, retomando um .part existente.
+
+    Retorna o número de bytes do arquivo final. Levanta
+    IncompleteDownloadError se a conexão cair no meio do corpo ou se o
+    tamanho não conferir; nesse caso o .part é mantido para que a próxima
+    tentativa continue de onde parou.
+    """
+    part_path = f"{path}.part"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416:
+            # O .part já contém o arquivo inteiro.
+            response.close()
+        else:
+            response.raise_for_status()
+            if response.status_code != 206:
+                # O servidor ignorou o Range: recomeça do zero.
+                offset = 0
+            total = _expected_length(response, offset)
+            expected_length = expected_length or total
+            with open(part_path, "ab" if offset else "wb") as part_file:
+                try:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        part_file.write(chunk)
+                except (requests.exceptions.ChunkedEncodingError,
+                        requests.ConnectionError) as e:
+                    raise IncompleteDownloadError(
+                        f"{url}: connection lost after "
+                        f"{offset + part_file.tell()} bytes") from e
+    size = os.path.getsize(part_path)
+    if expected_length and size != expected_length:
+        raise IncompleteDownloadError(
+            f"{url}: got {size} of {expected_length} bytes")
+    os.replace(part_path, path)
+    return size
+
+
+class EpisodeDownloader:
+    """
+    Baixa vários episódios em paralelo, com limite de conexões por host.
+    """
+
+    def __init__(self, folder, max_workers=MAX_WORKERS, per_host=PER_HOST_LIMIT,
+                 attempts=ATTEMPTS, session=None, store=None):
+        self.folder = folder
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.attempts = attempts
+        self.session = session or create_session(pool_size=max_workers)
+        # Com um AudioStore, os arquivos são guardados pelo hash do conteúdo.
+        self.store = store
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def _host_limit(self, url):
+        """
+        Semáforo que limita os downloads simultâneos de um mesmo host.
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_limits[host]
+
+    def _fetch(self, episode, path, expected_length):
+        """
+        Baixa o enclosure de um episódio para `path`, com novas tentativas.
+        """
+        with self._host_limit(episode["enclosure_url"]):
+            logging.info("Downloading %s", os.path.basename(path))
+            for attempt in range(1, self.attempts + 1):
+                try:
+                    download_file(self.session, episode["enclosure_url"], path,
+                                  expected_length)
+                    break
+                except (IncompleteDownloadError, requests.RequestException) as e:
+                    # A próxima tentativa retoma o .part com HTTP Range; erros
+                    # HTTP (404, 403...) não melhoram com novas tentativas.
+                    if isinstance(e, requests.HTTPError) or attempt == self.attempts:
+                        raise
+                    logging.info("Resuming %s after: %s", os.path.basename(path), str(e))
+
+    def download(self, episode):
+        """
+        Baixa um episódio (dicionário com link, enclosure_url e enclosure_length).
+
+        Retorna o link e o nome do arquivo relativo à pasta de destino; com um
+        AudioStore, também o hash do conteúdo.
+        """
+        filename = episode_filename(episode["link"])
+        expected_length = int(episode.get("enclosure_length") or 0) or None
+        if self.store is not None:
+            sha256 = self.store.lookup(episode["link"], episode["enclosure_url"])
+            if sha256 is None:
+                path = os.path.join(self.store.incoming, filename)
+                self._fetch(episode, path, expected_length)
+                sha256 = self.store.add(path, episode["link"], episode["enclosure_url"])
+            return {"link": episode["link"], "filename": self.store.relative_path(sha256),
+                    "sha256": sha256}
+        path = os.path.join(self.folder, filename)
+        if os.path.exists(path) and (expected_length is None
+                                     or os.path.getsize(path) == expected_length):
+            return {"link": episode["link"], "filename": filename}
+        self._fetch(episode, path, expected_length)
+        return {"link": episode["link"], "filename": filename}
+
+    def download_all(self, episodes):
+        """
+        Baixa todos os episódios e retorna os que foram concluídos, na ordem recebida.
+
+        Falhas são registradas no log e, ao final, levantam RuntimeError para
+        que a tarefa seja repetida; os arquivos já concluídos são mantidos.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        results, failures = {}, []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.download, episode): position
+                       for position, episode in enumerate(episodes)}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    failures.append(episodes[futures[future]]["link"])
+                    logging.error("Error downloading %s: %s",
+                                  episodes[futures[future]]["link"], str(e))
+        if failures:
+            raise RuntimeError(f"{len(failures)} download(s) failed: {failures}")
+        return [results[position] for position in sorted(results)]
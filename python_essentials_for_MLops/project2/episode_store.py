@@ -0,0 +1,153 @@
+"""
+episode_store.py - Persistência dos episódios no banco SQLite `podcasts`.
+
+As funções recebem uma conexão sqlite3 (no Airflow, a do SqliteHook) para que
+as tarefas troquem apenas links e status pelo XCom; os transcritos vão direto
+para o banco.
+"""
+
+import logging
+
+BATCH_SIZE = 500
+
+CREATE_EPISODES_TABLE = """
+CREATE TABLE IF NOT EXISTS episodes (
+    link TEXT PRIMARY KEY,
+    title TEXT,
+    filename TEXT,
+    published TEXT,
+    description TEXT,
+    transcript TEXT
+);
+"""
+
+CREATE_FEEDS_TABLE = """
+CREATE TABLE IF NOT EXISTS feeds (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT
+);
+"""
+
+EPISODE_FIELDS = ["link", "title", "published", "description", "filename"]
+
+INSERT_EPISODE = f"""
+INSERT OR IGNORE INTO episodes ({", ".join(EPISODE_FIELDS)})
+VALUES ({", ".join("?" * len(EPISODE_FIELDS))});
+"""
+
+UPSERT_FEED = """
+INSERT INTO feeds (url, etag, last_modified) VALUES (?, ?, ?)
+ON CONFLICT(url) DO UPDATE SET etag = excluded.etag,
+                               last_modified = excluded.last_modified;
+"""
+
+UPSERT_TRANSCRIPT = """
+INSERT INTO episodes (link, transcript) VALUES (?, ?)
+ON CONFLICT(link) DO UPDATE SET transcript = excluded.transcript;
+"""
+
+
+def enable_wal(connection):
+    """
+    Coloca o banco em modo WAL, em que leitores não bloqueiam a escrita.
+    """
+    mode = connection.execute("PRAGMA journal_mode=WAL;").fetchone()[0]
+    # Em WAL, NORMAL só sincroniza o disco nos checkpoints e continua seguro.
+    connection.execute("PRAGMA synchronous=NORMAL;")
+    return mode
+
+
+def _batches(items, batch_size):
+    """
+    Divide uma lista em lotes de até `batch_size` itens.
+    """
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def _select_links(connection, links, condition="1", batch_size=BATCH_SIZE):
+    """
+    Retorna, dentre os links dados, os que estão na tabela e atendem à condição.
+
+    A consulta usa só a chave primária, em lotes de `batch_size` links.
+    """
+    links = list(links)
+    found = set()
+    for batch in _batches(links, batch_size):
+        placeholders = ", ".join("?" * len(batch))
+        rows = connection.execute(
+            f"SELECT link FROM episodes WHERE {condition} "
+            f"AND link IN ({placeholders});", batch)
+        found.update(link for link, in rows)
+    return found
+
+
+def transcribed_links(connection, links, batch_size=BATCH_SIZE):
+    """
+    Retorna, dentre os links dados, os que já têm transcrito salvo.
+    """
+    return _select_links(connection, links, "transcript IS NOT NULL", batch_size)
+
+
+def known_links(connection, links, batch_size=BATCH_SIZE):
+    """
+    Retorna, dentre os links dados, os que já estão na tabela.
+    """
+    return _select_links(connection, links, batch_size=batch_size)
+
+
+def feed_validators(connection, url):
+    """
+    Retorna (etag, last_modified) da última leitura do feed, ou (None, None).
+    """
+    row = connection.execute("SELECT etag, last_modified FROM feeds WHERE url = ?;",
+                             (url,)).fetchone()
+    return tuple(row) if row else (None, None)
+
+
+def insert_new_episodes(connection, episodes, feed_url=None, etag=None,
+                        last_modified=None):
+    """
+    Insere os episódios que ainda não estão na tabela e retorna só esses.
+
+    Os links do feed são comparados com a tabela pela chave primária para
+    descartar os já conhecidos; os demais são inseridos com INSERT OR IGNORE
+    e só contam como novos se a inserção gravou a linha. Assim, um episódio
+    inserido por outra tarefa entre a consulta e a inserção não é devolvido
+    (e baixado) duas vezes. Os validadores do feed são gravados na mesma
+    transação, para que um 304 na próxima leitura só aconteça se os
+    episódios desta leitura tiverem sido gravados.
+    """
+    unique = list({episode["link"]: episode for episode in episodes}.values())
+    stored = known_links(connection, [episode["link"] for episode in unique])
+    new_episodes = []
+    with connection:
+        for episode in unique:
+            if episode["link"] in stored:
+                continue
+            cursor = connection.execute(INSERT_EPISODE,
+                                        [episode[field] for field in EPISODE_FIELDS])
+            if cursor.rowcount == 1:
+                new_episodes.append(episode)
+        if feed_url is not None:
+            connection.execute(UPSERT_FEED, (feed_url, etag, last_modified))
+    return new_episodes
+
+
+def save_transcripts(connection, transcripts, batch_size=BATCH_SIZE):
+    """
+    Grava os transcritos (pares link, texto) em uma única transação.
+
+    Os registros são enviados em lotes com executemany; episódios que ainda
+    não estão na tabela são inseridos. Retorna o número de transcritos gravados.
+    """
+    transcripts = list(transcripts)
+    try:
+        with connection:
+            for batch in _batches(transcripts, batch_size):
+                connection.executemany(UPSERT_TRANSCRIPT, batch)
+    except Exception as e:
+        logging.error("Error saving %d transcripts: %s", len(transcripts), str(e))
+        raise
+    return len(transcripts)
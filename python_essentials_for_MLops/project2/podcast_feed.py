@@ -0,0 +1,121 @@
+"""
+podcast_feed.py - Download condicional e leitura do feed RSS do podcast.
+
+O feed é pedido com os validadores da última resposta (ETag e
+Last-Modified); quando o servidor responde 304 Not Modified o feed não é
+baixado nem analisado de novo.
+
+Os itens são lidos em streaming com `iterparse`: cada <item> vira um
+registro leve e é descartado da árvore em seguida, e a leitura pode parar no
+primeiro episódio já conhecido.
+"""
+
+import io
+import logging
+from xml.etree.ElementTree import iterparse
+
+import requests
+import xmltodict
+
+from episode_downloader import TIMEOUT, episode_filename
+
+
+def fetch_feed(url, etag=None, last_modified=None, session=None, timeout=TIMEOUT):
+    """
+    Baixa o feed com uma requisição condicional.
+
+    Retorna (conteúdo, etag, last_modified); o conteúdo (bytes) é None quando
+    o feed não mudou desde a resposta que gerou os validadores informados.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = (session or requests).get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304:
+        logging.info("Feed %s not modified", url)
+        return None, etag, last_modified
+    response.raise_for_status()
+    return (response.content, response.headers.get("ETag"),
+            response.headers.get("Last-Modified"))
+
+
+def episode_record(item):
+    """
+    Converte um item do xmltodict no registro de episódio usado pelo pipeline.
+    """
+    enclosure = item.get("enclosure") or {}
+    return {
+        "link": item["link"],
+        "title": item.get("title"),
+        "published": item.get("pubDate"),
+        "description": item.get("description"),
+        "filename": episode_filename(item["link"]),
+        "enclosure_url": enclosure.get("@url"),
+        "enclosure_length": enclosure.get("@length"),
+    }
+
+
+def parse_episodes_xmltodict(content):
+    """
+    Lê os episódios convertendo o feed inteiro com o xmltodict.
+
+    Mantida como referência para os testes e benchmarks de `parse_episodes`.
+    """
+    items = xmltodict.parse(content)["rss"]["channel"].get("item") or []
+    if isinstance(items, dict):
+        # O xmltodict devolve um dicionário quando o feed tem um único item.
+        items = [items]
+    return [episode_record(item) for item in items]
+
+
+def _item_record(item):
+    """
+    Converte um elemento <item> no registro de episódio usado pelo pipeline.
+    """
+    link = item.findtext("link")
+    enclosure = item.find("enclosure")
+    return {
+        "link": link,
+        "title": item.findtext("title"),
+        "published": item.findtext("pubDate"),
+        "description": item.findtext("description"),
+        "filename": episode_filename(link),
+        "enclosure_url": enclosure.get("url") if enclosure is not None else None,
+        "enclosure_length": enclosure.get("length") if enclosure is not None else None,
+    }
+
+
+def iter_episodes(source, is_known=None):
+    """
+    Gera os episódios de um feed RSS (arquivo ou objeto com read) em streaming.
+
+    Cada <item> é removido da árvore assim que o seu registro é gerado, então
+    a memória não cresce com o tamanho do feed. Se `is_known(link)` for
+    informado, a leitura para no primeiro episódio já conhecido: os feeds
+    listam os episódios do mais novo para o mais antigo.
+    """
+    channel = None
+    for event, element in iterparse(source, events=("start", "end")):
+        if event == "start":
+            if element.tag == "channel":
+                channel = element
+            continue
+        if element.tag != "item":
+            continue
+        record = _item_record(element)
+        if channel is not None:
+            channel.remove(element)
+        if is_known is not None and is_known(record["link"]):
+            return
+        yield record
+
+
+def parse_episodes(content, is_known=None):
+    """
+    Lê os episódios de um feed RSS (bytes ou texto).
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return list(iter_episodes(io.BytesIO(content), is_known))
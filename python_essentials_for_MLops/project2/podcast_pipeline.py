@@ -0,0 +1,268 @@
+"""
+podcast_pipeline.py - Etapas do pipeline de podcasts e executor fora do Airflow.
+
+As etapas são funções comuns, usadas tanto pelas tarefas do DAG
+(`podcast_summary.py`) quanto pelo executor assíncrono deste módulo, que roda
+o pipeline inteiro em um só processo: os downloads e as transcrições são
+ligados por filas limitadas, então os episódios começam a ser transcritos
+enquanto os demais ainda estão sendo baixados.
+
+Uso:
+    python podcast_pipeline.py --feed-url https://www.marketplace.org/feed/podcast/marketplace/
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import argparse
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_store import MAX_BYTES, AudioStore
+from episode_downloader import MAX_WORKERS, PER_HOST_LIMIT, EpisodeDownloader
+from episode_store import (CREATE_EPISODES_TABLE, CREATE_FEEDS_TABLE, enable_wal,
+                           feed_validators, insert_new_episodes, known_links,
+                           save_transcripts, transcribed_links)
+from instrumentation import instrument
+from podcast_feed import fetch_feed, parse_episodes
+from transcript_search import create_search_index
+from transcription import FFMPEG, FRAME_RATE
+from transcription_engine import TranscriptionEngine
+
+QUEUE_SIZE = 4
+
+
+@instrument("podcast.create_tables")
+def create_tables(connection):
+    """
+    Cria as tabelas de episódios e feeds e o índice de busca dos transcritos.
+    """
+    connection.executescript(CREATE_EPISODES_TABLE + CREATE_FEEDS_TABLE)
+    if create_search_index(connection):
+        logging.info("Created the transcript search index.")
+
+
+@instrument("podcast.fetch_episodes", items=lambda feed: len(feed["episodes"]))
+def fetch_episodes(connection, feed_url, session=None):
+    """
+    Baixa o feed com uma requisição condicional e lê os episódios novos.
+
+    Retorna um dicionário com os episódios (lidos até o primeiro já
+    armazenado) e os validadores da resposta.
+    """
+    etag, last_modified = feed_validators(connection, feed_url)
+    content, etag, last_modified = fetch_feed(feed_url, etag, last_modified, session)
+    episodes = [] if content is None else parse_episodes(
+        content, is_known=lambda link: bool(known_links(connection, [link])))
+    logging.info("Found %d episodes.", len(episodes))
+    return {"episodes": episodes, "etag": etag, "last_modified": last_modified}
+
+
+@instrument("podcast.load_episodes", items=len)
+def load_episodes(connection, feed, feed_url):
+    """
+    Grava os episódios novos do feed e os validadores e retorna os novos.
+    """
+    new_episodes = insert_new_episodes(connection, feed["episodes"], feed_url,
+                                       feed["etag"], feed["last_modified"])
+    logging.info("Loaded %d new episodes.", len(new_episodes))
+    return new_episodes
+
+
+@instrument("podcast.download_episodes", items=len)
+def download_episodes(episodes, store, max_workers=MAX_WORKERS, per_host=PER_HOST_LIMIT,
+                      session=None):
+    """
+    Baixa os episódios para o armazenamento de áudio, em paralelo.
+    """
+    downloader = EpisodeDownloader(store.folder, max_workers=max_workers,
+                                   per_host=per_host, session=session, store=store)
+    return downloader.download_all(episodes)
+
+
+@instrument("podcast.transcribe_episodes", items=len)
+def transcribe_episodes(connection, episodes, store, engine, ffmpeg=FFMPEG):
+    """
+    Transcreve os episódios baixados que ainda não têm transcrito e grava os
+    transcritos no banco. Retorna o link e o status de cada episódio.
+    """
+    enable_wal(connection)
+    stored = transcribed_links(connection, [episode["link"] for episode in episodes])
+    pending = [episode for episode in episodes if episode["link"] not in stored]
+    with ThreadPoolExecutor(max_workers=engine.max_workers) as executor:
+        paths = list(executor.map(
+            lambda episode: store.pcm(episode["sha256"], engine.frame_rate, ffmpeg), pending))
+    transcripts = []
+    try:
+        engine.transcribe_all(paths, on_episode=lambda position, transcript: transcripts.append(
+            (pending[position]["link"], transcript)))
+    finally:
+        # Os episódios concluídos são gravados mesmo se outros falharem.
+        save_transcripts(connection, transcripts)
+    store.evict()
+    return [{"link": episode["link"],
+             "status": "skipped" if episode["link"] in stored else "transcribed"}
+            for episode in episodes]
+
+
+class StageTimer:
+    """
+    Acumula o tempo de cada etapa do pipeline.
+
+    Para cada etapa guarda o primeiro início e o último fim (relativos ao
+    início do pipeline), o tempo ocupado somado e o número de itens, o que
+    mostra quanto as etapas se sobrepuseram.
+    """
+
+    def __init__(self):
+        self.began = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def measure(self, stage):
+        """
+        Mede um item de uma etapa.
+        """
+        start = time.perf_counter() - self.began
+        try:
+            yield
+        finally:
+            end = time.perf_counter() - self.began
+            stats = self.stages.setdefault(stage, {"start": start, "end": end,
+                                                   "busy_seconds": 0.0, "items": 0})
+            stats["start"] = min(stats["start"], start)
+            stats["end"] = max(stats["end"], end)
+            stats["busy_seconds"] += end - start
+            stats["items"] += 1
+
+    def report(self):
+        """
+        Retorna as estatísticas das etapas e o tempo total.
+        """
+        return {"total_seconds": time.perf_counter() - self.began,
+                "stages": {stage: dict(stats, wall_seconds=stats["end"] - stats["start"])
+                           for stage, stats in self.stages.items()}}
+
+
+async def run_pipeline_async(feed_url, db_path, folder, engine, download_workers=MAX_WORKERS,
+                             per_host=PER_HOST_LIMIT, queue_size=QUEUE_SIZE,
+                             max_bytes=MAX_BYTES, ffmpeg=FFMPEG, session=None):
+    """
+    Executa o pipeline inteiro: feed, carga, downloads e transcrições.
+
+    Os episódios novos passam por duas filas limitadas a `queue_size`
+    itens: a dos downloads e a das transcrições, consumidas em paralelo por
+    `download_workers` e `engine.max_workers` tarefas. Os transcritos são
+    gravados ao final em uma única transação. Retorna um resumo com o tempo
+    de cada etapa.
+    """
+    timer = StageTimer()
+    loop = asyncio.get_running_loop()
+    connection = sqlite3.connect(db_path, check_same_thread=False)
+    store = AudioStore(folder, max_bytes=max_bytes)
+    downloader = EpisodeDownloader(folder, max_workers=download_workers, per_host=per_host,
+                                   session=session, store=store)
+    # A conexão do SQLite é usada sempre pela mesma thread.
+    database = ThreadPoolExecutor(max_workers=1)
+    workers = ThreadPoolExecutor(max_workers=download_workers + engine.max_workers)
+    download_queue = asyncio.Queue(queue_size)
+    transcribe_queue = asyncio.Queue(queue_size)
+    transcripts, failures = [], []
+
+    async def run(executor, stage, function, *args):
+        with timer.measure(stage):
+            return await loop.run_in_executor(executor, function, *args)
+
+    async def produce(episodes):
+        for episode in episodes:
+            await download_queue.put(episode)
+        for _ in range(download_workers):
+            await download_queue.put(None)
+
+    async def download():
+        while (episode := await download_queue.get()) is not None:
+            try:
+                await transcribe_queue.put(
+                    await run(workers, "download", downloader.download, episode))
+            except Exception as e:
+                logging.error("Error downloading %s: %s", episode["link"], str(e))
+                failures.append(episode["link"])
+
+    async def transcribe():
+        while (episode := await transcribe_queue.get()) is not None:
+            try:
+                path = await run(workers, "decode", store.pcm, episode["sha256"],
+                                 engine.frame_rate, ffmpeg)
+                with timer.measure("transcribe"):
+                    future = await loop.run_in_executor(workers, engine.submit, path)
+                    transcripts.append((episode["link"], await asyncio.wrap_future(future)))
+            except Exception as e:
+                logging.error("Error transcribing %s: %s", episode["link"], str(e))
+                failures.append(episode["link"])
+
+    try:
+        await run(database, "create_tables", create_tables, connection)
+        feed = await run(database, "fetch", fetch_episodes, connection, feed_url, session)
+        new_episodes = await run(database, "load", load_episodes, connection, feed, feed_url)
+        stored = await run(database, "load", transcribed_links, connection,
+                           [episode["link"] for episode in new_episodes])
+        pending = [episode for episode in new_episodes if episode["link"] not in stored]
+        with engine:
+            transcribers = [asyncio.ensure_future(transcribe())
+                            for _ in range(engine.max_workers)]
+            await asyncio.gather(produce(pending),
+                                 *(download() for _ in range(download_workers)))
+            for _ in transcribers:
+                await transcribe_queue.put(None)
+            await asyncio.gather(*transcribers)
+        await run(database, "store", save_transcripts, connection, transcripts)
+        await run(database, "store", store.evict)
+    finally:
+        await loop.run_in_executor(database, connection.close)
+        database.shutdown()
+        workers.shutdown()
+        store.close()
+    summary = dict(timer.report(), episodes=len(new_episodes), transcribed=len(transcripts),
+                   skipped=len(new_episodes) - len(pending), failures=failures)
+    if failures:
+        raise RuntimeError(f"{len(failures)} episode(s) failed: {failures}")
+    return summary
+
+
+def run_pipeline(feed_url, db_path, folder, engine=None, **kwargs):
+    """
+    Versão síncrona de `run_pipeline_async`.
+    """
+    return asyncio.run(run_pipeline_async(feed_url, db_path, folder,
+                                          engine or TranscriptionEngine(), **kwargs))
+
+
+def main():
+    """
+    Função principal do executor.
+    """
+    parser = argparse.ArgumentParser(description="Executa o pipeline de podcasts sem o Airflow.")
+    parser.add_argument("--feed-url", required=True)
+    parser.add_argument("--db", default="podcasts.db", help="banco SQLite dos episódios")
+    parser.add_argument("--folder", default="episodes", help="pasta do armazenamento de áudio")
+    parser.add_argument("--download-workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--per-host", type=int, default=PER_HOST_LIMIT)
+    parser.add_argument("--transcription-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--model", default=None, help="nome do modelo do Vosk")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    engine_options = {"model_name": args.model} if args.model else {}
+    engine = TranscriptionEngine(max_workers=args.transcription_workers,
+                                 frame_rate=FRAME_RATE, **engine_options)
+    summary = run_pipeline(args.feed_url, args.db, args.folder, engine,
+                           download_workers=args.download_workers, per_host=args.per_host,
+                           queue_size=args.queue_size)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,14 @@
-import json
 import logging
 import os
-import requests
-import xmltodict
+from contextlib import closing
 
 from airflow.decorators import dag, task
 import pendulum
-from airflow.providers.sqlite.operators.sqlite import SqliteOperator
 from airflow.providers.sqlite.hooks.sqlite import SqliteHook
 
-from vosk import Model, KaldiRecognizer
-from pydub import AudioSegment
+from audio_store import AudioStore
+import podcast_pipeline
+from transcription_engine import TranscriptionEngine
 
 logging.basicConfig(
     filename='podcast_summary.log',  # Especifica o arquivo de log
@@ -22,6 +20,19 @@ logging.basicConfig(
 PODCAST_URL = "https://www.marketplace.org/feed/podcast/marketplace/"
 EPISODE_FOLDER = "episodes"
 FRAME_RATE = 16000
+DOWNLOAD_WORKERS = 4
+DOWNLOADS_PER_HOST = 2
+# Processos de transcrição; cada um carrega o seu próprio modelo do Vosk.
+TRANSCRIPTION_WORKERS = os.cpu_count()
+# Limite do armazenamento de áudio (MP3 e derivados PCM), com descarte LRU.
+AUDIO_STORE_MAX_BYTES = 20 * 2**30
+
+
+def podcasts_connection():
+    """
+    Conexão com o banco `podcasts` do Airflow, fechada ao sair do bloco.
+    """
+    return closing(SqliteHook(sqlite_conn_id="podcasts").get_conn())
 
 
 @dag(
@@ -31,21 +42,23 @@ FRAME_RATE = 16000
     catchup=False,
 )
 def podcast_summary():
+    """
+    Cada tarefa apenas abre os recursos do Airflow e chama a etapa
+    correspondente de `podcast_pipeline`, que também pode ser executado sem o
+    Airflow (`python podcast_pipeline.py`).
+    """
 
-    create_database = SqliteOperator(
-        task_id='create_table_sqlite',
-        sql=r"""
-        CREATE TABLE IF NOT EXISTS episodes (
-            link TEXT PRIMARY KEY,
-            title TEXT,
-            filename TEXT,
-            published TEXT,
-            description TEXT,
-            transcript TEXT
-        );
-        """,
-        sqlite_conn_id="podcasts"
-    )
+    @task()
+    def create_database():
+        try:
+            """
+            Tarefa para criar as tabelas de episódios e feeds e o índice de busca dos transcritos.
+            """
+            with podcasts_connection() as connection:
+                podcast_pipeline.create_tables(connection)
+        except Exception as e:
+            logging.error("Error in create_database: %s", str(e))
+            raise
 
     @task()
     def get_episodes():
@@ -53,112 +66,65 @@ def podcast_summary():
             """
             Tarefa para obter dados do feed do podcast.
 
-            Faz uma solicitação HTTP para o URL do feed do podcast, analisa os dados XML e retorna a lista de episódios.
+            Faz uma solicitação HTTP condicional com o ETag/Last-Modified da última leitura; se o feed não mudou, retorna uma lista vazia sem analisar o XML. Caso contrário, lê os itens em streaming até o primeiro episódio já armazenado e retorna os episódios novos e os novos validadores.
             """
-            data = requests.get(PODCAST_URL)
-            feed = xmltodict.parse(data.text)
-            episodes = feed["rss"]["channel"]["item"]
-            print(f"Found {len(episodes)} episodes.")
-            return episodes
+            with podcasts_connection() as connection:
+                return podcast_pipeline.fetch_episodes(connection, PODCAST_URL)
         except Exception as e:
             logging.error("Error in get_episodes: %s", str(e))
             raise
 
     @task()
-    def load_episodes(episodes):
+    def load_episodes(feed):
         try:
             """
             Tarefa para carregar episódios novos no banco de dados.
 
-            Compara os episódios obtidos com os já armazenados no banco de dados SQLite e adiciona novos episódios.
+            Consulta apenas os links (chave primária) já armazenados, insere os episódios novos com INSERT OR IGNORE e grava os validadores do feed na mesma transação.
             """
-            hook = SqliteHook(sqlite_conn_id="podcasts")
-            stored_episodes = hook.get_pandas_df("SELECT * from episodes;")
-            new_episodes = []
-
-            for episode in episodes:
-                if episode["link"] not in stored_episodes["link"].values:
-                    filename = f"{episode['link'].split('/')[-1]}.mp3"
-                    new_episodes.append([episode["link"], episode["title"],
-                                        episode["pubDate"], episode["description"], filename])
-
-            hook.insert_rows(table='episodes', rows=new_episodes, target_fields=[
-                             "link", "title", "published", "description", "filename"])
-            return new_episodes
+            with podcasts_connection() as connection:
+                return podcast_pipeline.load_episodes(connection, feed, PODCAST_URL)
         except Exception as e:
             logging.error("Error in load_episodes: %s", str(e))
             raise
 
     @task()
-    def download_episode(episode):
+    def download_episodes(episodes):
         try:
             """
-            Tarefa para baixar um episódio de áudio.
+            Tarefa para baixar os arquivos de áudio dos episódios novos.
 
-            Faz o download do arquivo de áudio do episódio, salva-o localmente e retorna informações sobre o episódio.
+            Baixa vários episódios em paralelo, em streaming, retomando downloads parciais e conferindo o tamanho de cada arquivo. Os arquivos são guardados pelo hash do conteúdo, então enclosures já baixados (inclusive sob outro link) não são baixados de novo.
             """
-            link = episode["link"]
-            name_end = link.split('/')[-1]
-            filename = f"{name_end}.mp3"
-            audio_path = os.path.join(EPISODE_FOLDER, filename)
-
-            if not os.path.exists(audio_path):
-                print(f"Downloading {filename}")
-                audio = requests.get(episode["enclosure"]["@url"])
-                with open(audio_path, "wb+") as f:
-                    f.write(audio.content)
-
-            return {"link": link, "filename": filename}
+            with closing(AudioStore(EPISODE_FOLDER, max_bytes=AUDIO_STORE_MAX_BYTES)) as store:
+                return podcast_pipeline.download_episodes(
+                    episodes, store, max_workers=DOWNLOAD_WORKERS, per_host=DOWNLOADS_PER_HOST)
         except Exception as e:
-            logging.error("Error in download_episode: %s", str(e))
+            logging.error("Error in download_episodes: %s", str(e))
             raise
 
     @task()
-    def transcribe_episode(episode):
+    def transcribe_episodes(episodes):
         try:
             """
-            Tarefa para transcrever um episódio de áudio para texto.
+            Tarefa para transcrever os episódios de áudio para texto e gravar os transcritos no banco.
 
-            Utiliza um modelo de reconhecimento de voz para transcrever o áudio do episódio em texto.
+            Distribui os episódios, e as janelas de tempo dos episódios longos, por um pool de processos e publica o progresso como métricas estruturadas. Os transcritos são gravados direto no banco em uma única transação; pelo XCom passam apenas o link e o status de cada episódio, e episódios já transcritos são pulados. O áudio é lido dos derivados PCM de 16 kHz do armazenamento, decodificados uma única vez.
             """
-            link = episode["link"]
-            filename = episode["filename"]
-            filepath = os.path.join(EPISODE_FOLDER, filename)
-
-            model = Model(model_name="vosk-model-en-us-0.22-lgraph")
-            rec = KaldiRecognizer(model, FRAME_RATE)
-            rec.SetWords(True)
-
-            mp3 = AudioSegment.from_mp3(filepath)
-            mp3 = mp3.set_channels(1)
-            mp3 = mp3.set_frame_rate(FRAME_RATE)
-
-            step = 20000
-            transcript = ""
-
-            for i in range(0, len(mp3), step):
-                print(f"Progress: {i/len(mp3)}")
-                segment = mp3[i:i+step]
-                rec.AcceptWaveform(segment.raw_data)
-                result = rec.Result()
-                text = json.loads(result)["text"]
-                transcript += text
-
-            return {"link": link, "transcript": transcript}
+            engine = TranscriptionEngine(max_workers=TRANSCRIPTION_WORKERS, frame_rate=FRAME_RATE)
+            with podcasts_connection() as connection, \
+                    closing(AudioStore(EPISODE_FOLDER, max_bytes=AUDIO_STORE_MAX_BYTES)) as store:
+                return podcast_pipeline.transcribe_episodes(connection, episodes, store, engine)
         except Exception as e:
-            logging.error("Error in transcribe_episode: %s", str(e))
+            logging.error("Error in transcribe_episodes: %s", str(e))
             raise
 
+    database = create_database()
     episodes = get_episodes()
     new_episodes = load_episodes(episodes)
-    downloaded_episodes = [download_episode(
-        episode) for episode in new_episodes]
-    transcribed_episodes = [transcribe_episode(
-        episode) for episode in downloaded_episodes]
-
-    create_database >> episodes >> new_episodes >> downloaded_episodes >> transcribed_episodes
+    downloaded_episodes = download_episodes(new_episodes)
+    transcribed_episodes = transcribe_episodes(downloaded_episodes)
 
-    # Uncomment this to try speech to text (may not work)
-    # speech_to_text(audio_files, new_episodes)
+    database >> episodes >> new_episodes >> downloaded_episodes >> transcribed_episodes
 
 summary = podcast_summary()
@@ -0,0 +1,153 @@
+"""
+transcript_search.py - Busca textual nos transcritos dos episódios.
+
+Mantém uma tabela virtual FTS5 (`episodes_fts`) com o título e o transcrito
+de cada episódio, sincronizada por gatilhos, então os upserts do pipeline
+atualizam o índice na mesma transação.
+
+O rowid do índice não pode ser o rowid implícito de `episodes`: a chave dela
+é `link TEXT PRIMARY KEY`, e sem um INTEGER PRIMARY KEY o VACUUM (ou uma
+reconstrução da tabela) pode renumerar os rowids, apontando os resultados
+para os episódios errados. Por isso o índice guarda o próprio texto e usa
+como rowid o `id` da tabela `episode_search_ids`, um INTEGER PRIMARY KEY
+associado ao link de cada episódio, que o VACUUM preserva.
+"""
+
+import re
+
+SEARCH_RESULTS = 10
+SNIPPET_TOKENS = 12
+
+CREATE_SEARCH_INDEX = """
+CREATE TABLE IF NOT EXISTS episode_search_ids (
+    id INTEGER PRIMARY KEY,
+    link TEXT UNIQUE NOT NULL
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS episodes_fts USING fts5(
+    title, transcript,
+    tokenize='porter unicode61'
+);
+
+CREATE TRIGGER IF NOT EXISTS episodes_fts_insert AFTER INSERT ON episodes BEGIN
+    INSERT OR IGNORE INTO episode_search_ids (link) VALUES (new.link);
+    INSERT INTO episodes_fts (rowid, title, transcript)
+    SELECT id, new.title, new.transcript FROM episode_search_ids WHERE link = new.link;
+END;
+
+CREATE TRIGGER IF NOT EXISTS episodes_fts_delete AFTER DELETE ON episodes BEGIN
+    DELETE FROM episodes_fts
+    WHERE rowid = (SELECT id FROM episode_search_ids WHERE link = old.link);
+    DELETE FROM episode_search_ids WHERE link = old.link;
+END;
+
+CREATE TRIGGER IF NOT EXISTS episodes_fts_update AFTER UPDATE OF link, title, transcript
+ON episodes BEGIN
+    DELETE FROM episodes_fts
+    WHERE rowid = (SELECT id FROM episode_search_ids WHERE link = old.link);
+    DELETE FROM episode_search_ids WHERE link = old.link;
+    INSERT OR IGNORE INTO episode_search_ids (link) VALUES (new.link);
+    INSERT INTO episodes_fts (rowid, title, transcript)
+    SELECT id, new.title, new.transcript FROM episode_search_ids WHERE link = new.link;
+END;
+"""
+
+# Remove o índice antigo, de conteúdo externo ligado ao rowid de `episodes`.
+DROP_SEARCH_INDEX = """
+DROP TRIGGER IF EXISTS episodes_fts_insert;
+DROP TRIGGER IF EXISTS episodes_fts_delete;
+DROP TRIGGER IF EXISTS episodes_fts_update;
+DROP TABLE IF EXISTS episodes_fts;
+"""
+
+REBUILD_SEARCH_INDEX = """
+DELETE FROM episodes_fts;
+DELETE FROM episode_search_ids;
+INSERT INTO episode_search_ids (link) SELECT link FROM episodes;
+INSERT INTO episodes_fts (rowid, title, transcript)
+SELECT ids.id, episodes.title, episodes.transcript
+FROM episodes JOIN episode_search_ids AS ids ON ids.link = episodes.link;
+"""
+
+SEARCH_QUERY = f"""
+SELECT episodes.link, episodes.title, bm25(episodes_fts) AS rank,
+       snippet(episodes_fts, 1, '[', ']', '...', {SNIPPET_TOKENS}) AS snippet
+FROM episodes_fts
+JOIN episode_search_ids AS ids ON ids.id = episodes_fts.rowid
+JOIN episodes ON episodes.link = ids.link
+WHERE episodes_fts MATCH ?
+ORDER BY rank
+LIMIT ?;
+"""
+
+
+def create_search_index(connection):
+    """
+    Cria o índice FTS5 e os gatilhos de sincronização, se ainda não existirem.
+
+    Na primeira criação o índice é reconstruído a partir dos episódios já
+    armazenados; um índice do formato antigo (conteúdo externo ligado ao
+    rowid de `episodes`) é descartado e reconstruído. Os gatilhos são
+    recriados se faltarem, por exemplo depois de uma reconstrução da tabela
+    `episodes`. Retorna True se o índice foi criado agora.
+    """
+    row = connection.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'episodes_fts';"
+    ).fetchone()
+    exists = row is not None and "content=" not in row[0]
+    script = CREATE_SEARCH_INDEX
+    if not exists:
+        script = DROP_SEARCH_INDEX + CREATE_SEARCH_INDEX + REBUILD_SEARCH_INDEX
+    # O executescript confirma a transação aberta e executa cada comando em
+    # modo autocommit; o BEGIN/COMMIT no próprio script torna a criação
+    # atômica, para que uma falha na reconstrução não deixe um índice vazio
+    # que as próximas chamadas considerariam pronto.
+    try:
+        connection.executescript(f"BEGIN;\n{script}\nCOMMIT;")
+    except Exception:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK;")
+        raise
+    return not exists
+
+
+def fts_query(text):
+    """
+    Converte um texto livre em uma consulta FTS5 que exige todas as palavras.
+
+    Cada palavra vira um termo entre aspas, então pontuação e operadores do
+    FTS5 digitados pelo usuário não geram erros de sintaxe.
+    """
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", text))
+
+
+def search_transcripts(connection, text, limit=SEARCH_RESULTS):
+    """
+    Busca episódios pelo título e pelo transcrito, do mais ao menos relevante.
+
+    Retorna uma lista de dicionários com link, title, rank (bm25, menor é
+    melhor) e snippet, um trecho do transcrito com os termos entre colchetes.
+    """
+    query = fts_query(text)
+    if not query:
+        return []
+    rows = connection.execute(SEARCH_QUERY, (query, limit))
+    return [{"link": link, "title": title, "rank": rank, "snippet": snippet}
+            for link, title, rank, snippet in rows]
+
+
+def search_transcripts_like(connection, text, limit=SEARCH_RESULTS):
+    """
+    Busca ingênua com LIKE, que varre o texto dos episódios até achar `limit`
+    episódios com todas as palavras. Não há ordenação por relevância.
+
+    Mantida como referência para os benchmarks de `search_transcripts`.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return []
+    conditions = " AND ".join("(transcript LIKE ? OR title LIKE ?)" for _ in words)
+    parameters = [f"%{word}%" for word in words for _ in range(2)]
+    rows = connection.execute(f"SELECT link, title FROM episodes WHERE {conditions} LIMIT ?;",
+                              parameters + [limit])
+    return [{"link": link, "title": title} for link, title in rows]
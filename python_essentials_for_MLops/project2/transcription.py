@@ -0,0 +1,263 @@
+"""
+transcription.py - Transcrição dos episódios com o Vosk.
+
+O modelo do Vosk é carregado uma única vez por processo e reaproveitado entre
+episódios; cada episódio recebe um KaldiRecognizer novo. O áudio é decodificado
+pelo ffmpeg direto para PCM de 16 kHz mono e entregue ao reconhecedor em blocos,
+então a memória usada não depende da duração do episódio.
+
+Episódios longos podem ser transcritos em janelas de tempo sobrepostas
+(`plan_windows`), cujas palavras são costuradas de volta na ordem com
+`stitch_windows`. Arquivos `.pcm` (PCM s16le já decodificado na taxa do
+reconhecedor) são lidos direto do disco, sem passar pelo ffmpeg.
+"""
+
+import os
+import json
+import logging
+import tempfile
+import threading
+import subprocess
+
+MODEL_NAME = "vosk-model-en-us-0.22-lgraph"
+FRAME_RATE = 16000
+FFMPEG = "ffmpeg"
+FFPROBE = "ffprobe"
+PCM_SUFFIX = ".pcm"
+# 0,25 s de áudio PCM de 16 bits por bloco entregue ao reconhecedor.
+CHUNK_BYTES = FRAME_RATE // 4 * 2
+PROGRESS_SECONDS = 300
+# Bytes finais do stderr do processo incluídos na mensagem de erro.
+STDERR_TAIL = 4096
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _load_vosk_model(model_name):
+    """
+    Carrega um modelo do Vosk pelo nome.
+    """
+    from vosk import Model  # pylint: disable=import-outside-toplevel
+
+    return Model(model_name=model_name)
+
+
+def _kaldi_recognizer(model, frame_rate):
+    """
+    Cria um KaldiRecognizer com as palavras no resultado.
+    """
+    from vosk import KaldiRecognizer  # pylint: disable=import-outside-toplevel
+
+    recognizer = KaldiRecognizer(model, frame_rate)
+    recognizer.SetWords(True)
+    return recognizer
+
+
+def get_model(model_name=MODEL_NAME, loader=_load_vosk_model):
+    """
+    Retorna o modelo do processo, carregando-o apenas na primeira chamada.
+    """
+    with _models_lock:
+        if model_name not in _models:
+            logging.info("Loading model %s", model_name)
+            _models[model_name] = loader(model_name)
+        return _models[model_name]
+
+
+def clear_model_cache():
+    """
+    Descarta os modelos carregados neste processo.
+    """
+    with _models_lock:
+        _models.clear()
+
+
+def decoder_command(filepath, frame_rate=FRAME_RATE, ffmpeg=FFMPEG, start=None,
+                    duration=None):
+    """
+    Comando do ffmpeg que decodifica o arquivo para PCM s16le mono na saída padrão.
+
+    `start` e `duration` (em segundos) limitam a decodificação a uma janela.
+    """
+    command = [ffmpeg, "-nostdin", "-loglevel", "error"]
+    if start:
+        # Antes do -i, o ffmpeg busca a posição sem decodificar o início do arquivo.
+        command += ["-ss", f"{start:.3f}"]
+    command += ["-i", filepath]
+    if duration is not None:
+        command += ["-t", f"{duration:.3f}"]
+    return command + ["-ac", "1", "-ar", str(frame_rate), "-f", "s16le", "-"]
+
+
+def probe_duration(filepath, ffprobe=FFPROBE, frame_rate=FRAME_RATE):
+    """
+    Duração do arquivo de áudio em segundos, ou None se não puder ser lida.
+    """
+    if filepath.endswith(PCM_SUFFIX):
+        return os.path.getsize(filepath) / (2 * frame_rate)
+    command = [ffprobe, "-v", "error", "-show_entries", "format=duration",
+               "-of", "default=noprint_wrappers=1:nokey=1", filepath]
+    try:
+        output = subprocess.run(command, capture_output=True, check=True, text=True).stdout
+        return float(output.strip())
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        logging.error("Error probing %s: %s", filepath, str(e))
+        return None
+
+
+def iter_process_output(command, chunk_bytes=CHUNK_BYTES):
+    """
+    Lê a saída padrão de um processo em blocos de `chunk_bytes`.
+
+    O stderr vai para um arquivo temporário, não para um pipe: um processo que
+    escreve muitos avisos (MP3 corrompido, por exemplo) não fica bloqueado
+    esperando alguém ler o stderr enquanto o consumidor espera pelo stdout.
+    O processo é encerrado se o consumidor parar antes do fim, e um código de
+    saída diferente de zero levanta RuntimeError com o final do stderr.
+    """
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            while True:
+                chunk = process.stdout.read(chunk_bytes)
+                if not chunk:
+                    break
+                yield chunk
+            if process.wait() != 0:
+                stderr_file.seek(max(stderr_file.tell() - STDERR_TAIL, 0))
+                stderr = stderr_file.read().decode(errors="replace")
+                raise RuntimeError(f"{command[0]} failed: {stderr}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+
+def iter_pcm_chunks(filepath, frame_rate=FRAME_RATE, chunk_bytes=CHUNK_BYTES,
+                    ffmpeg=FFMPEG, start=None, duration=None):
+    """
+    Decodifica um arquivo de áudio em streaming, em blocos de PCM 16 bits mono.
+    """
+    if filepath.endswith(PCM_SUFFIX):
+        return iter_pcm_file(filepath, frame_rate, chunk_bytes, start, duration)
+    return iter_process_output(decoder_command(filepath, frame_rate, ffmpeg, start, duration),
+                               chunk_bytes)
+
+
+def iter_pcm_file(filepath, frame_rate=FRAME_RATE, chunk_bytes=CHUNK_BYTES, start=None,
+                  duration=None):
+    """
+    Lê um arquivo PCM s16le mono já decodificado, limitado à janela dada.
+    """
+    # Posições alinhadas às amostras de 16 bits.
+    offset = int((start or 0) * frame_rate) * 2
+    remaining = None if duration is None else int(duration * frame_rate) * 2
+    with open(filepath, "rb") as source:
+        source.seek(offset)
+        while remaining is None or remaining > 0:
+            size = chunk_bytes if remaining is None else min(chunk_bytes, remaining)
+            chunk = source.read(size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def iter_results(chunks, recognizer, frame_rate=FRAME_RATE, on_partial=None):
+    """
+    Entrega os blocos PCM ao reconhecedor e gera cada resultado concluído.
+
+    Gera pares (segundos de áudio consumidos, resultado do Vosk): um por frase
+    concluída (Result) e, no fim, o FinalResult com o trecho que ainda estava
+    aberto. Resultados parciais (PartialResult) vão para `on_partial`.
+    """
+    audio_bytes = 0
+    next_progress = PROGRESS_SECONDS
+    for chunk in chunks:
+        audio_bytes += len(chunk)
+        if recognizer.AcceptWaveform(chunk):
+            yield audio_bytes / (2 * frame_rate), json.loads(recognizer.Result())
+        elif on_partial is not None:
+            on_partial(json.loads(recognizer.PartialResult())["partial"])
+        if audio_bytes / (2 * frame_rate) >= next_progress:
+            logging.info("Transcribed %d seconds of audio", next_progress)
+            next_progress += PROGRESS_SECONDS
+    yield audio_bytes / (2 * frame_rate), json.loads(recognizer.FinalResult())
+
+
+def transcribe_stream(chunks, recognizer, frame_rate=FRAME_RATE, on_partial=None):
+    """
+    Transcreve um fluxo de blocos PCM (16 bits, mono).
+    """
+    texts = [result["text"]
+             for _, result in iter_results(chunks, recognizer, frame_rate, on_partial)]
+    return " ".join(text for text in texts if text)
+
+
+def transcribe_words(chunks, recognizer, frame_rate=FRAME_RATE):
+    """
+    Transcreve um fluxo de blocos PCM e retorna (palavras, segundos de áudio).
+
+    As palavras são pares (início em segundos, palavra), relativos ao início
+    do fluxo. Resultados sem tempos por palavra (SetWords desligado) entram
+    como um único item marcado com a posição do áudio em que foram concluídos.
+    """
+    words = []
+    seconds = 0.0
+    for seconds, result in iter_results(chunks, recognizer, frame_rate):
+        if "result" in result:
+            words.extend((word["start"], word["word"]) for word in result["result"])
+        elif result.get("text"):
+            words.append((seconds, result["text"]))
+    return words, seconds
+
+
+def plan_windows(duration, window_seconds, overlap_seconds):
+    """
+    Divide um áudio de `duration` segundos em janelas sobrepostas.
+
+    Retorna pares (início, duração); a última janela vai até o fim do arquivo
+    (duração None). Áudios curtos ou de duração desconhecida ficam em uma só janela.
+    """
+    if overlap_seconds >= window_seconds:
+        raise ValueError("a sobreposição deve ser menor que a janela")
+    if duration is None or duration <= window_seconds:
+        return [(0.0, None)]
+    windows = []
+    start = 0.0
+    while start + window_seconds < duration:
+        windows.append((start, window_seconds))
+        start += window_seconds - overlap_seconds
+    windows.append((start, None))
+    return windows
+
+
+def stitch_windows(windows, overlap_seconds):
+    """
+    Junta as palavras de janelas sobrepostas em um único transcrito.
+
+    `windows` é a lista ordenada de pares (início da janela, palavras da
+    janela). Cada sobreposição é cortada ao meio: as palavras antes do corte
+    vêm da janela anterior e as demais da seguinte, de modo que nenhuma
+    palavra é repetida e cada lado tem meia sobreposição de contexto.
+    """
+    texts = []
+    cuts = [start + overlap_seconds / 2 for start, _ in windows[1:]]
+    for position, (start, words) in enumerate(windows):
+        lower = cuts[position - 1] if position else float("-inf")
+        upper = cuts[position] if position < len(cuts) else float("inf")
+        texts.extend(word for time, word in words if lower <= start + time < upper)
+    return " ".join(texts)
+
+
+def transcribe_file(filepath, model, frame_rate=FRAME_RATE,
+                    recognizer_factory=_kaldi_recognizer, on_partial=None):
+    """
+    Transcreve um arquivo de áudio com um reconhecedor novo sobre o modelo dado.
+    """
+    recognizer = recognizer_factory(model, frame_rate)
+    return transcribe_stream(iter_pcm_chunks(filepath, frame_rate), recognizer,
+                             frame_rate, on_partial)
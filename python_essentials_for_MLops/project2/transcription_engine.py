@@ -0,0 +1,230 @@
+"""
+transcription_engine.py - Transcrição paralela de vários episódios.
+
+A transcrição usa só CPU, então os episódios são distribuídos por um pool de
+processos do tamanho do número de núcleos. Episódios longos são divididos em
+janelas de tempo sobrepostas, transcritas em paralelo e costuradas de volta na
+ordem. Cada processo trabalhador carrega o modelo do Vosk uma única vez.
+
+O progresso é publicado como métricas estruturadas (uma linha JSON por evento
+no logger `podcast_summary.metrics`): fator de tempo real por janela e por
+episódio, profundidade da fila e utilização dos trabalhadores.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from functools import partial
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+
+from transcription import (FFMPEG, FFPROBE, FRAME_RATE, MODEL_NAME, _kaldi_recognizer,
+                           _load_vosk_model, get_model, iter_pcm_chunks, plan_windows,
+                           probe_duration, stitch_windows, transcribe_words)
+
+# Janelas de 10 minutos com 5 s de sobreposição para não cortar palavras.
+WINDOW_SECONDS = 600
+OVERLAP_SECONDS = 5
+METRICS_LOGGER = "podcast_summary.metrics"
+
+_worker = {}
+
+
+def log_metric(event, **fields):
+    """
+    Registra uma métrica como uma linha JSON no logger de métricas.
+    """
+    logging.getLogger(METRICS_LOGGER).info(json.dumps({"event": event, **fields}))
+
+
+def _init_worker(model_name, loader, recognizer_factory):
+    """
+    Inicializa um processo trabalhador carregando o modelo uma única vez.
+    """
+    _worker["model"] = get_model(model_name, loader)
+    _worker["recognizer_factory"] = recognizer_factory
+
+
+def _transcribe_window(filepath, start, duration, frame_rate, ffmpeg):
+    """
+    Transcreve uma janela de um arquivo dentro de um processo trabalhador.
+    """
+    began = time.perf_counter()
+    recognizer = _worker["recognizer_factory"](_worker["model"], frame_rate)
+    chunks = iter_pcm_chunks(filepath, frame_rate, ffmpeg=ffmpeg, start=start,
+                             duration=duration)
+    words, audio_seconds = transcribe_words(chunks, recognizer, frame_rate)
+    return {"words": words, "audio_seconds": audio_seconds,
+            "busy_seconds": time.perf_counter() - began, "pid": os.getpid()}
+
+
+class TranscriptionEngine:
+    """
+    Transcreve vários episódios em paralelo em um pool de processos.
+
+    Pode ser usado em lote (`transcribe_all`) ou como contexto, recebendo
+    episódios aos poucos com `submit`:
+
+        with engine:
+            future = engine.submit("episodes/a.mp3")
+            transcript = future.result()
+    """
+
+    def __init__(self, max_workers=None, window_seconds=WINDOW_SECONDS,
+                 overlap_seconds=OVERLAP_SECONDS, model_name=MODEL_NAME,
+                 loader=_load_vosk_model, recognizer_factory=_kaldi_recognizer,
+                 frame_rate=FRAME_RATE, ffmpeg=FFMPEG, ffprobe=FFPROBE,
+                 metrics=log_metric):
+        # Cada trabalhador mantém o seu próprio modelo em memória.
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.window_seconds = window_seconds
+        self.overlap_seconds = overlap_seconds
+        self.model_name = model_name
+        self.loader = loader
+        self.recognizer_factory = recognizer_factory
+        self.frame_rate = frame_rate
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.metrics = metrics
+        self._executor = None
+        self._lock = threading.Lock()
+        self._began = None
+        self._busy = {}
+        self._windows = 0
+        self._windows_done = 0
+        self._episodes = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        """
+        Cria o pool de processos.
+        """
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, initializer=_init_worker,
+            initargs=(self.model_name, self.loader, self.recognizer_factory))
+        self._began = time.perf_counter()
+        self._busy = {}
+        self._windows = self._windows_done = self._episodes = 0
+
+    def close(self):
+        """
+        Aguarda as janelas pendentes, encerra o pool e publica a utilização.
+        """
+        if self._executor is None:
+            return
+        self._executor.shutdown()
+        self._executor = None
+        wall_seconds = time.perf_counter() - self._began
+        workers = min(self.max_workers, self._windows) or 1
+        self.metrics("transcription.run", episodes=self._episodes, windows=self._windows,
+                     workers=workers, wall_seconds=wall_seconds,
+                     utilisation=_ratio(sum(self._busy.values()), workers * wall_seconds),
+                     busy_seconds={str(pid): seconds for pid, seconds in self._busy.items()})
+
+    def submit(self, filepath):
+        """
+        Enfileira as janelas de um episódio e retorna um Future do transcrito.
+        """
+        duration = probe_duration(filepath, self.ffprobe, self.frame_rate)
+        windows = plan_windows(duration, self.window_seconds, self.overlap_seconds)
+        episode = Future()
+        state = {"file": filepath, "duration": duration, "remaining": len(windows),
+                 "words": {}, "results": []}
+        with self._lock:
+            self._windows += len(windows)
+            self._episodes += 1
+        for number, (start, length) in enumerate(windows):
+            future = self._executor.submit(_transcribe_window, filepath, start, length,
+                                           self.frame_rate, self.ffmpeg)
+            future.add_done_callback(partial(self._window_done, episode, state, number, start))
+        return episode
+
+    def _window_done(self, episode, state, number, start, future):
+        """
+        Registra uma janela concluída e conclui o episódio na última janela.
+        """
+        with self._lock:
+            self._windows_done += 1
+            state["remaining"] -= 1
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error("Error transcribing %s at %.0fs: %s", state["file"], start, str(e))
+                if not episode.done():
+                    episode.set_exception(e)
+                return
+            self._busy[result["pid"]] = (self._busy.get(result["pid"], 0.0)
+                                         + result["busy_seconds"])
+            state["words"][number] = (start, result["words"])
+            state["results"].append(result)
+            self.metrics("transcription.window", file=state["file"], window=number,
+                         start=start, audio_seconds=result["audio_seconds"],
+                         busy_seconds=result["busy_seconds"],
+                         real_time_factor=_ratio(result["busy_seconds"],
+                                                 result["audio_seconds"]),
+                         queue_depth=max(self._windows - self._windows_done
+                                         - self.max_workers, 0),
+                         worker=result["pid"])
+            if state["remaining"] or episode.done():
+                return
+            self._episode_metric(state)
+            transcript = stitch_windows([state["words"][position]
+                                         for position in sorted(state["words"])],
+                                        self.overlap_seconds)
+        episode.set_result(transcript)
+
+    def transcribe_all(self, filepaths, on_episode=None):
+        """
+        Transcreve os arquivos e retorna os transcritos na ordem recebida.
+
+        `on_episode(posição, transcrito)` é chamado assim que cada episódio é
+        concluído, antes de eventuais falhas de outros episódios. Falhas são
+        registradas no log e, ao final, levantam RuntimeError.
+        """
+        if not filepaths:
+            return []
+        transcripts = [None] * len(filepaths)
+        failures = []
+        with self:
+            futures = {self.submit(filepath): position
+                       for position, filepath in enumerate(filepaths)}
+            for future in as_completed(futures):
+                position = futures[future]
+                try:
+                    transcripts[position] = future.result()
+                except Exception:
+                    failures.append(filepaths[position])
+                    continue
+                if on_episode is not None:
+                    on_episode(position, transcripts[position])
+        if failures:
+            raise RuntimeError(f"{len(failures)} transcription(s) failed: {sorted(failures)}")
+        return transcripts
+
+    def _episode_metric(self, state):
+        """
+        Publica a vazão de um episódio concluído.
+        """
+        busy_seconds = sum(result["busy_seconds"] for result in state["results"])
+        duration = state["duration"]
+        if duration is None:
+            duration = sum(result["audio_seconds"] for result in state["results"])
+        self.metrics("transcription.episode", file=state["file"],
+                     windows=len(state["results"]), audio_seconds=duration,
+                     busy_seconds=busy_seconds,
+                     elapsed_seconds=time.perf_counter() - self._began,
+                     real_time_factor=_ratio(busy_seconds, duration))
+
+
+def _ratio(numerator, denominator):
+    """
+    Divide, retornando None quando o denominador é zero.
+    """
+    return numerator / denominator if denominator else None
@@ -3,9 +3,15 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
 import logging
 
+from cluster_selection import sweep_clusters
+from customer_features import encode_customers
+from instrumentation import instrument
+from segmentation_model import SegmentationModel, file_sha256
+
+MODEL_DIR = 'segmentation_model'
+
 # Configuração do logging
 logging.basicConfig(filename='customer_segmentation.log', level=logging.ERROR)
 
@@ -16,6 +22,7 @@ np.random.seed(42)
 sns.set_style('whitegrid')
 
 
+@instrument("segmentation.load_customer_data", items=len)
 def load_customer_data(filename):
     """
     Carrega os dados dos clientes a partir de um arquivo CSV.
@@ -66,26 +73,22 @@ def plot_numeric_histograms(data, figsize=(12, 10)):
         logging.error(f"Erro ao criar histogramas: {str(e)}")
 
 
+@instrument("segmentation.preprocess_data", items=len)
 def preprocess_data(data):
     """
     Realiza o pré-processamento dos dados.
+
+    Retorna os atributos codificados com o esquema fixo de `customer_features`
+    (sem o `customer_id`), com as mesmas colunas em qualquer lote.
     """
     try:
-        data_copy = data.copy()
-        data_copy['gender'] = data['gender'].apply(
-            lambda x: 1 if x == 'M' else 0)
-        data_copy.replace(to_replace={'Uneducated': 0, 'High School': 1, 'College': 2,
-                                      'Graduate': 3, 'Post-Graduate': 4, 'Doctorate': 5}, inplace=True)
-        dummies = pd.get_dummies(
-            data_copy[['marital_status']], drop_first=True)
-        data_copy = pd.concat([data_copy, dummies], axis=1)
-        data_copy.drop(['marital_status'], axis=1, inplace=True)
-        return data_copy
+        return encode_customers(data)
     except Exception as e:
         logging.error(f"Erro no pré-processamento dos dados: {str(e)}")
         return None
 
 
+@instrument("segmentation.scale_data", items=len)
 def scale_data(data):
     """
     Normaliza os dados usando StandardScaler.
@@ -100,16 +103,16 @@ def scale_data(data):
         return None
 
 
-def find_optimal_clusters(data, max_clusters=10):
+def find_optimal_clusters(data, max_clusters=10, max_workers=None):
     """
     Encontra o número ótimo de clusters usando o método Elbow.
+
+    Ajusta k = 1..max_clusters em paralelo, cada k partindo da solução de
+    k - 1, e retorna uma lista com a inércia, o silhouette e o Davies-Bouldin
+    (calculados em uma amostra) de cada k.
     """
     try:
-        inertias = []
-        for k in range(1, max_clusters + 1):
-            model = KMeans(n_clusters=k)
-            inertias.append(model.inertia_)
-        return inertias
+        return sweep_clusters(data, max_clusters, max_workers=max_workers)
     except Exception as e:
         logging.error(f"Erro ao encontrar número ótimo de clusters: {str(e)}")
         return None
@@ -131,16 +134,27 @@ def plot_elbow_method(inertias, max_clusters=10):
         logging.error(f"Erro ao plotar o método Elbow: {str(e)}")
 
 
-def cluster_data(data, n_clusters):
+@instrument("segmentation.load_or_fit_model")
+def load_or_fit_model(data, n_clusters, filename=None, model_dir=MODEL_DIR):
     """
-    Executa o K-Means com o número de clusters especificado.
+    Carrega o modelo de segmentação salvo ou ajusta um novo e o salva.
+
+    O modelo salvo só é reusado se tiver `n_clusters` clusters e tiver sido
+    ajustado com o mesmo CSV (`filename`, conferido pelo SHA-256). Sem
+    `filename` não há como conferir os dados, então o modelo é sempre reajustado.
     """
     try:
-        model = KMeans(n_clusters=n_clusters)
-        y = model.fit_predict(data)
-        return y
+        training_hash = file_sha256(filename) if filename is not None else None
+        model = None
+        if training_hash is not None:
+            model = SegmentationModel.load(model_dir, training_hash)
+        if model is None or model.n_clusters != n_clusters:
+            model = SegmentationModel.fit(data, n_clusters)
+            model.training_hash = training_hash
+            model.save(model_dir)
+        return model
     except Exception as e:
-        logging.error(f"Erro na clusterização dos dados: {str(e)}")
+        logging.error(f"Erro ao carregar ou ajustar o modelo: {str(e)}")
         return None
 
 
@@ -223,21 +237,26 @@ def main():
 
         # Encontra o número ótimo de clusters
         max_clusters = 10
-        inertias = find_optimal_clusters(scaled_data, max_clusters)
+        cluster_scores = find_optimal_clusters(scaled_data, max_clusters)
 
-        if inertias is None:
+        if cluster_scores is None:
             return
 
+        print(pd.DataFrame(cluster_scores).set_index('k'), end='\n\n')
+
         # Plota o método Elbow
-        plot_elbow_method(inertias, max_clusters)
+        plot_elbow_method([score['inertia'] for score in cluster_scores], max_clusters)
 
-        # Clusterização dos dados
+        # Clusterização com o modelo salvo (reajustado só quando o CSV ou o número de clusters muda)
         num_clusters = 6
-        cluster_labels = cluster_data(scaled_data, num_clusters)
+        model = load_or_fit_model(customers, num_clusters, filename)
 
-        if cluster_labels is None:
+        if model is None:
             return
 
+        customers['CLUSTER'] = model.predict(customers)
+        cluster_labels = customers['CLUSTER']
+
         # Visualização das médias das variáveis numéricas por cluster
         numeric_columns = customers.select_dtypes(include=np.number).drop(
             ['customer_id', 'CLUSTER'], axis=1).columns
@@ -0,0 +1,218 @@
+import io
+import os
+import sys
+import json
+import shutil
+import subprocess
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+from cluster_selection import seed_centroid, sweep_clusters, sweep_clusters_naive
+from customer_features import (FEATURE_COLUMNS, encode_customers, encode_customers_pandas,
+                               feature_matrix)
+from streaming_segmentation import fit_streaming, iter_mini_batches, segment_customers_streaming
+from segmentation_model import SegmentationModel, file_sha256
+import instrumentation
+from benchmark_customer_segmentation import (numeric_features, synthetic_customers,
+                                             write_synthetic_csv)
+
+
+@pytest.fixture(scope="module")
+def blobs():
+    rng = np.random.default_rng(0)
+    centers = np.array([[0, 0], [10, 0], [0, 10]], dtype=float)
+    return np.vstack([center + rng.normal(0, 1, (300, 2)) for center in centers])
+
+def test_seed_centroid_avoids_existing_centroids(blobs):
+    rng = np.random.default_rng(1)
+    centroid = seed_centroid(blobs, np.array([[0.0, 0.0]]), rng)
+    assert np.linalg.norm(centroid) > 5
+
+def test_sweep_clusters_elbow(blobs):
+    scores = sweep_clusters(blobs, max_clusters=5, max_workers=1, sample_size=500)
+    assert [score["k"] for score in scores] == [1, 2, 3, 4, 5]
+    inertias = [score["inertia"] for score in scores]
+    assert inertias == sorted(inertias, reverse=True)
+    assert scores[0]["silhouette"] is None and scores[0]["davies_bouldin"] is None
+    best = max(scores[1:], key=lambda score: score["silhouette"])
+    assert best["k"] == 3
+    assert best["davies_bouldin"] == min(score["davies_bouldin"] for score in scores[1:])
+
+def test_sweep_clusters_matches_naive(blobs):
+    naive = sweep_clusters_naive(blobs, max_clusters=4, sample_size=500)
+    scores = sweep_clusters(blobs, max_clusters=4, max_workers=1, sample_size=500)
+    for score, reference in zip(scores, naive):
+        assert score["inertia"] <= reference["inertia"] * 1.01
+
+def test_sweep_clusters_process_pool(blobs):
+    serial = sweep_clusters(blobs, max_clusters=4, max_workers=1)
+    parallel = sweep_clusters(blobs, max_clusters=4, max_workers=2)
+    assert [score["inertia"] for score in parallel] == pytest.approx(
+        [score["inertia"] for score in serial])
+
+def test_synthetic_customers_features():
+    customers = synthetic_customers(100)
+    assert len(customers) == 100
+    assert set(customers["gender"]) <= {"M", "F"}
+    features = numeric_features(customers)
+    assert features.shape == (100, 10)
+    assert np.allclose(features.mean(axis=0), 0)
+
+def test_encode_customers_fixed_schema():
+    customers = synthetic_customers(50)
+    single = customers[customers["marital_status"] == "Single"]
+    features = encode_customers(single)
+    assert list(features.columns) == FEATURE_COLUMNS
+    assert features["marital_status_Single"].eq(1).all()
+    assert features["marital_status_Married"].eq(0).all()
+    assert features["gender"].tolist() == (single["gender"] == "M").astype(int).tolist()
+
+def test_encode_customers_matches_pandas():
+    customers = synthetic_customers(500)
+    expected = encode_customers_pandas(customers).drop(columns="customer_id")
+    features = encode_customers(customers)
+    assert list(expected.columns) == FEATURE_COLUMNS
+    assert np.allclose(features.to_numpy(float), expected.to_numpy(float))
+    assert features["gender"].dtype == np.uint8
+    assert features["marital_status_Single"].dtype == np.uint8
+    assert features["credit_limit"].dtype == np.float32
+
+def test_feature_matrix_chunks_and_categories():
+    customers = synthetic_customers(1000)
+    categorical = customers.astype({"gender": "category", "education_level": "category",
+                                    "marital_status": "category"})
+    whole = feature_matrix(customers, np.float64)
+    assert whole.shape == (1000, len(FEATURE_COLUMNS))
+    assert np.array_equal(whole, feature_matrix(categorical, np.float64))
+    chunks = [feature_matrix(categorical.iloc[start:start + 300], np.float64)
+              for start in range(0, 1000, 300)]
+    assert np.array_equal(whole, np.vstack(chunks))
+
+def test_encode_customers_unknown_category():
+    customers = synthetic_customers(5)
+    customers.loc[0, "education_level"] = "Kindergarten"
+    with pytest.raises(ValueError, match="Kindergarten"):
+        encode_customers(customers)
+    customers.loc[0, "education_level"] = "Graduate"
+    customers.loc[1, "marital_status"] = None
+    with pytest.raises(ValueError, match="nan"):
+        feature_matrix(customers)
+
+def test_segment_customers_streaming(tmp_path):
+    filename = tmp_path / "customers.csv"
+    output = tmp_path / "clusters.csv"
+    write_synthetic_csv(filename, 2500, chunk_rows=1000)
+    model, summary = segment_customers_streaming(
+        filename, output, n_clusters=4, chunksize=700, batch_size=256)
+    customers = pd.read_csv(filename)
+    assert np.allclose(model.mean, StandardScaler().fit(encode_customers(customers)).mean_)
+    clusters = pd.read_csv(output)
+    assert summary["rows"] == 2500
+    assert clusters["customer_id"].tolist() == customers["customer_id"].tolist()
+    assert sorted(clusters["CLUSTER"].unique()) == [0, 1, 2, 3]
+    assert sum(summary["cluster_sizes"]) == 2500
+    assert summary["cluster_sizes"] == np.bincount(clusters["CLUSTER"]).tolist()
+
+def test_fit_streaming_small_tail_batch(tmp_path):
+    filename = tmp_path / "customers.csv"
+    write_synthetic_csv(filename, 1003)
+    model, rows = fit_streaming(filename, n_clusters=3, chunksize=1000, batch_size=500)
+    assert rows == 1003
+    assert model.centroids.shape == (3, len(FEATURE_COLUMNS))
+
+def test_iter_mini_batches_spans_blocks():
+    blocks = [np.arange(start, min(start + 3, 11)) for start in range(0, 11, 3)]
+    batches = list(iter_mini_batches(blocks, 4))
+    assert [batch.tolist() for batch in batches] == [[0, 1, 2, 3], list(range(4, 11))]
+    assert [batch.tolist() for batch in iter_mini_batches([np.arange(3)], 4)] == [[0, 1, 2]]
+    singles = [np.array([value]) for value in range(9)]
+    assert [batch.tolist() for batch in iter_mini_batches(singles, 4)] == [
+        [0, 1, 2, 3], [4, 5, 6, 7, 8]]
+    assert list(iter_mini_batches([], 4)) == []
+
+def test_fit_streaming_small_chunks(tmp_path):
+    filename = tmp_path / "customers.csv"
+    write_synthetic_csv(filename, 1003)
+    small, rows = fit_streaming(filename, n_clusters=6, chunksize=4, batch_size=256)
+    assert rows == 1003
+    large, _ = fit_streaming(filename, n_clusters=6, chunksize=1000, batch_size=256)
+    # Os mini-lotes não dependem do tamanho dos lotes lidos do CSV.
+    assert np.allclose(small.centroids, large.centroids)
+    with pytest.raises(ValueError, match="clusters"):
+        fit_streaming(filename, n_clusters=2000, chunksize=100)
+
+def test_segmentation_model_matches_sklearn():
+    customers = synthetic_customers(3000)
+    features = encode_customers(customers).to_numpy(float)
+    scaler = StandardScaler().fit(features)
+    kmeans = KMeans(n_clusters=5, random_state=0).fit(scaler.transform(features))
+    model = SegmentationModel.from_estimators(scaler, kmeans)
+    expected = kmeans.predict(scaler.transform(features))
+    assert (model.predict(customers) == expected).all()
+    assert (model.predict(customers.iloc[::-1]) == expected[::-1]).all()
+
+def test_segmentation_model_save_load(tmp_path):
+    customers = synthetic_customers(1000)
+    model = SegmentationModel.fit(customers, n_clusters=4)
+    assert SegmentationModel.load(tmp_path / "missing") is None
+    model.save(tmp_path / "model")
+    loaded = SegmentationModel.load(tmp_path / "model")
+    assert loaded.n_clusters == 4
+    assert (loaded.predict(customers) == model.predict(customers)).all()
+    (tmp_path / "model" / "meta.json").unlink()
+    assert SegmentationModel.load(tmp_path / "model") is None
+
+def test_segmentation_model_load_checks_training_data(tmp_path):
+    filename = tmp_path / "customers.csv"
+    write_synthetic_csv(filename, 500)
+    training_hash = file_sha256(filename)
+    model = SegmentationModel.fit(pd.read_csv(filename), n_clusters=3)
+    model.training_hash = training_hash
+    model.save(tmp_path / "model")
+    assert SegmentationModel.load(tmp_path / "model", training_hash).training_hash == training_hash
+    write_synthetic_csv(filename, 600)
+    assert SegmentationModel.load(tmp_path / "model", file_sha256(filename)) is None
+    assert SegmentationModel.load(tmp_path / "model") is not None
+
+def test_streaming_stages_are_instrumented(tmp_path):
+    filename = tmp_path / "customers.csv"
+    write_synthetic_csv(filename, 1200)
+    output = io.StringIO()
+    instrumentation.enable(output)
+    try:
+        segment_customers_streaming(filename, tmp_path / "clusters.csv", n_clusters=3,
+                                    chunksize=500, batch_size=200)
+    finally:
+        instrumentation.disable()
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [(record["stage"], record["items"]) for record in records] == [
+        ("segmentation.fit_streaming", 1200), ("segmentation.assign_clusters_streaming", 1200)]
+    assert all(record["cpu_seconds"] > 0 for record in records)
+
+def test_segmentation_model_fit_is_instrumented():
+    customers = synthetic_customers(300)
+    output = io.StringIO()
+    instrumentation.enable(output)
+    try:
+        SegmentationModel.fit(customers, n_clusters=3)
+    finally:
+        instrumentation.disable()
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [(record["stage"], record["items"]) for record in records] == [("segmentation.fit", 300)]
+
+def test_project_folder_works_when_copied_alone(tmp_path):
+    project = os.path.dirname(os.path.abspath(__file__))
+    copy = tmp_path / "project3"
+    shutil.copytree(project, copy, ignore=shutil.ignore_patterns("__pycache__"))
+    assert not os.path.islink(copy / "instrumentation.py")
+    result = subprocess.run([sys.executable, "-c", "import streaming_segmentation"],
+                            cwd=copy, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    # As cópias de instrumentation.py dos projetos devem ser idênticas.
+    for sibling in ("project1", "project2"):
+        other = os.path.join(os.path.dirname(project), sibling, "instrumentation.py")
+        if os.path.exists(other):
+            with open(other, "rb") as theirs, open(copy / "instrumentation.py", "rb") as ours:
+                assert theirs.read() == ours.read()
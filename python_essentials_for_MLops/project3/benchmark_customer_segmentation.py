@@ -0,0 +1,274 @@
+"""
+benchmark_customer_segmentation.py - Benchmarks da segmentação de clientes.
+
+Uso:
+    python benchmark_customer_segmentation.py --elbow 200000
+    python benchmark_customer_segmentation.py --streaming 100000,1000000
+    python benchmark_customer_segmentation.py --scoring 2000000
+    python benchmark_customer_segmentation.py --encoding 3000000
+
+Os dados são clientes sintéticos no formato de `customer_segmentation.csv`,
+gerados a partir de alguns segmentos latentes para que os clusters existam.
+"""
+
+import os
+import json
+import time
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+from threadpoolctl import threadpool_limits
+
+from cluster_selection import MAX_CLUSTERS, sweep_clusters, sweep_clusters_naive
+from customer_features import encode_customers, encode_customers_pandas, feature_matrix
+from segmentation_model import SegmentationModel
+from streaming_segmentation import N_CLUSTERS, segment_customers_streaming
+
+EDUCATION_LEVELS = ['Uneducated', 'High School', 'College', 'Graduate', 'Post-Graduate',
+                    'Doctorate']
+MARITAL_STATUSES = ['Married', 'Single', 'Divorced', 'Unknown']
+# Médias das colunas numéricas em cada segmento latente.
+SEGMENTS = [
+    {'age': 35, 'estimated_income': 40000, 'credit_limit': 3000, 'total_trans_amount': 2000,
+     'total_trans_count': 40, 'avg_utilization_ratio': 0.6},
+    {'age': 45, 'estimated_income': 90000, 'credit_limit': 15000, 'total_trans_amount': 4000,
+     'total_trans_count': 60, 'avg_utilization_ratio': 0.1},
+    {'age': 55, 'estimated_income': 60000, 'credit_limit': 8000, 'total_trans_amount': 12000,
+     'total_trans_count': 100, 'avg_utilization_ratio': 0.3},
+    {'age': 30, 'estimated_income': 120000, 'credit_limit': 25000, 'total_trans_amount': 15000,
+     'total_trans_count': 110, 'avg_utilization_ratio': 0.05},
+]
+
+
+def synthetic_customers(rows, seed=42, first_id=700000000):
+    """
+    Gera clientes sintéticos com as colunas de `customer_segmentation.csv`.
+    """
+    rng = np.random.default_rng(seed)
+    segment = rng.integers(len(SEGMENTS), size=rows)
+
+    def column(name, scale):
+        means = np.array([s[name] for s in SEGMENTS], dtype=float)[segment]
+        return means + rng.normal(0, scale, rows)
+
+    return pd.DataFrame({
+        'customer_id': np.arange(first_id, first_id + rows),
+        'age': column('age', 5).round().astype(int),
+        'gender': rng.choice(['M', 'F'], rows),
+        'dependent_count': rng.integers(0, 6, rows),
+        'education_level': rng.choice(EDUCATION_LEVELS, rows),
+        'marital_status': rng.choice(MARITAL_STATUSES, rows),
+        'estimated_income': column('estimated_income', 8000).round().astype(int),
+        'months_on_book': rng.integers(13, 57, rows),
+        'total_relationship_count': rng.integers(1, 7, rows),
+        'months_inactive_12_mon': rng.integers(0, 7, rows),
+        'credit_limit': column('credit_limit', 1500).clip(1438).round(1),
+        'total_trans_amount': column('total_trans_amount', 1000).clip(510).round().astype(int),
+        'total_trans_count': column('total_trans_count', 10).clip(10).round().astype(int),
+        'avg_utilization_ratio': column('avg_utilization_ratio', 0.05).clip(0, 1).round(3),
+    })
+
+
+def write_synthetic_csv(path, rows, chunk_rows=1_000_000):
+    """
+    Grava um CSV de clientes sintéticos em lotes, sem montá-lo inteiro na memória.
+    """
+    for position, start in enumerate(range(0, rows, chunk_rows)):
+        chunk = synthetic_customers(min(chunk_rows, rows - start), seed=42 + position,
+                                    first_id=700000000 + start)
+        chunk.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+
+def numeric_features(customers):
+    """
+    Colunas numéricas dos clientes normalizadas, usadas pelos benchmarks de clusterização.
+    """
+    numeric = customers.select_dtypes(include=np.number).drop(columns='customer_id')
+    return StandardScaler().fit_transform(numeric)
+
+
+def benchmark_elbow(rows, max_clusters=MAX_CLUSTERS, max_workers=None):
+    """
+    Compara a varredura ingênua de k com a varredura paralela e aquecida.
+
+    As duas calculam as mesmas métricas na mesma amostra.
+    """
+    data = numeric_features(synthetic_customers(rows))
+    start = time.perf_counter()
+    naive = sweep_clusters_naive(data, max_clusters)
+    naive_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    sweep = sweep_clusters(data, max_clusters, max_workers=max_workers)
+    sweep_seconds = time.perf_counter() - start
+    return {
+        'rows': rows,
+        'max_clusters': max_clusters,
+        'cpus': os.cpu_count(),
+        'naive_seconds': naive_seconds,
+        'sweep_seconds': sweep_seconds,
+        'speedup': naive_seconds / sweep_seconds,
+        'naive_iterations': sum(score['n_iter'] for score in naive),
+        'sweep_iterations': sum(score['n_iter'] for score in sweep),
+        'best_silhouette_k': max(sweep[1:], key=lambda score: score['silhouette'])['k'],
+        'per_k': [dict(score, naive_inertia=reference['inertia'])
+                  for score, reference in zip(sweep, naive)],
+    }
+
+
+def _segment_in_child(mode, filename, output):
+    """
+    Segmenta o CSV em um processo novo e retorna o tempo e o pico de RSS (KiB).
+    """
+    start = time.perf_counter()
+    if mode == 'streaming':
+        segment_customers_streaming(filename, output)
+    else:
+        customers = pd.read_csv(filename)
+        scaled = StandardScaler().fit_transform(feature_matrix(customers, np.float64))
+        customers['CLUSTER'] = KMeans(n_clusters=N_CLUSTERS).fit_predict(scaled)
+        customers[['customer_id', 'CLUSTER']].to_csv(output, index=False)
+    return {'seconds': time.perf_counter() - start,
+            'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def benchmark_streaming(sizes, modes=('in-memory', 'streaming')):
+    """
+    Mede tempo e pico de memória da segmentação em memória e em lotes.
+
+    Cada execução roda em um processo novo, para que o pico de RSS de uma não
+    contamine a outra.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for rows in sizes:
+            filename = os.path.join(folder, f'customers_{rows}.csv')
+            # O CSV também é gerado em outro processo: o pico de RSS do Linux
+            # passa do pai para os filhos no fork, e contaminaria a medição.
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                executor.submit(write_synthetic_csv, filename, rows).result()
+            for mode in modes:
+                with ProcessPoolExecutor(max_workers=1,
+                                         mp_context=get_context('spawn')) as executor:
+                    run = executor.submit(_segment_in_child, mode, filename,
+                                          os.path.join(folder, 'clusters.csv')).result()
+                results.append({'rows': rows, 'mode': mode,
+                                'csv_mib': os.path.getsize(filename) / 2**20, **run})
+            os.remove(filename)
+    return results
+
+
+def _rows_per_second(function, rows, repeat=3):
+    """
+    Vazão (linhas por segundo) da melhor de `repeat` execuções.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+
+def benchmark_scoring(rows, train_rows=50000):
+    """
+    Mede a vazão da classificação de clientes novos com um modelo ajustado, em
+    um único núcleo (BLAS limitado a uma thread).
+    """
+    # Referência: normalizar com o StandardScaler e classificar com o KMeans.
+    train = feature_matrix(synthetic_customers(train_rows), np.float64)
+    scaler = StandardScaler().fit(train)
+    kmeans = KMeans(n_clusters=N_CLUSTERS, random_state=42).fit(scaler.transform(train))
+    model = SegmentationModel.from_estimators(scaler, kmeans)
+    customers = synthetic_customers(rows, seed=7)
+    features = feature_matrix(customers, np.float64)
+    with threadpool_limits(1):
+        assert (kmeans.predict(scaler.transform(features)) == model.predict_features(features)).all()
+        return {
+            'rows': rows,
+            'sklearn_rows_per_second': _rows_per_second(
+                lambda: kmeans.predict(scaler.transform(features)), rows),
+            'predict_features_rows_per_second': _rows_per_second(
+                lambda: model.predict_features(features), rows),
+            'predict_dataframe_rows_per_second': _rows_per_second(
+                lambda: model.predict(customers), rows),
+        }
+
+
+def _measure(function):
+    """
+    Tempo de uma execução e pico de memória alocada (MiB) de outra, com tracemalloc.
+    """
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': seconds, 'peak_mib': peak / 2**20}
+
+
+def benchmark_encoding(rows):
+    """
+    Compara a codificação original (`encode_customers_pandas`) com a vetorizada,
+    com as colunas de texto como strings e como categorias (como na leitura em lotes).
+    """
+    customers = synthetic_customers(rows)
+    categorical = customers.astype({column: 'category' for column in
+                                    ['gender', 'education_level', 'marital_status']})
+    matrix = feature_matrix(customers)
+    assert np.array_equal(matrix, feature_matrix(categorical))
+    return {
+        'rows': rows,
+        'input_mib': customers.memory_usage(deep=True).sum() / 2**20,
+        'matrix_mib': matrix.nbytes / 2**20,
+        'pandas': _measure(lambda: encode_customers_pandas(customers)),
+        'encode_customers': _measure(lambda: encode_customers(customers)),
+        'feature_matrix': _measure(lambda: feature_matrix(customers)),
+        'feature_matrix_category': _measure(lambda: feature_matrix(categorical)),
+    }
+
+
+def main():
+    """
+    Função principal dos benchmarks.
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks da segmentação de clientes.")
+    parser.add_argument("--elbow", type=int, metavar="ROWS",
+                        help="compara as varreduras de k com ROWS clientes sintéticos")
+    parser.add_argument("--streaming", metavar="ROWS,ROWS",
+                        help="mede tempo e memória da segmentação em memória e em lotes")
+    parser.add_argument("--scoring", type=int, metavar="ROWS",
+                        help="mede a vazão da classificação de ROWS clientes novos")
+    parser.add_argument("--encoding", type=int, metavar="ROWS",
+                        help="compara a codificação original e a vetorizada com ROWS clientes")
+    parser.add_argument("--max-clusters", type=int, default=MAX_CLUSTERS)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    results = {}
+    if args.elbow:
+        results['elbow'] = benchmark_elbow(args.elbow, args.max_clusters, args.workers)
+    if args.streaming:
+        results['streaming'] = benchmark_streaming(
+            [int(rows) for rows in args.streaming.split(',')])
+    if args.scoring:
+        results['scoring'] = benchmark_scoring(args.scoring)
+    if args.encoding:
+        results['encoding'] = benchmark_encoding(args.encoding)
+    if not results:
+        parser.error("nenhum benchmark escolhido")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
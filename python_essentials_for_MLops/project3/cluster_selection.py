@@ -0,0 +1,158 @@
+"""
+cluster_selection.py - Escolha do número de clusters do K-Means (método Elbow).
+
+A varredura de k = 1..max_clusters é feita em duas fases:
+
+1. Uma cadeia de aquecimento em uma amostra: cada k começa dos centróides
+   da solução de k - 1 mais um centróide novo, sorteado com semente fixa
+   como no k-means++ (proporcional ao quadrado da distância, escolhendo o
+   melhor de alguns candidatos).
+2. O ajuste de cada k nos dados completos, em paralelo em um pool de
+   processos, a partir da solução de k da cadeia. Como o ponto de partida já
+   é quase a solução, cada ajuste precisa de poucas iterações e de uma única
+   inicialização.
+
+Para cada k também são calculados o silhouette e o Davies-Bouldin em uma
+amostra dos dados (o silhouette é quadrático no número de pontos).
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.metrics import davies_bouldin_score, silhouette_score
+
+MAX_CLUSTERS = 10
+SAMPLE_SIZE = 2000
+RANDOM_STATE = 42
+
+_worker = {}
+
+
+def _squared_distances(data, centroids):
+    """
+    Quadrado da distância de cada ponto até o centróide mais próximo.
+    """
+    return ((data[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+
+
+def seed_centroid(data, centroids, rng):
+    """
+    Sorteia um novo centróide entre os pontos dos dados, como no k-means++.
+
+    São sorteados 2 + log(k) candidatos com probabilidade proporcional ao
+    quadrado da distância até o centróide mais próximo, e fica o que mais
+    reduz a soma dessas distâncias.
+    """
+    distances = _squared_distances(data, centroids)
+    total = distances.sum()
+    if total == 0:
+        return data[rng.integers(len(data))]
+    trials = 2 + int(np.log(len(centroids) + 1))
+    candidates = data[rng.choice(len(data), trials, p=distances / total)]
+    potentials = [np.minimum(distances, ((data - candidate) ** 2).sum(axis=1)).sum()
+                  for candidate in candidates]
+    return candidates[int(np.argmin(potentials))]
+
+
+def warm_start_centroids(sample, max_clusters=MAX_CLUSTERS, random_state=RANDOM_STATE):
+    """
+    Ajusta k = 1..max_clusters na amostra, cada k partindo da solução de k - 1.
+
+    Retorna um dicionário k -> matriz (k, n_features) com os centróides de
+    cada solução, usados como ponto de partida nos dados completos.
+    """
+    rng = np.random.default_rng(random_state)
+    # Com k = 1 a solução é a média.
+    centroids = sample.mean(axis=0, keepdims=True)
+    solutions = {1: centroids}
+    for k in range(2, max_clusters + 1):
+        init = np.vstack([centroids, seed_centroid(sample, centroids, rng)])
+        centroids = KMeans(n_clusters=k, init=init, n_init=1,
+                           random_state=random_state).fit(sample).cluster_centers_
+        solutions[k] = centroids
+    return solutions
+
+
+def _init_worker(data, sample):
+    """
+    Guarda os dados no processo trabalhador, recebidos uma única vez.
+    """
+    _worker["data"] = data
+    _worker["sample"] = sample
+
+
+def sample_rows(data, sample_size=SAMPLE_SIZE, random_state=RANDOM_STATE):
+    """
+    Amostra sem reposição de até `sample_size` linhas, na ordem original.
+    """
+    if len(data) <= sample_size:
+        return data
+    rng = np.random.default_rng(random_state)
+    return data[np.sort(rng.choice(len(data), sample_size, replace=False))]
+
+
+def cluster_scores(k, model, sample):
+    """
+    Inércia, iterações, silhouette e Davies-Bouldin (na amostra) de um modelo ajustado.
+    """
+    result = {"k": k, "inertia": float(model.inertia_), "n_iter": int(model.n_iter_),
+              "silhouette": None, "davies_bouldin": None}
+    labels = model.predict(sample)
+    # As duas métricas só existem com pelo menos dois clusters na amostra.
+    if 1 < len(np.unique(labels)) < len(sample):
+        result["silhouette"] = float(silhouette_score(sample, labels))
+        result["davies_bouldin"] = float(davies_bouldin_score(sample, labels))
+    return result
+
+
+def _fit_k(k, init, random_state):
+    """
+    Ajusta o K-Means de um k nos dados completos e calcula as métricas na amostra.
+    """
+    model = KMeans(n_clusters=k, init=init, n_init=1,
+                   random_state=random_state).fit(_worker["data"])
+    return cluster_scores(k, model, _worker["sample"])
+
+
+def sweep_clusters(data, max_clusters=MAX_CLUSTERS, max_workers=None,
+                   sample_size=SAMPLE_SIZE, random_state=RANDOM_STATE):
+    """
+    Ajusta o K-Means para k = 1..max_clusters e retorna as métricas de cada k.
+
+    Retorna uma lista de dicionários (um por k, em ordem) com k, inertia,
+    n_iter, silhouette e davies_bouldin; as duas últimas são None para k = 1.
+    Com `max_workers` igual a 1 os ajustes rodam no próprio processo.
+    """
+    data = np.ascontiguousarray(data, dtype=np.float64)
+    sample = sample_rows(data, sample_size, random_state)
+    inits = warm_start_centroids(sample, max_clusters, random_state)
+    ks = list(range(1, max_clusters + 1))
+    max_workers = min(max_workers or os.cpu_count() or 1, len(ks))
+    if max_workers == 1:
+        _init_worker(data, sample)
+        try:
+            return [_fit_k(k, inits[k], random_state) for k in ks]
+        finally:
+            _worker.clear()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(data, sample)) as executor:
+        # Os k maiores são os mais lentos; começam primeiro.
+        futures = {k: executor.submit(_fit_k, k, inits[k], random_state)
+                   for k in reversed(ks)}
+        return [futures[k].result() for k in ks]
+
+
+def sweep_clusters_naive(data, max_clusters=MAX_CLUSTERS, sample_size=SAMPLE_SIZE,
+                         random_state=RANDOM_STATE):
+    """
+    Varredura ingênua: um ajuste completo e independente por k, em sequência,
+    com as mesmas métricas na mesma amostra.
+
+    Mantida como referência para os testes e benchmarks de `sweep_clusters`.
+    """
+    data = np.ascontiguousarray(data, dtype=np.float64)
+    sample = sample_rows(data, sample_size, random_state)
+    return [cluster_scores(k, KMeans(n_clusters=k, random_state=random_state).fit(data), sample)
+            for k in range(1, max_clusters + 1)]
@@ -0,0 +1,120 @@
+"""
+customer_features.py - Codificação dos clientes com um esquema fixo de colunas.
+
+Diferente de `pd.get_dummies` aplicado a um lote qualquer, as colunas geradas
+não dependem das categorias presentes nos dados: lotes de um CSV lido aos
+poucos e clientes novos a classificar produzem sempre as mesmas colunas, na
+mesma ordem.
+
+A codificação é vetorizada sobre códigos inteiros das categorias (as colunas
+lidas como `category` já trazem os códigos prontos) e cada coluna é gerada
+uma única vez, sem copiar o DataFrame inteiro.
+"""
+
+import numpy as np
+import pandas as pd
+
+EDUCATION_LEVELS = {'Uneducated': 0, 'High School': 1, 'College': 2,
+                    'Graduate': 3, 'Post-Graduate': 4, 'Doctorate': 5}
+# Em ordem alfabética, como no get_dummies; a primeira é a categoria de referência.
+MARITAL_STATUSES = ['Divorced', 'Married', 'Single', 'Unknown']
+NUMERIC_COLUMNS = ['age', 'dependent_count', 'estimated_income', 'months_on_book',
+                   'total_relationship_count', 'months_inactive_12_mon', 'credit_limit',
+                   'total_trans_amount', 'total_trans_count', 'avg_utilization_ratio']
+MARITAL_COLUMNS = [f'marital_status_{status}' for status in MARITAL_STATUSES[1:]]
+FEATURE_COLUMNS = (['age', 'gender', 'dependent_count', 'education_level']
+                   + NUMERIC_COLUMNS[2:] + MARITAL_COLUMNS)
+
+
+def category_codes(values, categories):
+    """
+    Códigos de `values` na lista fixa `categories` (-1 para valores fora dela).
+
+    Os valores são fatorados uma vez (colunas `category` já trazem os
+    códigos) e só as poucas categorias distintas são recodificadas; os
+    códigos das linhas são traduzidos com uma indexação do NumPy.
+    """
+    dtype = getattr(values, 'dtype', None)
+    if isinstance(dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), dtype.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    # O último elemento traduz o código -1 (valor ausente) para -1.
+    lookup = np.append(pd.Index(categories).get_indexer(uniques), -1).astype(np.int8)
+    return lookup[codes]
+
+
+def _checked_codes(data, column, categories):
+    """
+    Códigos de uma coluna categórica; categorias desconhecidas geram ValueError.
+    """
+    codes = category_codes(data[column], categories)
+    if (codes < 0).any():
+        unknown = pd.unique(np.asarray(data[column])[codes < 0])
+        raise ValueError(f"Categorias desconhecidas: {sorted(map(str, unknown))}")
+    return codes
+
+
+def encoded_columns(data):
+    """
+    Gera (nome, valores) de cada coluna de `FEATURE_COLUMNS`, em ordem.
+
+    O gênero vira 1 para 'M' e 0 caso contrário, a escolaridade vira um nível
+    ordinal e o estado civil vira colunas indicadoras (exceto 'Divorced'), todos
+    em uint8. Categorias desconhecidas de escolaridade ou estado civil geram
+    ValueError.
+    """
+    education = _checked_codes(data, 'education_level', list(EDUCATION_LEVELS))
+    marital = _checked_codes(data, 'marital_status', MARITAL_STATUSES)
+    encoded = {
+        'gender': np.where(category_codes(data['gender'], ['M']) == 0, np.uint8(1), np.uint8(0)),
+        'education_level': education.astype(np.uint8),
+    }
+    for code, column in enumerate(MARITAL_COLUMNS, start=1):
+        encoded[column] = (marital == code).view(np.uint8)
+    for column in FEATURE_COLUMNS:
+        yield column, encoded[column] if column in encoded else data[column].to_numpy()
+
+
+def encode_customers(data):
+    """
+    Codifica os clientes em um DataFrame com as colunas de `FEATURE_COLUMNS`.
+
+    As colunas numéricas ficam em float32 e as codificadas em uint8.
+    """
+    return pd.DataFrame({column: values if values.dtype == np.uint8
+                         else values.astype(np.float32, copy=False)
+                         for column, values in encoded_columns(data)},
+                        index=data.index, copy=False)
+
+
+def feature_matrix(data, dtype=np.float32):
+    """
+    Codifica os clientes direto em uma matriz (linhas, len(FEATURE_COLUMNS)).
+
+    É a entrada do StandardScaler e do K-Means: os lotes da segmentação em
+    lotes e os clientes classificados pelo modelo salvo passam por ela. A
+    matriz é alocada em ordem de colunas (Fortran), então cada coluna é
+    escrita em um bloco contíguo.
+    """
+    matrix = np.empty((len(data), len(FEATURE_COLUMNS)), dtype=dtype, order='F')
+    for position, (_, values) in enumerate(encoded_columns(data)):
+        matrix[:, position] = values
+    return matrix
+
+
+def encode_customers_pandas(data):
+    """
+    Codificação original: lambda por linha no gênero, `replace` em todas as
+    colunas para a escolaridade e `get_dummies` no estado civil (cujas colunas
+    dependem das categorias presentes no lote).
+
+    Mantida como referência para os testes e benchmarks de `encode_customers`.
+    """
+    data_copy = data.copy()
+    data_copy['gender'] = data['gender'].apply(lambda x: 1 if x == 'M' else 0)
+    data_copy.replace(to_replace=EDUCATION_LEVELS, inplace=True)
+    dummies = pd.get_dummies(data_copy[['marital_status']], drop_first=True)
+    data_copy = pd.concat([data_copy, dummies], axis=1)
+    data_copy.drop(['marital_status'], axis=1, inplace=True)
+    return data_copy
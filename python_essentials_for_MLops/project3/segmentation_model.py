@@ -0,0 +1,147 @@
+"""
+segmentation_model.py - Modelo de segmentação ajustado, salvo em disco.
+
+Junta a codificação (`customer_features`), a normalização e os centróides do
+K-Means em um único objeto, que classifica clientes novos sem reajustar nada.
+
+A normalização é incorporada aos centróides: com x' = (x - média) / escala,
+||x' - c||² = ||x ∘ w - c'||², com w = 1 / escala e c' = média ∘ w + c. O
+termo ||x ∘ w||² é o mesmo para todos os centróides, então o cluster mais
+próximo é o argmin de ||c'||² - 2 x · (w ∘ c'): uma única multiplicação de
+matrizes por lote, sem normalizar os dados.
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+
+from customer_features import FEATURE_COLUMNS, feature_matrix
+from instrumentation import stage
+
+# Incrementar quando o formato do artefato mudar.
+ARTIFACT_VERSION = 1
+ARTIFACT_META = "meta.json"
+ARTIFACT_ARRAYS = ["mean", "scale", "centroids"]
+N_CLUSTERS = 6
+RANDOM_STATE = 42
+# Linhas por bloco na classificação; limita a matriz temporária de distâncias.
+BLOCK_ROWS = 65536
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """
+    Calcula o hash SHA-256 do conteúdo de um arquivo.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as source:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SegmentationModel:
+    """
+    Codificação, normalização e centróides de uma segmentação ajustada.
+
+    `training_hash` é o SHA-256 do CSV de treino, quando conhecido; ele é
+    gravado no artefato para que um modelo de dados antigos não seja reusado.
+    """
+
+    def __init__(self, mean, scale, centroids, feature_columns=FEATURE_COLUMNS,
+                 training_hash=None):
+        self.training_hash = training_hash
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.feature_columns = list(feature_columns)
+        weights = 1.0 / self.scale
+        shifted = self.mean * weights + self.centroids
+        self._weights = np.ascontiguousarray((weights * shifted).T)
+        self._bias = (shifted ** 2).sum(axis=1)
+
+    @property
+    def n_clusters(self):
+        return len(self.centroids)
+
+    @classmethod
+    def from_estimators(cls, scaler, kmeans, feature_columns=FEATURE_COLUMNS):
+        """
+        Cria o modelo a partir de um StandardScaler e de um K-Means ajustados.
+        """
+        return cls(scaler.mean_, scaler.scale_, kmeans.cluster_centers_, feature_columns)
+
+    @classmethod
+    def fit(cls, data, n_clusters=N_CLUSTERS, random_state=RANDOM_STATE):
+        """
+        Codifica e normaliza os clientes e ajusta o K-Means.
+        """
+        with stage("segmentation.fit", items=len(data)):
+            features = feature_matrix(data, np.float64)
+            scaler = StandardScaler().fit(features)
+            kmeans = KMeans(n_clusters=n_clusters, random_state=random_state)
+            kmeans.fit(scaler.transform(features))
+            return cls.from_estimators(scaler, kmeans)
+
+    def predict_features(self, features):
+        """
+        Retorna o cluster mais próximo de cada linha dos atributos codificados.
+        """
+        features = np.asarray(features, dtype=np.float64)
+        labels = np.empty(len(features), dtype=np.intp)
+        for start in range(0, len(features), BLOCK_ROWS):
+            block = features[start:start + BLOCK_ROWS]
+            distances = block @ self._weights
+            distances *= -2.0
+            distances += self._bias
+            labels[start:start + BLOCK_ROWS] = distances.argmin(axis=1)
+        return labels
+
+    def predict(self, data):
+        """
+        Classifica um lote de clientes no formato de `customer_segmentation.csv`.
+        """
+        return self.predict_features(feature_matrix(data, np.float64))
+
+    def save(self, artifact_dir):
+        """
+        Grava o modelo em disco como arquivos .npy e um meta.json.
+        """
+        os.makedirs(artifact_dir, exist_ok=True)
+        meta_path = os.path.join(artifact_dir, ARTIFACT_META)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        arrays = {"mean": self.mean, "scale": self.scale, "centroids": self.centroids}
+        for name, values in arrays.items():
+            np.save(os.path.join(artifact_dir, f"{name}.npy"), values)
+        # O meta é gravado por último: um artefato sem ele é considerado incompleto.
+        with open(meta_path, "w", encoding="utf-8") as meta_file:
+            json.dump({"version": ARTIFACT_VERSION, "n_clusters": self.n_clusters,
+                       "feature_columns": self.feature_columns,
+                       "training_hash": self.training_hash}, meta_file)
+
+    @classmethod
+    def load(cls, artifact_dir, training_hash=None):
+        """
+        Carrega um modelo salvo com `save`.
+
+        Retorna None quando o artefato não existe, está incompleto ou foi
+        gravado com outra versão ou com outras colunas. Com `training_hash`,
+        também retorna None se o modelo foi ajustado com outro CSV de treino.
+        """
+        meta_path = os.path.join(artifact_dir, ARTIFACT_META)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("version") != ARTIFACT_VERSION or meta.get("feature_columns") != FEATURE_COLUMNS:
+            return None
+        if training_hash is not None and meta.get("training_hash") != training_hash:
+            return None
+        arrays = {name: np.load(os.path.join(artifact_dir, f"{name}.npy"))
+                  for name in ARTIFACT_ARRAYS}
+        return cls(arrays["mean"], arrays["scale"], arrays["centroids"], meta["feature_columns"],
+                   meta.get("training_hash"))
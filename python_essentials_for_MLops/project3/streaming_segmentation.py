@@ -0,0 +1,172 @@
+"""
+streaming_segmentation.py - Segmentação de clientes fora da memória (MiniBatch).
+
+O CSV é lido em lotes de `chunksize` linhas e nunca inteiro, então a memória
+usada não cresce com o número de clientes:
+
+1. Uma passada ajusta o StandardScaler com `partial_fit`.
+2. `epochs` passadas treinam um MiniBatchKMeans com `partial_fit`, em
+   mini-lotes de `batch_size` linhas de cada lote.
+3. Uma última passada classifica os clientes com o `SegmentationModel`
+   resultante e grava `customer_id` e `CLUSTER` no CSV de saída, lote a lote.
+
+Uso:
+    python streaming_segmentation.py customer_segmentation.csv --output clusters.csv --artifact modelo
+"""
+
+import json
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+
+from customer_features import feature_matrix
+from instrumentation import instrument
+from segmentation_model import SegmentationModel, file_sha256
+
+CHUNK_SIZE = 100_000
+BATCH_SIZE = 4096
+N_CLUSTERS = 6
+EPOCHS = 2
+RANDOM_STATE = 42
+# As colunas de texto são lidas como categorias: menos memória e menos conversões.
+CSV_DTYPES = {'gender': 'category', 'education_level': 'category',
+              'marital_status': 'category'}
+
+
+def iter_customer_chunks(filename, chunksize=CHUNK_SIZE):
+    """
+    Gera lotes (customer_id, atributos codificados) do CSV de clientes.
+    """
+    for chunk in pd.read_csv(filename, chunksize=chunksize, dtype=CSV_DTYPES):
+        yield chunk['customer_id'].to_numpy(), feature_matrix(chunk, np.float64)
+
+
+def iter_mini_batches(blocks, batch_size):
+    """
+    Reagrupa blocos de linhas em mini-lotes de `batch_size` linhas.
+
+    Os mini-lotes atravessam as fronteiras dos blocos, então o tamanho dos
+    lotes do CSV não importa. As linhas que sobram no fim são juntadas ao
+    último mini-lote; só há um mini-lote menor que `batch_size` quando o
+    total de linhas é menor que ele.
+    """
+    previous, pending = None, None
+    for block in blocks:
+        first = 0
+        if pending is not None and len(pending):
+            # Só as linhas que sobraram e as que as completam são copiadas.
+            first = batch_size - len(pending)
+            if len(block) < first:
+                pending = np.concatenate([pending, block])
+                continue
+            if previous is not None:
+                yield previous
+            previous = np.concatenate([pending, block[:first]])
+        full = first + (len(block) - first) // batch_size * batch_size
+        for start in range(first, full, batch_size):
+            if previous is not None:
+                yield previous
+            previous = block[start:start + batch_size]
+        pending = block[full:]
+    if previous is None:
+        if pending is not None and len(pending):
+            yield pending
+    elif pending is not None and len(pending):
+        yield np.concatenate([previous, pending])
+    else:
+        yield previous
+
+
+@instrument("segmentation.fit_streaming", items=lambda result: result[1])
+def fit_streaming(filename, n_clusters=N_CLUSTERS, chunksize=CHUNK_SIZE,
+                  batch_size=BATCH_SIZE, epochs=EPOCHS, random_state=RANDOM_STATE):
+    """
+    Ajusta o StandardScaler e o MiniBatchKMeans lendo o CSV em lotes.
+
+    Retorna (SegmentationModel, número de clientes).
+    """
+    scaler = StandardScaler()
+    rows = 0
+    for _, features in iter_customer_chunks(filename, chunksize):
+        scaler.partial_fit(features)
+        rows += len(features)
+    if rows < n_clusters:
+        raise ValueError(f"{filename}: {rows} clientes para {n_clusters} clusters")
+    model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size,
+                            random_state=random_state)
+    # O primeiro mini-lote inicializa os centróides com o k-means++ e
+    # precisa de pelo menos `n_clusters` linhas; os mini-lotes atravessam os
+    # lotes do CSV, então isso vale mesmo com um `chunksize` pequeno.
+    batch_rows = max(batch_size, n_clusters)
+    for _ in range(epochs):
+        scaled = (scaler.transform(features)
+                  for _, features in iter_customer_chunks(filename, chunksize))
+        for batch in iter_mini_batches(scaled, batch_rows):
+            model.partial_fit(batch)
+    return SegmentationModel.from_estimators(scaler, model), rows
+
+
+@instrument("segmentation.assign_clusters_streaming", items=sum)
+def assign_clusters_streaming(filename, output, model, chunksize=CHUNK_SIZE):
+    """
+    Classifica os clientes do CSV em lotes e grava `customer_id` e `CLUSTER`.
+
+    Retorna o número de clientes em cada cluster.
+    """
+    counts = np.zeros(model.n_clusters, dtype=np.int64)
+    header = True
+    for customer_ids, features in iter_customer_chunks(filename, chunksize):
+        labels = model.predict_features(features)
+        counts += np.bincount(labels, minlength=model.n_clusters)
+        pd.DataFrame({'customer_id': customer_ids, 'CLUSTER': labels}).to_csv(
+            output, mode='w' if header else 'a', header=header, index=False)
+        header = False
+    return counts.tolist()
+
+
+def segment_customers_streaming(filename, output, n_clusters=N_CLUSTERS,
+                                chunksize=CHUNK_SIZE, batch_size=BATCH_SIZE,
+                                epochs=EPOCHS, random_state=RANDOM_STATE):
+    """
+    Segmenta os clientes de um CSV sem carregá-lo inteiro na memória.
+
+    Retorna (modelo, resumo); o resumo traz o número de clientes e o tamanho
+    de cada cluster.
+    """
+    try:
+        model, rows = fit_streaming(filename, n_clusters, chunksize, batch_size,
+                                    epochs, random_state)
+        counts = assign_clusters_streaming(filename, output, model, chunksize)
+        return model, {'rows': rows, 'cluster_sizes': counts}
+    except Exception as e:
+        logging.error(f"Erro na segmentação em lotes: {str(e)}")
+        raise
+
+
+def main():
+    """
+    Função principal da segmentação em lotes.
+    """
+    parser = argparse.ArgumentParser(description="Segmenta clientes lendo o CSV em lotes.")
+    parser.add_argument("filename", help="CSV no formato de customer_segmentation.csv")
+    parser.add_argument("--output", default="customer_clusters.csv")
+    parser.add_argument("--artifact", help="pasta onde salvar o modelo ajustado")
+    parser.add_argument("--clusters", type=int, default=N_CLUSTERS)
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    args = parser.parse_args()
+    model, summary = segment_customers_streaming(args.filename, args.output, args.clusters,
+                                                 args.chunksize, args.batch_size, args.epochs)
+    if args.artifact:
+        model.training_hash = file_sha256(args.filename)
+        model.save(args.artifact)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()